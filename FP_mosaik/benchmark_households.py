@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Benchmark of the household topology of scenario_hi2.py
+    (demand + PV + house + battery + controller + grid) for fleets of
+    households.
+
+    Every fleet size runs in a fresh process and one mosaik world, with one
+    simulator per model and one entity per household and model (or one
+    Household simulator with --fused). With --feeder the households are the
+    buses of one feeder line instead of having separate grid connections.
+    Reported per size:
+        wall_time_s, setup_time_s: time of world.run and of building the world
+        household_steps_per_s: households * steps / wall_time_s
+        peak_rss_mb: peak resident memory of the process
+        sim_share: fraction of wall_time_s spent in step/get_data of each
+            simulator, 'mosaik' is the remainder (scheduling and data exchange)
+    The results are written as JSON lines. With --baseline, sizes whose wall
+    time increased by more than --tolerance compared to an earlier result file
+    are reported and the script exits with status 1.
+
+    Usage: python benchmark_households.py [--sizes 1 10 100] [--end 86399]
+                [--fused | --feeder] [--out benchmark.jsonl] [--baseline old.jsonl]
+"""
+
+import sys
+import os
+import json
+import time as timer
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from queue import Empty
+
+SIZES = [1, 10, 100, 1000, 10000]
+END = 24*60*60-1 # one day, 1 MosaikTime = 1 second
+STEP_SIZE = 5
+
+SIM_CONFIG = {
+    'DemandModel': {
+        'python': 'dtu_mosaik.mosaik_demand:DemandModel',
+    },
+    'SimpleGridModel': {
+        'python': 'dtu_mosaik.mosaik_grid:SimpleGridModel',
+    },
+    'PVModel': {
+        'python': 'dtu_mosaik.mosaik_pv:PVModel'
+    },
+    'HouseModel': {
+        'python': 'dtu_mosaik.mosaik_building:BuildingSim'
+    },
+    'HeatControl': {
+        'python': 'mosaik_pyknow_control_house:Control'
+    },
+    'BatteryModel': {
+        'python': 'dtu_mosaik.mosaik_battery:BatteryModel'
+    },
+    'Household': {
+        'python': 'mosaik_household:Household'
+    },
+    'FeederModel': {
+        'python': 'dtu_mosaik.mosaik_feeder:FeederModel'
+    },
+}
+
+
+def _sim_time():
+    # Time spent in step and get_data per simulator name of SIM_CONFIG,
+    # from the reports of dtu_mosaik.instrumentation. Simulators nested in
+    # others (e.g. the controller of a Household, sid Household-0.control)
+    # are included in the time of their parent.
+    from dtu_mosaik import instrumentation
+    sim_time = {}
+    for report in instrumentation.reports():
+        name, _, num = str(report['sid']).rpartition('-')
+        if name in SIM_CONFIG and num.isdigit():
+            sim_time[name] = sim_time.get(name, 0.0) + report['step_total_s'] + report['get_data_total_s']
+    return sim_time
+
+def build_world(world, num, fused=False, feeder=False):
+    """
+        Create num households in world, connected as in scenario_hi2.py.
+    """
+    if fused:
+        household_sim = world.start('Household', eid_prefix='household_', step_size=STEP_SIZE)
+        household_sim.Household.create(num)
+        return
+
+    demands = world.start('DemandModel', eid_prefix='demand_', step_size=STEP_SIZE).DemandModel.create(
+        num, rated_capacity=1, seriesname='/flexhouse_20180219')
+    if feeder:
+        grids = world.start('FeederModel', eid_prefix='bus_', step_size=STEP_SIZE).Bus.create(
+            num, V0=240, droop=0.01)
+    else:
+        grids = world.start('SimpleGridModel', eid_prefix='grid_', step_size=STEP_SIZE).SimpleGridModel.create(
+            num, V0=240, droop=0.1)
+    pvs = world.start('PVModel', eid_prefix='pv_', step_size=STEP_SIZE).PVModel.create(
+        num, rated_capacity=1.0, series_name='/PV715_20180730')
+    houses = world.start('HouseModel', eid_prefix='house_', step_size=STEP_SIZE).BuildingSim.create(
+        num, init_T_amb=16, init_T_int=20, heater_power=5,
+        heat_coeff=30, solar_heat_coeff=1.10, insulation_coeff=0.60)
+    batts = world.start('BatteryModel', eid_prefix='batt_', step_size=STEP_SIZE).BatteryModel.create(
+        num, rated_capacity=20, rated_discharge_capacity=5, rated_charge_capacity=5,
+        initial_charge_rel=0.5, charge_change_rate=0.90)
+    controls = world.start('HeatControl', eid_prefix='heatcontrol_', step_size=STEP_SIZE).Control.create(
+        num, setpoint_change_rate=0.9, T_min=18, T_max=22, P_max=5,
+        batt_storage_capacity=20, rated_discharge_capacity=5, rated_charge_capacity=5)
+
+    for demand, grid, pv, house, batt, control in zip(demands, grids, pvs, houses, batts, controls):
+        for unit in (demand, pv, batt, house):
+            world.connect(unit, grid, ('P', 'P'))
+        world.connect(pv, house, ('zs', 'zs'))
+        world.connect(pv, control, ('zs', 'zs'))
+        world.connect(grid, control, ('Pgrid', 'Pgrid'))
+        world.connect(house, control, ('T_int', 'T'))
+        world.connect(control, house, ('Pset_heat', 'Pset'), time_shifted=True,
+                      initial={'Pset_heat': 0.0})
+        world.connect(control, batt, ('Pset_batt', 'Pset'), time_shifted=True,
+                      initial={'Pset_batt': 0.0})
+        world.connect(batt, control, ('relSoC', 'SOC'))
+
+def run_size(num, end=END, fused=False, feeder=False):
+    """
+        Benchmark num households in the current process.
+        @return: dict of the results
+    """
+    import mosaik
+    from dtu_mosaik import instrumentation
+    # The simulators run in this process, time their step and get_data
+    instrumentation.enable(print_report=False)
+
+    t0 = timer.perf_counter()
+    world = mosaik.World(SIM_CONFIG, mosaik_config={'addr': ('127.0.0.1', 0)})
+    build_world(world, num, fused, feeder)
+    t1 = timer.perf_counter()
+    world.run(end)
+    t2 = timer.perf_counter()
+
+    wall_time = t2 - t1
+    steps = end // STEP_SIZE + 1
+    share = dict((name, t/wall_time) for name, t in _sim_time().items() if t > 0)
+    share['mosaik'] = max(0.0, 1 - sum(share.values()))
+    return {
+        'households': num,
+        'fused': fused,
+        'feeder': feeder,
+        'end': end,
+        'steps': steps,
+        'setup_time_s': t1 - t0,
+        'wall_time_s': wall_time,
+        'household_steps_per_s': num*steps/wall_time,
+        # ru_maxrss is in kB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0,
+        'sim_share': share,
+    }
+
+def _run_size(args, queue):
+    # Entry point of the benchmark process of one size
+    try:
+        result = run_size(*args)
+    except Exception as e:
+        result = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+    queue.put(result)
+
+def _get_result(proc, queue, poll=1.0):
+    # Result of the benchmark process proc, None if it ended without one
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            if not proc.is_alive():
+                # The result may have been put right before the process ended
+                try:
+                    return queue.get(timeout=poll)
+                except Empty:
+                    return None
+
+def _environment():
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                      cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {'git_rev': rev, 'python': platform.python_version(), 'machine': platform.node(),
+            'time': timer.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def benchmark(sizes=SIZES, end=END, fused=False, feeder=False):
+    """
+        Run the benchmark for each number of households in sizes, each in a
+        new process so that memory and module state do not carry over.
+        @return: list of result dicts, the result of a failed size only has
+            the parameters and the error
+    """
+    ctx = multiprocessing.get_context('spawn')
+    env = _environment()
+    results = []
+    for num in sizes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_size, args=((num, end, fused, feeder), queue))
+        proc.start()
+        result = _get_result(proc, queue)
+        proc.join()
+        if result is None:
+            result = {'error': 'benchmark process ended with exit code {0}'.format(proc.exitcode)}
+        if 'error' in result:
+            result.update(households=num, fused=fused, feeder=feeder, end=end)
+            print('{households:>6} households: failed, {error}'.format(**result))
+        else:
+            print('{households:>6} households: {wall_time_s:9.2f} s, {household_steps_per_s:10.0f} household-steps/s, '
+                  '{peak_rss_mb:8.1f} MB peak RSS'.format(**result))
+        result.update(env)
+        results.append(result)
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+        Return messages for the results whose wall time is more than
+        tolerance (relative) above the baseline result of the same size.
+    """
+    def key(r):
+        return r['households'], r['fused'], r.get('feeder', False), r['end']
+    base = dict((key(r), r) for r in baseline if 'error' not in r)
+    regressions = []
+    for r in results:
+        b = base.get(key(r))
+        if b is not None and 'error' not in r and r['wall_time_s'] > b['wall_time_s']*(1 + tolerance):
+            regressions.append('{0} households: {1:.2f} s, baseline {2:.2f} s (+{3:.0%})'.format(
+                r['households'], r['wall_time_s'], b['wall_time_s'], r['wall_time_s']/b['wall_time_s'] - 1))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark household fleets.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--end', type=int, default=END)
+    parser.add_argument('--fused', action='store_true', help='use the fused Household simulator')
+    parser.add_argument('--feeder', action='store_true', help='connect the households to one feeder')
+    parser.add_argument('--out', default='benchmark_households.jsonl')
+    parser.add_argument('--baseline', help='earlier result file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.fused and args.feeder:
+        parser.error('--feeder is not supported with --fused')
+    results = benchmark(args.sizes, args.end, args.fused, args.feeder)
+    with open(args.out, 'w') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+    print('Results written to {0}'.format(args.out))
+    failed = [r['households'] for r in results if 'error' in r]
+    if failed:
+        print('FAILED sizes: {0}'.format(failed))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+        regressions = compare(results, baseline, args.tolerance)
+        for msg in regressions:
+            print('REGRESSION ' + msg)
+    sys.exit(1 if regressions or failed else 0)
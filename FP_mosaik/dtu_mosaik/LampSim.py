@@ -12,6 +12,8 @@ import os
 import pandas as pd
 from itertools import count
 from dtu_mosaik.my_models import lamp
+from dtu_mosaik.instrumentation import Instrumented
+from dtu_mosaik.table_simulator import TableSimulator
 #from my_models import lamp
 META =  {
     'models': {
@@ -26,7 +28,18 @@ META =  {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class LampControl(mosaik_api.Simulator):
+class LampControl(Instrumented, TableSimulator):
+    GETTERS = {
+        'broken': 'esim.is_broken()',
+        'state': 'esim.get_state()',
+        'Pmax': 'esim.get_Pmax()',
+        'on': 'esim.is_on()',
+        'progressive': 'esim.is_progressive()',
+    }
+
+    def unknown_attr(self, eid, attr):
+        return ValueError('Unknown output attribute: %s' % attr)
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -84,26 +97,6 @@ class LampControl(mosaik_api.Simulator):
             
         return time + 1
     
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr not in self.meta['models']['LampControl']['attrs']:
-                    raise ValueError('Unknown output attribute: %s' % attr)
-                if attr == 'broken':
-                    mydata[attr] = esim.is_broken()
-                if attr == 'state':
-                    mydata[attr] = esim.state()
-                if attr == 'Pmax':
-                    mydata[attr] = esim.get_Pmax()
-                if attr == 'on':
-                    mydata[attr] = esim.is_on()
-                if attr == 'progressive':
-                    mydata[attr] = esim.is_progressive()
-            data[eid] = mydata
-        return data
 
 
 
@@ -119,4 +112,4 @@ if __name__ == '__main__':
     
     
     
-    
\ No newline at end of file
+    
\ No newline at end of file
@@ -3,6 +3,10 @@ __all__ = []
 from .collector import Collector
 from .mosaik_demand import DemandModel
 from .mosaik_grid import SimpleGridModel
+from .mosaik_feeder import FeederModel
 from .mosaik_pv import PVModel
 from .mosaik_battery import BatteryModel
 from .util import TSSim
+from .signal_cache import load_signal
+from .signal_index import load_index
+from .signal_pack import write_packed, load_packed
@@ -13,6 +13,9 @@ import os
 import pandas as pd
 from itertools import count
 from dtu_mosaik.my_models import clock
+from dtu_mosaik.instrumentation import Instrumented
+from dtu_mosaik.table_simulator import TableSimulator
+from dtu_mosaik.input_reduction import reduce_sum
 
 META =  {
     'models': {
@@ -29,7 +32,15 @@ META =  {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class ClockModel(mosaik_api.Simulator):
+class ClockModel(Instrumented, TableSimulator):
+    GETTERS = {
+        'val': 'esim.get_val()',
+        'delta': 'esim.get_delta()',
+    }
+
+    def unknown_attr(self, eid, attr):
+        return ValueError('Unknown output attribute: %s' % attr)
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -77,27 +88,13 @@ class ClockModel(mosaik_api.Simulator):
             data = inputs.get(eid, {})
             for attr, incoming in data.items():
                 if attr == 'delta':
-                    new_delta = sum(incoming.values())
+                    new_delta = reduce_sum(incoming)
                     self.entityparams[eid].delta = new_delta
             esim.step()
 
         return time + 60
     
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr not in self.meta['models']['ClockModel']['attrs']:
-                    raise ValueError('Unknown output attribute: %s' % attr)
-                if attr == 'val':
-                    mydata[attr] = esim.get_val()
-                if attr == 'delta':
-                    mydata[attr] = esim.get_delta()
-            data[eid] = mydata
-        return data
 
 
 
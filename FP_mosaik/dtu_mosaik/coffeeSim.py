@@ -8,6 +8,9 @@ import os
 import pandas as pd
 from itertools import count
 from dtu_mosaik.my_models import coffee_machine
+from dtu_mosaik.instrumentation import Instrumented
+from dtu_mosaik.table_simulator import TableSimulator
+from dtu_mosaik.input_reduction import reduce_sum
 
 META =  {
     'models': {
@@ -24,7 +27,19 @@ META =  {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class CoffeeMachine(mosaik_api.Simulator):
+class CoffeeMachine(Instrumented, TableSimulator):
+    GETTERS = {
+        'broken': 'esim.is_broken()',
+        'bean_level': 'esim.get_beans()',
+        'working_time': 'esim.get_time()',
+        'on': 'esim.is_on()',
+        'cpt': 'esim.get_count()',
+        'turn_on': 'esim.turn_on',
+    }
+
+    def unknown_attr(self, eid, attr):
+        return ValueError('Unknown output attribute: %s' % attr)
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -70,10 +85,12 @@ class CoffeeMachine(mosaik_api.Simulator):
     def step(self, time, inputs):
         for eid, esim in self.simulators.items():
             data = inputs.get(eid, {})
+            turn_on = 0
             for attr, incoming in data.items():
                 if attr == 'turn_on':
-                    turn_on = sum(incoming.values())
+                    turn_on = reduce_sum(incoming)
 #                    self.entityparams[eid].delta = new_delta
+            esim.turn_on = turn_on
             esim.step()
             if turn_on == True:
                 esim.machine_on()
@@ -89,26 +106,6 @@ class CoffeeMachine(mosaik_api.Simulator):
         return time + 60
     
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr not in self.meta['models']['CoffeeMachine']['attrs']:
-                    raise ValueError('Unknown output attribute: %s' % attr)
-                if attr == 'broken':
-                    mydata[attr] = esim.is_broken()
-                if attr == 'bean_level':
-                    mydata[attr] = esim.get_beans()
-                if attr == 'working_time':
-                    mydata[attr] = esim.get_time()
-                if attr == 'on':
-                    mydata[attr] = esim.is_on()
-                if attr == 'cpt':
-                    mydata[attr] = esim.get_count()
-            data[eid] = mydata
-        return data
 
 
 
@@ -1,10 +1,16 @@
 """
     A simple data collector that prints all data when the simulator ends.
+    In stream mode, data is instead written to the HDF5 store in chunks while
+    the simulation runs, so memory use is bounded and a crash keeps the data
+    of all chunks written so far.
+    In aggregation mode, only per-window aggregates of the inputs are stored.
 """
 
-import collections
+import numbers
 import mosaik_api
+import numpy as np
 import pandas as pd
+from .instrumentation import Instrumented
 
 META = {
         'models': {
@@ -23,22 +29,294 @@ def format_func(x):
     except TypeError:
         return str(x)
 
-class Collector(mosaik_api.Simulator):
+class ColumnLayout:
+    def __init__(self, growable=True):
+        """
+            Maps (unit, attribute) pairs to columns, in the order they are first seen.
+            A layout which is not growable is fixed by the first row.
+        """
+        self.growable = growable
+        self.columns = []
+        self.colindex = {} # attribute -> unit -> column
+        self.emptyrow = []
+
+    def add_column(self, src, attr):
+        j = len(self.columns)
+        self.columns.append((src, attr))
+        self.colindex.setdefault(attr, {})[src] = j
+        self.emptyrow.append(np.nan)
+        return j
+
+    def row(self, data):
+        """
+            Return the values of data ({attribute: {unit: value}}) as a list
+            in column order, NaN for columns without a value.
+            Ints, bools and numpy scalars are converted to float, None to NaN.
+        """
+        fixed = len(self.columns) > 0 and not self.growable
+        row = self.emptyrow.copy()
+        for attr, values in data.items():
+            cols = self.colindex.setdefault(attr, {})
+            for src, value in values.items():
+                j = cols.get(src)
+                if j is None:
+                    if fixed:
+                        raise RuntimeError("Collector got input {0} from {1} which is not in its column layout.".format(attr, src))
+                    j = self.add_column(src, attr)
+                    row.append(np.nan)
+                if type(value) is not float:
+                    value = self.convert(j, value)
+                row[j] = value
+        return row
+
+    def convert(self, j, value):
+        # Value for column j of a value which is not a float
+        if isinstance(value, (numbers.Real, np.bool_)):
+            return float(value)
+        if value is None:
+            return np.nan
+        return value
+
+class ColumnBuffer(ColumnLayout):
+    def __init__(self, nrows, growable=False, string_itemsize=None):
+        """
+            Preallocated block of float rows with one column per
+            (unit, attribute) pair, plus the time of each row.
+            Columns which receive other values than numbers (e.g. strings)
+            are kept in object arrays instead, so the values are stored unchanged.
+            A growable buffer doubles its rows when full and accepts new
+            columns at any time, otherwise the layout is fixed by the first row:
+            the columns which got non-numeric values in the first row hold
+            strings of at most string_itemsize characters, all other columns
+            hold floats. This keeps the dtypes of the chunks of an HDF5 table equal.
+        """
+        super().__init__(growable)
+        self.times = np.zeros(nrows, dtype=np.int64)
+        self.block = np.full((nrows, 8), np.nan) # Spare columns are beyond len(self.columns)
+        self.objects = {} # column -> object array of a column with non-numeric values
+        self.string_itemsize = string_itemsize
+        self.frozen = False
+        self.n = 0
+
+    def is_full(self):
+        return self.n == len(self.times)
+
+    def add_column(self, src, attr):
+        j = super().add_column(src, attr)
+        if j == self.block.shape[1]:
+            self._grow(self.block.shape[0], 2 * j)
+        return j
+
+    def _grow(self, nrows, ncols):
+        block = np.full((nrows, ncols), np.nan)
+        block[:self.n, :self.block.shape[1]] = self.block[:self.n]
+        times = np.zeros(nrows, dtype=np.int64)
+        times[:self.n] = self.times[:self.n]
+        self.block, self.times = block, times
+        for j, values in self.objects.items():
+            self.objects[j] = np.concatenate((values, np.full(nrows - len(values), np.nan, dtype=object)))
+
+    def _object_column(self, j):
+        # Move column j from the block to an object array
+        values = self.block[:, j].astype(object)
+        self.block[:, j] = np.nan
+        self.objects[j] = values
+        return values
+
+    def convert(self, j, value):
+        value = super().convert(j, value)
+        if j not in self.objects and not isinstance(value, float):
+            if self.frozen:
+                src, attr = self.columns[j]
+                raise ValueError("Collector got the non-numeric value {0!r} for {1} of {2}, "
+                                 "which is a float column of the fixed layout.".format(value, attr, src))
+            self._object_column(j)
+        return value
+
+    def add_row(self, time, data):
+        if self.is_full():
+            self._grow(2 * len(self.times), self.block.shape[1])
+        row = self.row(data)
+        for j, values in self.objects.items():
+            value = row[j]
+            if not self.growable and value == value:
+                value = str(value)
+                if self.string_itemsize is not None and len(value) > self.string_itemsize:
+                    src, attr = self.columns[j]
+                    raise ValueError("Collector got a string of {0} characters for {1} of {2}, "
+                                     "longer than string_itemsize {3}.".format(len(value), attr, src, self.string_itemsize))
+            values[self.n] = value
+            row[j] = np.nan
+        self.block[self.n, :len(row)] = row
+        self.times[self.n] = time
+        self.n += 1
+        self.frozen = not self.growable
+
+    def column(self, src, attr):
+        j = self.colindex[attr][src]
+        if j in self.objects:
+            return self.objects[j][:self.n]
+        return self.block[:self.n, j]
+
+    def frame(self):
+        # The DataFrame is a view of the block, no data is copied unless
+        # there are object columns
+        frame = pd.DataFrame(
+                self.block[:self.n, :len(self.columns)],
+                index=self.times[:self.n],
+                columns=pd.MultiIndex.from_tuples(self.columns),
+                copy=False)
+        if self.objects:
+            frame = frame.copy()
+            for j, values in self.objects.items():
+                frame.isetitem(j, pd.Series(values[:self.n], index=frame.index, dtype=object))
+        return frame
+
+    def clear(self):
+        self.block[:self.n, :len(self.columns)] = np.nan
+        for values in self.objects.values():
+            values[:self.n] = np.nan
+        self.n = 0
+
+AGGREGATIONS = ('mean', 'min', 'max', 'last', 'energy')
+
+class WindowAggregator:
+    def __init__(self, window, aggregate):
+        """
+            Incremental aggregation of collector inputs over windows of
+            window time units (aligned to multiples of window).
+            @input:
+                window: Length of a window [s]
+                aggregate: Dict {attribute: [aggregations]}, where the key '*'
+                    applies to all other attributes, or a list of aggregations
+                    for all attributes. Aggregations are
+                    'mean', 'min', 'max', 'last' and
+                    'energy': integral of the value over the window in hours,
+                    holding each value until the next step (e.g. kW -> kWh).
+            Each finished window gives one row, at the start time of the window,
+            with attributes named <attribute>_<aggregation>.
+        """
+        if not isinstance(aggregate, dict):
+            aggregate = {'*': aggregate}
+        for aggs in aggregate.values():
+            for agg in aggs:
+                if agg not in AGGREGATIONS:
+                    raise ValueError("Unknown aggregation {0}, expected one of {1}.".format(agg, AGGREGATIONS))
+        self.window = window
+        self.aggregate = aggregate
+        self.layout = ColumnLayout()
+
+        self.t_start = None # Start of the current window
+        self.t_last = None # Time of the last input
+        self._reset(0)
+        self.last = np.zeros(0)
+
+    def _reset(self, ncols):
+        self.sum = np.zeros(ncols)
+        self.count = np.zeros(ncols)
+        self.min = np.full(ncols, np.nan)
+        self.max = np.full(ncols, np.nan)
+        self.energy = np.zeros(ncols)
+
+    def _add_columns(self, ncols):
+        k = ncols - len(self.sum)
+        pad = lambda arr, val: np.concatenate((arr, np.full(k, val)))
+        self.sum, self.count, self.energy = pad(self.sum, 0), pad(self.count, 0), pad(self.energy, 0)
+        self.min, self.max, self.last = pad(self.min, np.nan), pad(self.max, np.nan), pad(self.last, np.nan)
+
+    def _integrate(self, t):
+        # The last values are held from t_last to t
+        self.energy += np.where(np.isnan(self.last), 0, self.last) * ((t - self.t_last) / 3600)
+        self.t_last = t
+
+    def _output(self):
+        # Data dict of the current window, like the inputs of Collector.step
+        with np.errstate(invalid='ignore'):
+            stats = {
+                'mean': self.sum / self.count,
+                'min': self.min,
+                'max': self.max,
+                'last': self.last,
+                'energy': self.energy}
+        data = {}
+        for j, (src, attr) in enumerate(self.layout.columns):
+            for agg in self.aggregate.get(attr, self.aggregate.get('*', ())):
+                data.setdefault('{0}_{1}'.format(attr, agg), {})[src] = stats[agg][j]
+        return data
+
+    def step(self, time, data):
+        """
+            Add the inputs of one collector step.
+            @return: list of (time, data) of the windows finished before time
+        """
+        try:
+            row = np.array(self.layout.row(data), dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("Collector can only aggregate numeric inputs, got {0}.".format(data))
+        if len(row) > len(self.sum):
+            self._add_columns(len(row))
+        finished = []
+        if self.t_start is None:
+            self.t_start = time - time % self.window
+            self.t_last = time
+        while time >= self.t_start + self.window:
+            self._integrate(self.t_start + self.window)
+            finished.append((self.t_start, self._output()))
+            self._reset(len(row))
+            self.t_start += self.window
+        self._integrate(time)
+
+        valid = ~np.isnan(row)
+        self.sum[valid] += row[valid]
+        self.count += valid
+        self.min = np.fmin(self.min, row)
+        self.max = np.fmax(self.max, row)
+        self.last = np.where(valid, row, self.last)
+        return finished
+
+    def flush(self, end):
+        """
+            Integrate the last values up to end, the end of the last
+            collector step.
+            @return: list of (time, data) of the windows up to end,
+                including the last, unfinished one
+        """
+        if self.t_start is None:
+            return []
+        finished = []
+        while end > self.t_start + self.window:
+            self._integrate(self.t_start + self.window)
+            finished.append((self.t_start, self._output()))
+            self._reset(len(self.sum))
+            self.t_start += self.window
+        self._integrate(end)
+        finished.append((self.t_start, self._output()))
+        return finished
+
+class Collector(Instrumented, mosaik_api.Simulator):
     def __init__(self):
         super().__init__(META)
         self.eid = None
-        self.data = collections.defaultdict(
-                lambda: collections.defaultdict(list))
-        self.time_list=[]
+        self.buffer = None
 
         self.step_size = None
 
-    def init(self, sid, step_size, print_results=True, save_h5=True, h5_storename='collectorstore', h5_framename=None):
+    def init(self, sid, step_size, print_results=True, save_h5=True, h5_storename='collectorstore', h5_framename=None,
+             stream=False, chunk_size=1440, string_itemsize=64, aggregate=None, window=900):
         self.step_size = step_size
         self.print_results = print_results
         self.save_h5 = save_h5
         self.h5_storename = h5_storename
         self.h5_framename = h5_framename
+        # Stream mode: append every chunk_size steps to an HDF5 table,
+        # otherwise chunk_size is the initial number of rows of the buffer.
+        # string_itemsize is the longest string a column of the table can hold.
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ColumnBuffer(chunk_size, growable=not stream, string_itemsize=string_itemsize)
+        # Aggregation mode: only store aggregates of each window (see WindowAggregator)
+        self.aggregator = None if aggregate is None else WindowAggregator(window, aggregate)
+        self.stream_started = False
         return self.meta
 
     def create(self, num, model):
@@ -50,24 +328,48 @@ class Collector(mosaik_api.Simulator):
         return [{'eid': self.eid, 'type': model}]
 
     def step(self, time, inputs):
-        data = inputs[self.eid]
-        for attr, values in data.items():
-            for src, value in values.items():
-                self.data[src][attr].append(value)
-        self.time_list.append(time)
+        if self.aggregator is None:
+            self._add_row(time, inputs[self.eid])
+        else:
+            for wtime, wdata in self.aggregator.step(time, inputs[self.eid]):
+                self._add_row(wtime, wdata)
 
         return time + self.step_size
 
+    def _add_row(self, time, data):
+        self.buffer.add_row(time, data)
+        if self.stream and self.buffer.is_full():
+            self._flush()
+
+    def _flush(self):
+        # Open and close the store per chunk so the file is complete after each flush
+        with pd.HDFStore(self.h5_storename) as store:
+            if not self.stream_started and self.h5_framename in store:
+                store.remove(self.h5_framename)
+            if self.buffer.n > 0:
+                min_itemsize = {'values': self.buffer.string_itemsize} if self.buffer.objects else None
+                store.append(self.h5_framename, self.buffer.frame(), format='table', min_itemsize=min_itemsize)
+        self.stream_started = True
+        self.buffer.clear()
+
     def finalize(self):
+        if self.aggregator is not None and self.aggregator.t_last is not None:
+            # The last inputs are held until the end of the last step
+            for wtime, wdata in self.aggregator.flush(self.aggregator.t_last + self.step_size):
+                self._add_row(wtime, wdata)
+        if self.stream:
+            self._flush()
+            print('Streamed to store: {0}, dataframe: {1}'.format(self.h5_storename, self.h5_framename))
+            return
         if self.print_results:
             print('Collected data:')
-            for sim, sim_data in sorted(self.data.items()):
+            for sim in sorted(set(src for src, _ in self.buffer.columns)):
                 print('- {0}'.format(sim))
-                for attr, values in sorted(sim_data.items()):
-                    print('  - {0}: {1}'.format(attr, list(map(format_func, values))))
+                for attr in sorted(attr for src, attr in self.buffer.columns if src == sim):
+                    print('  - {0}: {1}'.format(attr, list(map(format_func, self.buffer.column(sim, attr)))))
         if self.save_h5:
             store = pd.HDFStore(self.h5_storename)
-            panel = pd.DataFrame({(unit,attribute): pd.Series(data, index=self.time_list) for unit, datadict in self.data.items() for attribute, data in datadict.items()})
+            panel = self.buffer.frame()
             #print(panel)
             print('Saved to store: {0}, dataframe: {1}'.format(self.h5_storename, self.h5_framename))
             store[self.h5_framename] = panel
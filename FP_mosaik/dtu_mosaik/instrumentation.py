@@ -0,0 +1,217 @@
+"""
+    Opt-in instrumentation of mosaik simulators.
+
+    Simulators which derive from Instrumented (before mosaik_api.Simulator)
+    record, when instrumentation is enabled:
+        - latency histograms of step and get_data (power of 2 bins in us)
+        - the number of entities
+        - the input fan-in per step (number of values received)
+    and report them at finalize.
+
+    Instrumentation is enabled with enable() before the simulators are
+    started, or with the environment variable MOSAIK_INSTRUMENT=1 (also for
+    simulators in other processes). The report is printed, and if a store is
+    given (argument of enable() or MOSAIK_INSTRUMENT_STORE) it is also saved
+    to that HDF5 store under instrumentation/<simulator>, e.g. into the store
+    of the Collector. reports() returns the figures of all simulators
+    instrumented in this process, e.g. for a benchmark of an in-process
+    world. Simulators created while instrumentation is disabled are not
+    changed at all.
+"""
+
+import os
+import time as timer
+import weakref
+from itertools import count
+from math import frexp
+
+# Settings of enable(), None: use the environment variables
+_settings = None
+# Simulators instrumented in this process since the last enable(), weak so
+# that finished simulators are not kept alive; _order numbers them for reports()
+_instrumented = weakref.WeakSet()
+_order = count()
+
+NBINS = 32 # bin i counts latencies in [2**(i-1), 2**i) us, bin 0 below 1 us
+
+
+def enable(store=None, print_report=True):
+    """
+        Instrument all Instrumented simulators created from now on.
+        @input:
+            store: HDF5 file to save the reports to (optional)
+            print_report: print the report of each simulator at finalize
+    """
+    global _settings
+    _settings = {'store': store, 'print_report': print_report}
+    _instrumented.clear()
+
+def disable():
+    global _settings
+    _settings = {'store': None, 'disabled': True}
+
+def reports():
+    """
+        Return the reports (see Instrumented.instrumentation_report) of the
+        simulators instrumented in this process since the last enable()
+        and still alive, in the order they were created.
+    """
+    sims = sorted(_instrumented, key=lambda sim: sim.instrumentation['order'])
+    return [sim.instrumentation_report() for sim in sims]
+
+def _enabled():
+    if _settings is None:
+        return os.environ.get('MOSAIK_INSTRUMENT', '') not in ('', '0')
+    return not _settings.get('disabled', False)
+
+def _print_report():
+    return _settings is None or _settings.get('print_report', True)
+
+def _store():
+    if _settings is None or _settings['store'] is None:
+        return os.environ.get('MOSAIK_INSTRUMENT_STORE')
+    return _settings['store']
+
+
+class LatencyHistogram:
+    def __init__(self):
+        """
+            Histogram of call latencies with power of 2 bins in microseconds.
+        """
+        self.counts = [0]*NBINS
+        self.calls = 0
+        self.total = 0.0 # [s]
+        self.max = 0.0 # [s]
+
+    def add(self, seconds):
+        # frexp gives the exponent e with 2**(e-1) <= us < 2**e
+        e = frexp(seconds*1e6)[1] if seconds >= 1e-6 else 0
+        self.counts[min(max(e, 0), NBINS - 1)] += 1
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # Upper bound of the bin containing the q-th percentile [us]
+        if self.calls == 0:
+            return 0.0
+        rank = q/100.0*self.calls
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return float(2**i)
+        return float(2**(NBINS - 1))
+
+
+class Instrumented:
+    '''Mixin for mosaik_api.Simulator subclasses, see module docstring'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instrumentation = None
+        if _enabled():
+            self._instrument()
+
+    def _instrument(self):
+        _instrumented.add(self)
+        self.instrumentation = stats = {
+            'order': next(_order),
+            'sid': None,
+            'step': LatencyHistogram(),
+            'get_data': LatencyHistogram(),
+            'entities': 0,
+            'fanin_total': 0,
+            'fanin_max': 0,
+        }
+        # Wrap the bound methods of this instance, mosaik calls these
+        init, step, get_data, finalize = self.init, self.step, self.get_data, self.finalize
+        steptime, gettime = stats['step'], stats['get_data']
+
+        def timed_init(sid, *args, **kwargs):
+            stats['sid'] = sid
+            return init(sid, *args, **kwargs)
+
+        def timed_step(time, inputs, *args):
+            fanin = 0
+            for data in inputs.values():
+                for incoming in data.values():
+                    fanin += len(incoming)
+            stats['fanin_total'] += fanin
+            if fanin > stats['fanin_max']:
+                stats['fanin_max'] = fanin
+            t0 = timer.perf_counter()
+            result = step(time, inputs, *args)
+            steptime.add(timer.perf_counter() - t0)
+            return result
+
+        def timed_get_data(outputs):
+            t0 = timer.perf_counter()
+            result = get_data(outputs)
+            gettime.add(timer.perf_counter() - t0)
+            return result
+
+        def reporting_finalize():
+            result = finalize()
+            self.report()
+            return result
+
+        self.init = timed_init
+        self.step = timed_step
+        self.get_data = timed_get_data
+        self.finalize = reporting_finalize
+
+    def instrumentation_report(self):
+        """
+            Return the recorded figures as a dict (None if not instrumented).
+        """
+        stats = self.instrumentation
+        if stats is None:
+            return None
+        simulators = getattr(self, 'simulators', None)
+        report = {
+            'simulator': type(self).__name__,
+            'sid': stats['sid'],
+            'entities': len(simulators) if simulators is not None else None,
+            'steps': stats['step'].calls,
+            'fanin_mean': stats['fanin_total']/max(stats['step'].calls, 1),
+            'fanin_max': stats['fanin_max'],
+        }
+        for name in ('step', 'get_data'):
+            hist = stats[name]
+            report[name + '_calls'] = hist.calls
+            report[name + '_total_s'] = hist.total
+            report[name + '_mean_us'] = hist.total/max(hist.calls, 1)*1e6
+            report[name + '_p50_us'] = hist.percentile(50)
+            report[name + '_p99_us'] = hist.percentile(99)
+            report[name + '_max_us'] = hist.max*1e6
+            report[name + '_hist'] = list(hist.counts)
+        return report
+
+    def report(self):
+        """
+            Print the instrumentation report and save it to the store.
+        """
+        report = self.instrumentation_report()
+        if report is None:
+            return
+        if _print_report():
+            print('Instrumentation of {simulator} {sid}: {entities} entities, {steps} steps, '
+                  'fan-in mean {fanin_mean:.1f} max {fanin_max}'.format(**report))
+            for name in ('step', 'get_data'):
+                print('  {0}: {1} calls, {2:.3f} s total, mean {3:.1f} us, p50 <{4:.0f} us, p99 <{5:.0f} us, max {6:.1f} us'.format(
+                    name, report[name + '_calls'], report[name + '_total_s'], report[name + '_mean_us'],
+                    report[name + '_p50_us'], report[name + '_p99_us'], report[name + '_max_us']))
+
+        store = _store()
+        if store:
+            import pandas as pd
+            hist = pd.DataFrame(
+                {'step': report['step_hist'], 'get_data': report['get_data_hist']},
+                index=pd.Index([2**i for i in range(NBINS)], name='latency_below_us'))
+            summary = pd.Series(dict((k, v) for k, v in report.items() if not k.endswith('_hist')))
+            key = 'instrumentation/{0}'.format(str(report['sid'] or report['simulator']).replace('-', '_'))
+            with pd.HDFStore(store) as s:
+                s[key + '/histogram'] = hist
+                s[key + '/summary'] = summary.astype(str)
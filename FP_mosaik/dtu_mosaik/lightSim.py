@@ -4,10 +4,10 @@
 
 import mosaik_api
 import os
-import pandas as pd
-from numpy import roll
 from itertools import count
 from .util import TSSim
+from .signal_cache import load_signal
+from .instrumentation import Instrumented
 
 META = {
     'models': {
@@ -21,7 +21,7 @@ META = {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class luminosity(mosaik_api.Simulator):
+class luminosity(Instrumented, mosaik_api.Simulator):
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -38,23 +38,18 @@ class luminosity(mosaik_api.Simulator):
             self.storefilename = os.path.join(MY_DIR, 'signals.h5')
         else:
             self.storefilename = storefilename
-        self.store = pd.HDFStore(self.storefilename)
-        self.store.close()
         return self.meta
 
     def create(self, num, model, series_name='luminosity', rated_capacity=10, phase=0):
         counter = self.eid_counters.setdefault(model, count())
         entities = []
 
-        self.store.open()
-        series = self.store[series_name]
-        self.store.close()
-        if not phase == 0:
-            series.values = roll(series.values, phase)
+        # Entities share the cached series, phase is applied at lookup
+        series = load_signal(self.storefilename, series_name)
         for _ in range(num):
             eid = '%s_%s' % (self.eid_prefix, next(counter))
 
-            esim = TSSim(rated_capacity, series)
+            esim = TSSim(rated_capacity, series, phase=phase)
             self.simulators[eid] = esim
 
             entities.append({'eid': eid, 'type': model})
@@ -5,6 +5,10 @@
 import mosaik_api
 from itertools import count
 from .util import MyBattSim
+from .my_batt_fleet import MyBattFleet
+from .instrumentation import Instrumented
+from .table_simulator import TableSimulator
+from .input_reduction import reduce_min
 
 META = {
     'models': {
@@ -19,7 +23,21 @@ META = {
 }
 
 
-class BatteryModel(mosaik_api.Simulator):
+class BatteryModel(Instrumented, TableSimulator):
+    ENTITY_NAME = 'BattSim'
+    GETTERS = {
+        'P': 'esim.P',
+        'Pset': 'esim.Pset',
+        'SoC': 'esim.SoC',
+        'relSoC': 'esim.relSoC',
+    }
+    FLEET_GETTERS = {
+        'P': 'fleet.P',
+        'Pset': 'fleet.Pset',
+        'SoC': 'fleet.SoC',
+        'relSoC': 'fleet.relSoC',
+    }
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -28,9 +46,13 @@ class BatteryModel(mosaik_api.Simulator):
         self.simulators = {}
         self.entityparams = {}
 
-    def init(self, sid, step_size=5, eid_prefix="BattE"):
+    def init(self, sid, step_size=5, eid_prefix="BattE", fleet=False, solver='closed'):
         self.step_size = step_size
         self.eid_prefix = eid_prefix
+        self.solver = solver # See MyBattSim and MyBattFleet
+        # If fleet is set, all entities share one vectorized MyBattFleet
+        # and self.simulators maps eid -> index into the fleet arrays.
+        self.fleet = MyBattFleet(solver) if fleet else None
         return self.meta
 
     def create(
@@ -45,6 +67,22 @@ class BatteryModel(mosaik_api.Simulator):
         counter = self.eid_counters.setdefault(model, count())
         entities = []
 
+        if self.fleet is not None:
+            indices = self.fleet.add(
+                num,
+                rated_capacity=rated_capacity,
+                rated_discharge_capacity=rated_discharge_capacity,
+                rated_charge_capacity=rated_charge_capacity,
+                roundtrip_efficiency=roundtrip_efficiency,
+                initial_charge_rel=initial_charge_rel,
+                charge_change_rate=charge_change_rate,
+                dt=dt
+                )
+            for idx in indices:
+                eid = '%s_%s' % (self.eid_prefix, next(counter))
+                self.simulators[eid] = idx
+                entities.append({'eid': eid, 'type': model})
+            return entities
 
         for _ in range(num):
             eid = '%s_%s' % (self.eid_prefix, next(counter))
@@ -56,7 +94,8 @@ class BatteryModel(mosaik_api.Simulator):
                 roundtrip_efficiency=roundtrip_efficiency,
                 initial_charge_rel=initial_charge_rel,
                 charge_change_rate=charge_change_rate,
-                dt=dt
+                dt=dt,
+                solver=self.solver
                 )
             self.simulators[eid] = esim
 
@@ -69,34 +108,32 @@ class BatteryModel(mosaik_api.Simulator):
     ###
 
     def step(self, time, inputs):
+        if self.fleet is not None:
+            return self._step_fleet(time, inputs)
+
         for eid, esim in self.simulators.items():
             data = inputs.get(eid, {})
             for attr, incoming in data.items():
                 if attr == 'Pset':
-                    newPset = min(val for val in incoming.values())
+                    newPset = reduce_min(incoming)
                     esim.Pset = newPset
             esim.calc_val(time)
 
         return time + self.step_size
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr == 'P':
-                    mydata[attr] = esim.P
-                elif attr == 'Pset':
-                    mydata[attr] = esim.Pset
-                elif attr == 'SoC':
-                    mydata[attr] = esim.SoC
-                elif attr == 'relSoC':
-                    mydata[attr] = esim.relSoC
-                else:
-                    raise RuntimeError("BattSim {0} has no attribute {1}.".format(eid, attr))
-            data[eid] = mydata
-        return data
+    def _step_fleet(self, time, inputs):
+        indices = []
+        newPsets = []
+        for eid, data in inputs.items():
+            incoming = data.get('Pset')
+            if incoming is not None:
+                indices.append(self.simulators[eid])
+                newPsets.append(reduce_min(incoming))
+        if indices:
+            self.fleet.set_Pset(indices, newPsets)
+        self.fleet.calc_val(time)
+
+        return time + self.step_size
 
 if __name__ == '__main__':
     # mosaik_api.start_simulation(PVSim())
@@ -15,11 +15,13 @@
 
 import mosaik_api
 import os
-import pandas as pd
-from numpy import roll
-from statistics import mean
+import numpy as np
 from itertools import count
 from .util import MyBuildingSim #as HouseSim
+from .my_building_fleet import MyBuildingFleet
+from .instrumentation import Instrumented
+from .table_simulator import TableSimulator
+from .input_reduction import reduce_mean
 
 META = {
     'models': {
@@ -35,7 +37,25 @@ META = {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class BuildingSim(mosaik_api.Simulator):
+class BuildingSim(Instrumented, TableSimulator):
+    ENTITY_NAME = 'BuildingSim'
+    GETTERS = {
+        'P': '-esim.P',  # Note sign change to meet grid convention
+        'Pset': '-esim.P',  # Last setpoint, as received
+        'x': 'esim.x',
+        'T_int': 'esim.T_int',
+        'zs': 'esim.zs',
+        'T_amb': 'esim.T_amb',
+    }
+    FLEET_GETTERS = {
+        'P': '-fleet.P',  # Note sign change to meet grid convention
+        'Pset': '-fleet.P',  # Last setpoint, as received
+        'x': 'fleet.x',
+        'T_int': 'fleet.T_int',
+        'zs': 'fleet.zs',
+        'T_amb': 'fleet.T_amb',
+    }
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -44,16 +64,18 @@ class BuildingSim(mosaik_api.Simulator):
         self.simulators = {}
         self.entityparams = {}
 
-    def init(self, sid, step_size=5, eid_prefix="House", storefilename=None):
+    def init(self, sid, step_size=5, eid_prefix="House", storefilename=None, solver='geometric', fleet=False):
         self.step_size = step_size
         self.eid_prefix = eid_prefix
+        self.solver = solver # See MyBuildingSim.SOLVERS
+        # If fleet is set, all entities share one vectorized MyBuildingFleet
+        # and self.simulators maps eid -> index into the fleet arrays.
+        self.fleet = MyBuildingFleet(solver) if fleet else None
         if storefilename is None:
             # Load default signal store
             self.storefilename = os.path.join(MY_DIR, 'signals.h5')
         else:
             self.storefilename = storefilename
-        self.store = pd.HDFStore(self.storefilename)
-        self.store.close()
         return self.meta
 
     def create(
@@ -64,6 +86,24 @@ class BuildingSim(mosaik_api.Simulator):
         counter = self.eid_counters.setdefault(model, count())
         entities = []
 
+        if self.fleet is not None:
+            # The parameters may also be lists with a value per building
+            indices = self.fleet.add(
+                num,
+                heat_coeff=heat_coeff,
+                solar_heat_coeff=solar_heat_coeff,
+                insulation_coeff=insulation_coeff,
+                init_T_int=init_T_int,
+                init_T_amb=init_T_amb,
+                heater_power=heater_power,
+                dt=float(self.step_size)/3600
+                )
+            for idx in indices:
+                eid = '%s_%s' % (self.eid_prefix, next(counter))
+                self.simulators[eid] = idx
+                entities.append({'eid': eid, 'type': model})
+            return entities
+
         for _ in range(num):
             eid = '%s_%s' % (self.eid_prefix, next(counter))
 
@@ -74,7 +114,8 @@ class BuildingSim(mosaik_api.Simulator):
                     init_T_int=init_T_int,
                     init_T_amb=init_T_amb,
                     heater_power=heater_power,
-                    dt=float(self.step_size)/3600
+                    dt=float(self.step_size)/3600,
+                    solver=self.solver
             )
             self.simulators[eid] = esim
 
@@ -87,20 +128,23 @@ class BuildingSim(mosaik_api.Simulator):
     ###
 
     def step(self, time, inputs):
+        if self.fleet is not None:
+            return self._step_fleet(time, inputs)
+
         for eid, esim in self.simulators.items():
             data = inputs.get(eid, {})
             for attr, incoming in data.items():
                 if attr == 'x':
-                    newX = mean(val for val in incoming.values())
+                    newX = reduce_mean(incoming)
                     esim.x = newX
                 elif attr == 'Pset':
-                    newPset = mean(val for val in incoming.values())
+                    newPset = reduce_mean(incoming)
                     esim.P = -newPset  # assuming negative input values to meet grid convention
                 elif attr == 'T_amb':
-                    newT_amb = mean(val for val in incoming.values())
+                    newT_amb = reduce_mean(incoming)
                     esim.T_amb = newT_amb
                 elif attr == 'zs':
-                    newzs = mean(val for val in incoming.values())
+                    newzs = reduce_mean(incoming)
                     esim.zs = newzs
                 else:
                     raise RuntimeError("BuildingSim {0} has no input {1}.".format(eid, attr))
@@ -109,26 +153,33 @@ class BuildingSim(mosaik_api.Simulator):
 
         return time + self.step_size
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr == 'P':
-                    mydata[attr] = -esim.P  # Note sign change to meet grid convention
-                elif attr == 'x':
-                    mydata[attr] = esim.x
-                elif attr == 'T_int':
-                    mydata[attr] = esim.T_int
-                elif attr == 'zs':
-                    mydata[attr] = esim.zs
-                elif attr == 'T_amb':
-                    mydata[attr] = esim.T_amb
-                else:
-                    raise RuntimeError("BuildingSim {0} has no attribute {1}.".format(eid, attr))
-            data[eid] = mydata
-        return data
+    def _step_fleet(self, time, inputs):
+        fleet = self.fleet
+        # attr -> (indices, new values)
+        updates = dict((attr, ([], [])) for attr in ('x', 'Pset', 'T_amb', 'zs'))
+        for eid, data in inputs.items():
+            idx = self.simulators[eid]
+            for attr, incoming in data.items():
+                update = updates.get(attr)
+                if update is None:
+                    raise RuntimeError("BuildingSim {0} has no input {1}.".format(eid, attr))
+                update[0].append(idx)
+                update[1].append(reduce_mean(incoming))
+
+        # Same order as in step: x, then Pset overwrites it
+        indices, values = updates['x']
+        if indices:
+            fleet.set_x(indices, values)
+        indices, values = updates['Pset']
+        if indices:
+            fleet.set_P(indices, -np.array(values))  # assuming negative input values to meet grid convention
+        for attr in ('T_amb', 'zs'):
+            indices, values = updates[attr]
+            if indices:
+                getattr(fleet, attr)[indices] = values
+        fleet.calc_val(time)
+
+        return time + self.step_size
 
 if __name__ == '__main__':
     # mosaik_api.start_simulation(PVSim())
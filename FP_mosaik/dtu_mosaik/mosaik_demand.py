@@ -4,10 +4,11 @@
 
 import os
 import mosaik_api
-import pandas as pd
-from numpy import roll
 from itertools import count
-from .util import TSSim
+from .util import TSSim, adaptive_step
+from .signal_cache import load_signal
+from .signal_pack import is_packed, load_packed, close_packed, PackedTSSim
+from .instrumentation import Instrumented
 
 META = {
     'models': {
@@ -21,7 +22,7 @@ META = {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class DemandModel(mosaik_api.Simulator):
+class DemandModel(Instrumented, mosaik_api.Simulator):
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -30,32 +31,51 @@ class DemandModel(mosaik_api.Simulator):
         self.simulators = {}
         self.entityparams = {}
 
-    def init(self, sid, step_size=5, eid_prefix="DemandE", storefilename=None):
+    def init(self, sid, step_size=5, eid_prefix="DemandE", storefilename=None,
+             adaptive=False, tolerance=0.0, max_step=3600):
         self.step_size = step_size
         self.eid_prefix = eid_prefix
         if storefilename is None:
-            # Load default signal store
+            # Load default signal store, a packed signal file (.sigpack) may be given instead
             self.storefilename = os.path.join(MY_DIR, 'signals.h5')
         else:
             self.storefilename = storefilename
-        self.store = pd.HDFStore(self.storefilename)
-        self.store.close()
+        # If adaptive is set, step only when the output of an entity changes
+        # by more than tolerance [kW] (on the step_size grid, at least every
+        # max_step), instead of every step_size.
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.max_step = max_step
+        self.change_times = {}
+        # Number of series loaded from the packed signal file, closed in finalize
+        self.packed_loads = 0
         return self.meta
 
     def create(self, num, model, seriesname='demand', rated_capacity=10, phase=0):
         counter = self.eid_counters.setdefault(model, count())
         entities = []
 
-        self.store.open()
-        series = self.store[seriesname]
-        self.store.close()
-        if not phase == 0:
-            series.values = roll(series.values, phase)
+        # Entities share the cached series, phase is applied at lookup
+        if is_packed(self.storefilename):
+            # Long series in a packed signal file, decoded chunk by chunk
+            if self.adaptive:
+                raise ValueError("Adaptive stepping is not supported for packed signals.")
+            series = load_packed(self.storefilename, seriesname)
+            self.packed_loads += 1
+        else:
+            series = load_signal(self.storefilename, seriesname)
 
         for _ in range(num):
             eid = '{0}_{1}'.format(self.eid_prefix, next(counter))
 
-            esim = TSSim(rated_capacity, series)
+            if is_packed(self.storefilename):
+                esim = PackedTSSim(rated_capacity, series, phase=phase)
+            else:
+                esim = TSSim(rated_capacity, series, phase=phase,
+                             tolerance=self.tolerance if self.adaptive else None)
+            if self.adaptive:
+                # Entities of the same series share the array
+                self.change_times[id(esim.change_times)] = esim.change_times
             self.simulators[eid] = esim
 
             entities.append({'eid': eid, 'type': model})
@@ -71,8 +91,15 @@ class DemandModel(mosaik_api.Simulator):
             # data = inputs.get(eid, {})
             esim.calc_val(time)
 
+        if self.adaptive:
+            return adaptive_step(time, self.step_size, self.change_times.values(), self.max_step)
         return time + self.step_size
 
+    def finalize(self):
+        for _ in range(self.packed_loads):
+            close_packed(self.storefilename)
+        self.packed_loads = 0
+
     def get_data(self, outputs):
         data = {}
         for eid, esim in self.simulators.items():
@@ -0,0 +1,109 @@
+"""
+    Buses of radial feeders, e.g. a neighbourhood of houses on one feeder.
+
+    Each create() call makes one feeder of num buses (see MyFeeder for the
+    topology and the power flow). Units connect their P to a bus like to a
+    SimpleGridModel entity, all buses of all feeders are solved together
+    with sparse matrix operations at every step.
+"""
+
+import mosaik_api
+import numpy as np
+from itertools import count, chain
+from .my_feeder import MyFeeder
+from .instrumentation import Instrumented
+from .table_simulator import TableSimulator
+
+META = {
+    'models': {
+        'Bus': {
+            'public': True,
+            'params': [
+                'V0', 'droop', 'parents'],
+            'attrs': [
+                'P', # Input: injections of the connected units, output: their sum [kW]
+                'Pgrid', # Power drawn from the grid at the bus [kW]
+                'Pline', # Power exported over the line feeding the bus [kW]
+                'V', # Bus voltage [V]
+            ],
+        },
+    },
+}
+
+
+class FeederModel(Instrumented, TableSimulator):
+    ENTITY_NAME = 'Bus'
+    FLEET_GETTERS = {
+        'P': 'fleet.P',
+        'Pgrid': 'fleet.Pgrid',
+        'Pline': 'fleet.Pline',
+        'V': 'fleet.V',
+    }
+
+    def __init__(self, META=META):
+        super().__init__(META)
+
+        # Per-entity dicts
+        self.eid_counters = {}
+        self.simulators = {}
+        self.entityparams = {}
+
+    def init(self, sid, step_size=1, eid_prefix="BusE", verbose=False):
+        self.step_size = step_size
+        self.eid_prefix = eid_prefix
+        self.verbose = verbose
+        # All buses are in one MyFeeder, self.simulators maps eid -> bus index
+        self.fleet = MyFeeder()
+        # Last received injections per bus
+        self.incoming = {}
+        self.lengths = []
+        return self.meta
+
+    def create(
+            self, num, model,
+            V0=230, # Volts at the substation
+            droop=10.0, # volts per kW over each line
+            parents=None, # parent bus of each bus, see MyFeeder.add
+            ):
+        counter = self.eid_counters.setdefault(model, count())
+        entities = []
+
+        for idx in self.fleet.add(num, V0=V0, droop=droop, parents=parents):
+            eid = '%s_%s' % (self.eid_prefix, next(counter))
+            self.simulators[eid] = idx
+            entities.append({'eid': eid, 'type': model})
+        # The feeder was cleared of its connections, connect again on the next step
+        self.lengths = []
+
+        return entities
+
+    ###
+    #  Functions used online
+    ###
+
+    def step(self, time, inputs):
+        for eid, data in inputs.items():
+            for attr, incoming in data.items():
+                if attr == 'P':
+                    self.incoming[eid] = incoming
+                else:
+                    raise RuntimeError("Bus {0} has no input {1}.".format(eid, attr))
+
+        # The connections only change if entities are connected or created
+        lengths = [len(incoming) for incoming in self.incoming.values()]
+        if lengths != self.lengths:
+            self.fleet.set_sources(np.repeat(
+                np.array([self.simulators[eid] for eid in self.incoming], dtype=int), lengths))
+            self.lengths = lengths
+        self.fleet.set_P(np.fromiter(
+            chain.from_iterable(incoming.values() for incoming in self.incoming.values()),
+            float, sum(lengths)))
+        self.fleet.calc_val(time)
+        if self.verbose:
+            print('FEEDER: Grid stats at time {0}: Pgrid={1}, Vmin={2}, Vmax={3}.'.format(
+                time, self.fleet.Pgrid.sum(), self.fleet.V.min(), self.fleet.V.max()))
+
+        return time + self.step_size
+
+if __name__ == '__main__':
+    mosaik_api.start_simulation(FeederModel())
@@ -5,6 +5,8 @@
 import mosaik_api
 from itertools import count
 from .my_grid_sim import MyGridSim
+from .instrumentation import Instrumented
+from .table_simulator import TableSimulator
 
 META = {
     'models': {
@@ -18,7 +20,14 @@ META = {
 }
 
 
-class SimpleGridModel(mosaik_api.Simulator):
+class SimpleGridModel(Instrumented, TableSimulator):
+    ENTITY_NAME = 'GridSim'
+    GETTERS = {
+        'P': 'esim.P',
+        'Pgrid': 'esim.Pgrid',
+        'V': 'esim.V',
+    }
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -71,23 +80,6 @@ class SimpleGridModel(mosaik_api.Simulator):
 
         return time + self.step_size
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr == 'P':
-                    mydata[attr] = esim.P
-                elif attr == 'Pgrid':
-                    mydata[attr] = esim.Pgrid
-                elif attr == 'V':
-                    mydata[attr] = esim.V
-                else:
-                    raise RuntimeError("GridSim {0} has no attribute {1}.".format(eid, attr))
-            data[eid] = mydata
-        return data
-
 if __name__ == '__main__':
     # mosaik_api.start_simulation(PVSim())
 
@@ -4,10 +4,12 @@
 
 import mosaik_api
 import os
-import pandas as pd
-from numpy import roll
 from itertools import count
-from .util import TSSim
+from .util import TSSim, adaptive_step
+from .signal_cache import load_signal
+from .signal_pack import is_packed, load_packed, close_packed, PackedTSSim
+from .instrumentation import Instrumented
+from .table_simulator import TableSimulator
 
 META = {
     'models': {
@@ -21,7 +23,16 @@ META = {
 
 MY_DIR = os.path.abspath(os.path.dirname(__file__))
 
-class PVModel(mosaik_api.Simulator):
+class PVModel(Instrumented, TableSimulator):
+    ENTITY_NAME = 'PVSim'
+    GETTERS = {
+        'P': 'esim.get_val()',
+        'zs': 'esim.get_val_nomax()/esim.mult',
+        'Pmax': 'esim.get_Pmax()',
+        'Pav': 'esim.get_val_nomax()',
+        'Prated': 'esim.get_Prated()',
+    }
+
     def __init__(self, META=META):
         super().__init__(META)
 
@@ -30,31 +41,50 @@ class PVModel(mosaik_api.Simulator):
         self.simulators = {}
         self.entityparams = {}
 
-    def init(self, sid, step_size=5, eid_prefix="PVe", storefilename=None):
+    def init(self, sid, step_size=5, eid_prefix="PVe", storefilename=None,
+             adaptive=False, tolerance=0.0, max_step=3600):
         self.step_size = step_size
         self.eid_prefix = eid_prefix
         if storefilename is None:
-            # Load default signal store
+            # Load default signal store, a packed signal file (.sigpack) may be given instead
             self.storefilename = os.path.join(MY_DIR, 'signals.h5')
         else:
             self.storefilename = storefilename
-        self.store = pd.HDFStore(self.storefilename)
-        self.store.close()
+        # If adaptive is set, step only when the output of an entity changes
+        # by more than tolerance [kW] (on the step_size grid, at least every
+        # max_step), instead of every step_size.
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.max_step = max_step
+        self.change_times = {}
+        # Number of series loaded from the packed signal file, closed in finalize
+        self.packed_loads = 0
         return self.meta
 
     def create(self, num, model, series_name='pv', rated_capacity=10, phase=0):
         counter = self.eid_counters.setdefault(model, count())
         entities = []
 
-        self.store.open()
-        series = self.store[series_name]
-        self.store.close()
-        if not phase == 0:
-            series.values = roll(series.values, phase)
+        # Entities share the cached series, phase is applied at lookup
+        if is_packed(self.storefilename):
+            # Long series in a packed signal file, decoded chunk by chunk
+            if self.adaptive:
+                raise ValueError("Adaptive stepping is not supported for packed signals.")
+            series = load_packed(self.storefilename, series_name)
+            self.packed_loads += 1
+        else:
+            series = load_signal(self.storefilename, series_name)
         for _ in range(num):
             eid = '%s_%s' % (self.eid_prefix, next(counter))
 
-            esim = TSSim(rated_capacity, series)
+            if is_packed(self.storefilename):
+                esim = PackedTSSim(rated_capacity, series, phase=phase)
+            else:
+                esim = TSSim(rated_capacity, series, phase=phase,
+                             tolerance=self.tolerance if self.adaptive else None)
+            if self.adaptive:
+                # Entities of the same series share the array
+                self.change_times[id(esim.change_times)] = esim.change_times
             self.simulators[eid] = esim
 
             entities.append({'eid': eid, 'type': model})
@@ -74,28 +104,14 @@ class PVModel(mosaik_api.Simulator):
                     self.entityparams[eid].Pmax = newPmax
             esim.calc_val(time)
 
+        if self.adaptive:
+            return adaptive_step(time, self.step_size, self.change_times.values(), self.max_step)
         return time + self.step_size
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr == 'P':
-                    mydata[attr] = esim.get_val()
-                elif attr == 'zs':
-                    mydata[attr] = esim.get_val_nomax()/esim.mult
-                elif attr == 'Pmax':
-                    mydata[attr] = esim.get_Pmax()
-                elif attr == 'Pav':
-                    mydata[attr] = esim.get_val_nomax()
-                elif attr == 'Prated':
-                    mydata[attr] = esim.get_mult()
-                else:
-                    raise RuntimeError("PVSim {0} has no attribute {1}.".format(eid, attr))
-            data[eid] = mydata
-        return data
+    def finalize(self):
+        for _ in range(self.packed_loads):
+            close_packed(self.storefilename)
+        self.packed_loads = 0
 
 if __name__ == '__main__':
     # mosaik_api.start_simulation(PVSim())
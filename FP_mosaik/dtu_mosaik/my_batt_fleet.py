@@ -0,0 +1,179 @@
+import numpy as np
+
+
+def _pymax(a, b):
+    # Elementwise max(a, b) with the same tie/NaN behaviour as Python's builtin
+    return np.where(b > a, b, a)
+
+def _pymin(a, b):
+    # Elementwise min(a, b) with the same tie/NaN behaviour as Python's builtin
+    return np.where(b < a, b, a)
+
+
+class MyBattFleet:
+    def __init__(self, solver='closed'):
+        """
+            Fleet of batteries stored as struct-of-arrays.
+            Every battery follows the same model as MyBattSim with the given
+            solver, but the whole fleet is advanced with one set of array
+            operations instead of one Python call per battery.
+            With solver='loop' the results equal those of MyBattSim exactly.
+            With solver='closed' the batteries without an active limit during
+            a calc_val are advanced in closed form as in MyBattSim. The others
+            are stepped one time step at a time for the whole calc_val, while
+            MyBattSim only steps while the limit is active, so they can differ
+            from MyBattSim by rounding.
+            Entity i is addressed by the index returned from add().
+        """
+        if solver not in ('closed', 'loop'):
+            raise ValueError("Unknown solver {0}, expected 'closed' or 'loop'.".format(solver))
+        self.solver = solver
+        self.curtime = 0 # Time is assumed to step in integer steps
+        self.n = 0
+
+        # Parameters
+        self.rated_capacity = np.zeros(0)
+        self.rated_discharge_capacity = np.zeros(0)
+        self.rated_charge_capacity = np.zeros(0)
+        self.eta = np.zeros(0)
+        self.alpha = np.zeros(0)
+        self.dt = np.zeros(0)
+
+        # Internal variables
+        self._P = np.zeros(0)
+        self._Pset = np.zeros(0)
+        self._charge = np.zeros(0)
+
+        # Externally visible variables
+        self.Pext = np.zeros(0)
+        self.Psetext = np.zeros(0)
+        self.SoC = np.zeros(0)
+        self.relSoC = np.zeros(0)
+
+    def add(
+            self, num,
+            rated_capacity=10,
+            rated_discharge_capacity=20,
+            rated_charge_capacity=20,
+            roundtrip_efficiency=0.96,
+            initial_charge_rel=0.50,
+            charge_change_rate=0.90,
+            dt=1.0/(60*60)):
+        """
+            Append num identical batteries to the fleet.
+            Parameters are the same as for MyBattSim.
+            @return: range of the indices of the new batteries
+        """
+        def grow(arr, val):
+            return np.concatenate((arr, np.full(num, val, dtype=float)))
+
+        charge = initial_charge_rel * rated_capacity
+        self.rated_capacity = grow(self.rated_capacity, rated_capacity)
+        self.rated_discharge_capacity = grow(self.rated_discharge_capacity, rated_discharge_capacity)
+        self.rated_charge_capacity = grow(self.rated_charge_capacity, rated_charge_capacity)
+        self.eta = grow(self.eta, roundtrip_efficiency)
+        self.alpha = grow(self.alpha, charge_change_rate)
+        self.dt = grow(self.dt, dt)
+
+        self._P = grow(self._P, 0)
+        self._Pset = grow(self._Pset, 0)
+        self._charge = grow(self._charge, charge)
+
+        self.Pext = grow(self.Pext, 0)
+        self.Psetext = grow(self.Psetext, 0)
+        self.SoC = grow(self.SoC, charge)
+        self.relSoC = grow(self.relSoC, charge / rated_capacity)
+
+        first = self.n
+        self.n += num
+        return range(first, self.n)
+
+    def calc_val(self, t):
+        """
+            Advance all batteries to time t.
+        """
+        assert type(t) is int
+        assert t >= self.curtime, "Must step to time of after or at current time: {0}. Was asked to step to {1}".format(t, self.curtime)
+        self._ext_to_int() # Translate external state to internal state
+        if self.solver == 'closed':
+            self._advance_closed(t - self.curtime)
+        else:
+            for _ in range(t - self.curtime):
+                self._do_state_update()
+        self._int_to_ext() # Translate internal state to external state
+        self.curtime = t
+
+    def _advance_closed(self, k):
+        # Same closed form as MyBattSim._advance_closed, for the batteries
+        # where P keeps its sign and no limit is active in all k steps
+        if k == 0:
+            return
+        P0, Pset, C0 = self._P, self._Pset, self._charge
+        q = 1 - self.alpha
+        P1 = Pset + (P0 - Pset) * q
+        Pk = Pset + (P0 - Pset) * q**k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            geom = np.where(q == 1, k, q * (1 - q**k) / (1 - q))
+        C = C0 + (k * Pset + (P0 - Pset) * geom) / np.where(P1 > 0, self.eta, 1) * self.dt
+        Pmin = _pymin(P0, Pset)
+        Pmax = _pymax(P0, Pset)
+        Cmin = _pymin(C0, C)
+        Cmax = _pymax(C0, C)
+        free = (((P1 > 0) == (Pk > 0))
+                & (0 <= self.alpha) & (self.alpha <= 1)
+                & (-self.rated_discharge_capacity <= Pmin) & (Pmax <= self.rated_charge_capacity)
+                & (0 <= Cmin) & (Cmax <= self.rated_capacity)
+                & ((Pmin >= 0) | (Pmin >= -Cmin * self.eta / self.dt))
+                & ((Pmax <= 0) | (Pmax <= (self.rated_capacity - Cmax) / self.dt)))
+        limited = np.flatnonzero(~free)
+        self._P = np.where(free, Pk, P0)
+        self._charge = np.where(free, C, C0)
+        if len(limited):
+            for _ in range(k):
+                self._do_state_update(limited)
+
+    def _do_state_update(self, i=slice(None)):
+        # Current power will slowly rise towards setpoint, for the batteries i
+        P = self.alpha[i] * self._Pset[i] + (1 - self.alpha[i]) * self._P[i]
+        self._P[i] = self._limit_P(P, i)
+        self._update_charge(i)
+
+    def _limit_P(self, P, i):
+        # Limit according to bounds
+        P = _pymin(_pymax(P, -self.rated_discharge_capacity[i]), self.rated_charge_capacity[i])
+        # Limit to available charge, roundtrip eff. is applied to output
+        P = _pymin(
+                _pymax(P, -self._charge[i] * self.eta[i] / self.dt[i]), # Cannot discharge more than we have
+                (self.rated_capacity[i] - self._charge[i]) / self.dt[i]) # Cannot overfill
+        return P
+
+    def _update_charge(self, i):
+        P = self._P[i]
+        C = self._charge[i] + np.where(P > 0, P / self.eta[i], P) * self.dt[i]
+        self._charge[i] = _pymin(
+                _pymax(C, 0.0),
+                self.rated_capacity[i])
+
+    def _ext_to_int(self):
+        self._Pset = - self.Psetext
+
+    def _int_to_ext(self):
+        self.Pext = - self._P
+        self.SoC = self._charge.copy()
+        self.relSoC = self._charge / self.rated_capacity
+
+    # Getter/setters for external users
+    @property
+    def P(self):
+        return self.Pext
+
+    @property
+    def Pset(self):
+        return self.Psetext
+
+    def set_Pset(self, idx, newPset):
+        """
+            Set the setpoint of the batteries at idx (index or index array).
+        """
+        self.Psetext[idx] = _pymin(self.rated_discharge_capacity[idx],
+                _pymax(np.asarray(newPset, dtype=float), -self.rated_charge_capacity[idx]))
@@ -0,0 +1,123 @@
+import numpy as np
+from .util import MyBuildingSim
+
+
+class MyBuildingFleet:
+    def __init__(self, solver='geometric'):
+        """
+            Fleet of buildings stored as struct-of-arrays.
+            Every building follows the same model as MyBuildingSim with the
+            given solver, but the whole fleet is advanced with one set of
+            array operations per calc_val instead of one Python call per
+            building. The parameters may differ between the buildings.
+            Entity i is addressed by the index returned from add().
+        """
+        if solver not in MyBuildingSim.SOLVERS:
+            raise ValueError("Unknown solver {0}, expected one of {1}.".format(solver, MyBuildingSim.SOLVERS))
+        self.solver = solver
+        self.curtime = 0 # Time is assumed to step in integer steps
+        self.n = 0
+
+        # Parameters
+        self.heat_coeff = np.zeros(0)
+        self.solar_heat_coeff = np.zeros(0)
+        self.insulation_coeff = np.zeros(0)
+        self.heater_power = np.zeros(0)
+        self.dt = np.zeros(0)
+
+        # Variables
+        self.T_int = np.zeros(0)
+        self.T_amb = np.zeros(0)
+        self.zs = np.zeros(0)
+        self.x = np.zeros(0)
+        self.P = np.zeros(0)
+
+    def add(
+            self, num,
+            heat_coeff=12.0, solar_heat_coeff=6.0,
+            insulation_coeff=0.2, init_T_int=22.0,
+            init_T_amb=12.0, heater_power=5.0, dt=1.0/3600):
+        """
+            Append num buildings to the fleet.
+            Parameters are the same as for MyBuildingSim, each one is either
+            a value for all new buildings or a sequence of num values.
+            @return: range of the indices of the new buildings
+        """
+        def grow(arr, val):
+            return np.concatenate((arr, np.broadcast_to(np.asarray(val, dtype=float), (num,))))
+
+        self.heat_coeff = grow(self.heat_coeff, heat_coeff)
+        self.solar_heat_coeff = grow(self.solar_heat_coeff, solar_heat_coeff)
+        self.insulation_coeff = grow(self.insulation_coeff, insulation_coeff)
+        self.heater_power = grow(self.heater_power, heater_power)
+        self.dt = grow(self.dt, dt)
+
+        self.T_int = grow(self.T_int, init_T_int)
+        self.T_amb = grow(self.T_amb, init_T_amb)
+        self.zs = grow(self.zs, 0)
+        self.x = grow(self.x, 0)
+        self.P = grow(self.P, 0)
+
+        first = self.n
+        self.n += num
+        return range(first, self.n)
+
+    def calc_val(self, t):
+        """
+            Advance all buildings to time t.
+        """
+        assert type(t) is int
+        assert t >= self.curtime, "Must step to time of after or at current time: {0}. Was asked to step to {1}".format(t, self.curtime)
+        n = t - self.curtime
+        if n > 0:
+            if self.solver == 'euler':
+                for _ in range(n):
+                    self._do_state_update()
+            else:
+                self._advance(n)
+        self.curtime = t
+
+    def _forcing(self):
+        # Temperature change per hour which does not depend on T_int
+        return self.insulation_coeff * self.T_amb \
+                + self.solar_heat_coeff * self.zs \
+                + self.heat_coeff * self.x
+
+    def _do_state_update(self):
+        self.T_int = self.T_int + self.dt*(
+                self.insulation_coeff * (self.T_amb - self.T_int)
+                + self.solar_heat_coeff * self.zs
+                + self.heat_coeff * self.x)
+
+    def _advance(self, n):
+        # See MyBuildingSim._advance_geometric and _advance_exponential,
+        # buildings without heat loss just integrate the forcing
+        forcing = self._forcing()
+        if self.solver == 'geometric':
+            a = self.dt * self.insulation_coeff
+            lossless = a == 0
+            decay = (1 - a)**n
+        else:
+            lossless = self.insulation_coeff == 0
+            decay = np.exp(-self.insulation_coeff * self.dt * n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            T_eq = forcing / self.insulation_coeff
+            self.T_int = np.where(
+                lossless,
+                self.T_int + n * self.dt * forcing,
+                T_eq + (self.T_int - T_eq) * decay)
+
+    # Setters for external users
+    def set_P(self, idx, newP):
+        """
+            Set the heater power of the buildings at idx (index or index array).
+        """
+        self.P[idx] = newP
+        self.x[idx] = self.P[idx] / self.heater_power[idx]
+
+    def set_x(self, idx, newx):
+        """
+            Set the heater setting of the buildings at idx (index or index array).
+        """
+        self.x[idx] = newx
+        self.P[idx] = self.heater_power[idx] * self.x[idx]
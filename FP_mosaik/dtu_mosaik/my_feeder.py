@@ -0,0 +1,111 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import factorized
+
+
+class MyFeeder:
+    def __init__(self):
+        """
+            Radial feeders of buses stored as struct-of-arrays.
+            Every bus b is fed by one line from its parent bus parent[b], or
+            from the substation (voltage V0[b]) if parent[b] is -1. The
+            feeders form a forest which is described by the sparse incidence
+            matrix A of lines (row b: the line feeding bus b) and buses:
+                A[b, b] = 1, A[b, parent[b]] = -1
+            Power flow uses the linearized DistFlow equations without
+            reactive power (DC approximation), with P in kW:
+                A^T Pline = P   (Pline[b]: flow from bus b to its parent)
+                A V = droop*Pline + V0*(parent == -1)
+            droop[b] is the voltage rise per kW exported over the line of
+            bus b, i.e. R/V0 of the line. A single bus connected to the
+            substation gives the same result as MyGridSim.
+            Entity i is addressed by the index returned from add().
+        """
+        self._curtime = 0
+        self.n = 0
+
+        # Topology and line parameters
+        self.parent = np.zeros(0, dtype=int)
+        self.droop = np.zeros(0)
+        self.V0 = np.zeros(0)
+
+        # Injections: P = S @ values, S maps each injected value to its bus
+        self._S = None
+        self._solve_A = None
+        self._solve_AT = None
+
+        # Externally visible variables
+        self.P = np.zeros(0) # Net injection at the bus [kW]
+        self.Pline = np.zeros(0)
+        self.V = np.zeros(0)
+
+    def add(self, num, V0=230, droop=10.0, parents=None):
+        """
+            Append a feeder of num buses.
+            @input:
+                V0: substation voltage [V]
+                droop: voltage rise per kW over each line [V/kW], a value or
+                    a sequence of num values
+                parents: parent of each bus as an index into the new buses
+                    (earlier buses only) or -1 for the substation, the
+                    default is a line substation - bus 0 - bus 1 - ...
+            @return: range of the indices of the new buses
+        """
+        if parents is None:
+            parents = np.arange(num) - 1
+        parents = np.asarray(parents, dtype=int)
+        if parents.shape != (num,):
+            raise ValueError("Need a parent for each of the {0} buses, got {1}.".format(num, len(parents)))
+        if np.any(parents >= np.arange(num)) or np.any(parents < -1):
+            raise ValueError("The parent of a bus must be -1 or an earlier bus of the feeder.")
+
+        first = self.n
+        self.parent = np.concatenate((self.parent, np.where(parents < 0, -1, parents + first)))
+        self.droop = np.concatenate((self.droop, np.broadcast_to(np.asarray(droop, dtype=float), (num,))))
+        self.V0 = np.concatenate((self.V0, np.full(num, V0, dtype=float)))
+        self.n += num
+
+        # Topology changed, factorize again
+        lines = np.arange(self.n)
+        fed = self.parent >= 0
+        A = sp.csc_matrix(
+            (np.concatenate((np.ones(self.n), -np.ones(fed.sum()))),
+             (np.concatenate((lines, lines[fed])), np.concatenate((lines, self.parent[fed])))),
+            shape=(self.n, self.n))
+        self._solve_A = factorized(A)
+        self._solve_AT = factorized(A.T.tocsc())
+        self._Vroot = np.where(fed, 0.0, self.V0)
+
+        self.P = np.concatenate((self.P, np.zeros(num)))
+        self.set_sources(np.zeros(0, dtype=int))
+        self.calc_val(self._curtime)
+        return range(first, self.n)
+
+    def set_sources(self, buses):
+        """
+            Connect injected values to the buses: value j of set_P() is
+            injected at bus buses[j].
+        """
+        self._S = sp.csr_matrix(
+            (np.ones(len(buses)), (buses, np.arange(len(buses)))),
+            shape=(self.n, len(buses)))
+
+    def set_P(self, values):
+        """
+            Set the net injections of all buses to the sums of the injected
+            values (one sparse mat-vec).
+        """
+        self.P = self._S @ values
+
+    def calc_val(self, t):
+        assert type(t) is int
+        assert t >= self._curtime, "Must step to time of after or at current time: {0}. Was asked to step to {1}".format(t, self._curtime)
+        self._curtime = t
+        self.Pline = self._solve_AT(self.P)
+        self.V = self._solve_A(self.droop * self.Pline + self._Vroot)
+
+    # Getter for external users
+    @property
+    def Pgrid(self):
+        # Like MyGridSim: power drawn from the grid at the bus
+        return -self.P
@@ -33,6 +33,7 @@ class coffee_machine:
         self.working_time = init_time # time to prepare coffee. default :  5 minutes
         self.on = 0
         self.cpt = 0
+        self.turn_on = 0 # last turn on command
     
     def step(self):
         r = np.random.randint(0,1000, 1)
@@ -0,0 +1,118 @@
+"""
+    A cache which converts each series of a signal store (e.g. signals.h5) once
+    to contiguous float64 .npy files and memory-maps them read-only.
+
+    The first load of a series decodes the HDF5 store and writes
+    <store>.cache/<series>.values.npy and <series>.index.npy next to the store.
+    Later loads, also from other simulator processes, only map these files, so
+    all entities and processes share the same pages of the OS file cache.
+    Within one process the loaded signals are additionally kept in a dict.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from .util import time_grid
+
+# (storefilename, series_name, cache_dir) -> Signal, shared by all simulators in this process
+_signals = {}
+
+
+class Signal:
+    def __init__(self, values, index, source=None):
+        """
+            Read-only time series: values[i] is the value at time index[i].
+            Indexing with a time behaves like label indexing of a pandas Series.
+            source: (storefilename, series_name, cache_dir) of a loaded signal
+        """
+        self.values = values
+        self.index = index
+        self.source = source
+        # (t0, period) if the index is equally spaced, computed once per series
+        self.grid = time_grid(index)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, t):
+        t0, period = self.grid
+        if t0 is not None:
+            i = (t - t0) / period
+            if not (0 <= i < len(self.values)) or i != int(i):
+                raise KeyError(t)
+            return self.values[int(i)]
+        i = np.searchsorted(self.index, t)
+        if i == len(self.index) or self.index[i] != t:
+            raise KeyError(t)
+        return self.values[i]
+
+    def segment_index(self, tol=0.0, kind='constant'):
+        """
+            SignalIndex of the signal (see signal_index), cached on disk
+            next to the store for signals loaded from a store.
+        """
+        from .signal_index import build_index, load_index
+        if self.source is None:
+            return build_index(self, tol, kind)
+        storefilename, series_name, cache_dir = self.source
+        return load_index(storefilename, series_name, tol, kind, cache_dir)
+
+
+def _cache_paths(storefilename, series_name, cache_dir):
+    if cache_dir is None:
+        cache_dir = storefilename + '.cache'
+    name = series_name.strip('/').replace('/', '__')
+    base = os.path.join(cache_dir, name)
+    return base + '.values.npy', base + '.index.npy'
+
+def _is_fresh(path, storefilename):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(storefilename)
+
+def _save_atomic(path, arr):
+    # Write to a private file and rename, so concurrent readers never see partial files
+    tmppath = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmppath, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmppath, path)
+
+def _read_series(storefilename, series_name):
+    with pd.HDFStore(storefilename, mode='r') as store:
+        series = store[series_name]
+    values = np.ascontiguousarray(series.to_numpy(dtype=np.float64))
+    index = np.ascontiguousarray(series.index.to_numpy())
+    if index.dtype.kind not in 'iuf':
+        raise ValueError("Series {0} in {1} must have a numeric (time) index.".format(series_name, storefilename))
+    return values, index
+
+def load_signal(storefilename, series_name, cache_dir=None):
+    """
+        Return the series series_name of the store storefilename as a Signal
+        backed by read-only memory-mapped arrays.
+        @input:
+            storefilename: Path of the HDF5 signal store
+            series_name: Key of the series in the store
+            cache_dir: Directory of the .npy files (default: <storefilename>.cache)
+    """
+    storefilename = os.path.abspath(storefilename)
+    key = (storefilename, series_name, cache_dir)
+    signal = _signals.get(key)
+    if signal is not None:
+        return signal
+
+    valuespath, indexpath = _cache_paths(storefilename, series_name, cache_dir)
+    if not (_is_fresh(valuespath, storefilename) and _is_fresh(indexpath, storefilename)):
+        values, index = _read_series(storefilename, series_name)
+        try:
+            os.makedirs(os.path.dirname(valuespath), exist_ok=True)
+            _save_atomic(indexpath, index)
+            _save_atomic(valuespath, values)
+        except OSError:
+            # Cache location not writable: keep a private in-memory copy
+            values.flags.writeable = False
+            index.flags.writeable = False
+            signal = _signals[key] = Signal(values, index, key)
+            return signal
+
+    signal = Signal(np.load(valuespath, mmap_mode='r'), np.load(indexpath, mmap_mode='r'), key)
+    _signals[key] = signal
+    return signal
@@ -0,0 +1,195 @@
+"""
+    Segment index of the series of a signal store (e.g. signals.h5): the
+    times at which a series changes by more than a tolerance, with a table
+    of piecewise constant or piecewise linear segments.
+
+    An index answers "value at t" and "next change after t" with one binary
+    search over the segment start times. Indexes are built once per series,
+    kind and tolerance and cached as <store>.cache/<series>.segments.<kind>.<tol>.npz
+    next to the .npy files of signal_cache, so later loads (also from other
+    processes) only read the segment table.
+
+    Build the indexes of all series of a store ahead of a run with
+        python -m dtu_mosaik.signal_index [store] [--tol 0 0.01] [--kind constant linear]
+"""
+
+import os
+import numpy as np
+from .util import change_points
+from .signal_cache import load_signal, _cache_paths, _is_fresh
+
+KINDS = ('constant', 'linear')
+
+# (storefilename, series_name, kind, tol, cache_dir) -> SignalIndex
+_indexes = {}
+
+
+class SignalIndex:
+    def __init__(self, kind, times, values, slopes, end):
+        """
+            Segments of a series: segment i starts at times[i] and holds
+            values[i] (constant), or values[i] + slopes[i]*(t - times[i])
+            (linear), up to the start of segment i+1. The index covers the
+            times from times[0] to end.
+        """
+        self.kind = kind
+        self.times = times
+        self.values = values
+        self.slopes = slopes
+        self.end = end
+
+    def __len__(self):
+        return len(self.times)
+
+    def segment(self, t):
+        '''
+            Position of the segment containing time t.
+        '''
+        if not (len(self.times) and self.times[0] <= t <= self.end):
+            raise KeyError(t)
+        return np.searchsorted(self.times, t, side='right') - 1
+
+    def value_at(self, t):
+        '''
+            Value of the series at time t, within the tolerance of the index.
+        '''
+        i = self.segment(t)
+        if self.kind == 'linear':
+            return self.values.item(i) + self.slopes.item(i) * (t - self.times.item(i))
+        return self.values.item(i)
+
+    def next_change(self, t):
+        '''
+            Start time of the first segment after t, or None if t is in the
+            last segment.
+        '''
+        i = np.searchsorted(self.times, t, side='right')
+        return self.times[i].item() if i < len(self.times) else None
+
+
+def _constant_segments(values, tol):
+    # Segment starts of change_points, each segment holds the middle of its
+    # range, i.e. the value itself for tol == 0 and within tol/2 otherwise
+    starts = change_points(values, tol)
+    if tol == 0 or len(values) == 0:
+        return starts, values[starts], np.zeros(len(starts))
+    lo = np.minimum.reduceat(values, starts)
+    hi = np.maximum.reduceat(values, starts)
+    return starts, (lo + hi) / 2, np.zeros(len(starts))
+
+def _linear_segments(times, values, tol):
+    # Greedy "swinging door" segmentation: a segment is the line from its
+    # first sample with a slope that keeps all its samples within tol. The
+    # range of such slopes narrows with every sample until it is empty,
+    # the sample then starts the next segment. NaN only continues NaN.
+    starts, slopes = [], []
+    t_a = v_a = None
+    lo, hi = -np.inf, np.inf
+    for i, (t, v) in enumerate(zip(times.tolist(), values.tolist())):
+        if t_a is not None:
+            if v != v or v_a != v_a:
+                if v != v and v_a != v_a:
+                    continue
+            else:
+                dt = t - t_a
+                new_lo = max(lo, (v - tol - v_a) / dt)
+                new_hi = min(hi, (v + tol - v_a) / dt)
+                if new_lo <= new_hi:
+                    lo, hi = new_lo, new_hi
+                    continue
+            slopes.append(0.0 if lo == -np.inf else (lo + hi) / 2)
+        starts.append(i)
+        t_a, v_a = t, v
+        lo, hi = -np.inf, np.inf
+    if starts:
+        slopes.append(0.0 if lo == -np.inf else (lo + hi) / 2)
+    starts = np.array(starts, dtype=int)
+    return starts, values[starts], np.array(slopes, dtype=float)
+
+def build_index(series, tol=0.0, kind='constant'):
+    """
+        Return the SignalIndex of series.
+        @input:
+            series: pandas Series or Signal, indexed by time
+            tol: Largest deviation of the segments from the samples
+            kind: 'constant' (segment values) or 'linear' (segment lines)
+    """
+    if kind not in KINDS:
+        raise ValueError("Unknown kind {0}, expected one of {1}.".format(kind, KINDS))
+    if tol < 0:
+        raise ValueError("The tolerance must not be negative, got {0}.".format(tol))
+    values = np.asarray(series.values, dtype=float)
+    index = np.asarray(series.index)
+    if kind == 'linear':
+        starts, segvalues, slopes = _linear_segments(index, values, tol)
+    else:
+        starts, segvalues, slopes = _constant_segments(values, tol)
+    end = index[-1].item() if len(index) else 0
+    return SignalIndex(kind, index[starts], segvalues, slopes, end)
+
+def _index_path(storefilename, series_name, kind, tol, cache_dir):
+    valuespath, _ = _cache_paths(storefilename, series_name, cache_dir)
+    return '{0}.segments.{1}.{2!r}.npz'.format(valuespath[:-len('.values.npy')], kind, float(tol))
+
+def load_index(storefilename, series_name, tol=0.0, kind='constant', cache_dir=None):
+    """
+        Return the SignalIndex of the series series_name of the store
+        storefilename, built on first use and cached on disk.
+        @input:
+            tol, kind: see build_index
+            cache_dir: Directory of the cache files (default: <storefilename>.cache)
+    """
+    storefilename = os.path.abspath(storefilename)
+    key = (storefilename, series_name, kind, float(tol), cache_dir)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    path = _index_path(storefilename, series_name, kind, tol, cache_dir)
+    if _is_fresh(path, storefilename):
+        with np.load(path) as f:
+            index = SignalIndex(kind, f['times'], f['values'], f['slopes'], f['end'].item())
+    else:
+        index = build_index(load_signal(storefilename, series_name, cache_dir), tol, kind)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a private file and rename, as signal_cache._save_atomic
+            tmppath = '{0}.{1}.tmp'.format(path, os.getpid())
+            with open(tmppath, 'wb') as f:
+                np.savez(f, times=index.times, values=index.values,
+                         slopes=index.slopes, end=np.array(index.end))
+            os.replace(tmppath, path)
+        except OSError:
+            # Cache location not writable: keep the index in memory only
+            pass
+    _indexes[key] = index
+    return index
+
+def build_store(storefilename, tolerances=(0.0,), kinds=('constant',), cache_dir=None):
+    """
+        Build and cache the indexes of all series of a store.
+        @return: dict (series_name, kind, tol) -> SignalIndex
+    """
+    import pandas as pd
+    with pd.HDFStore(storefilename, mode='r') as store:
+        series_names = store.keys()
+    return dict(((name, kind, tol), load_index(storefilename, name, tol, kind, cache_dir))
+                for name in series_names for kind in kinds for tol in tolerances)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time as timer
+
+    MY_DIR = os.path.abspath(os.path.dirname(__file__))
+    parser = argparse.ArgumentParser(description='Build the segment indexes of a signal store.')
+    parser.add_argument('store', nargs='?', default=os.path.join(MY_DIR, 'signals.h5'))
+    parser.add_argument('--tol', type=float, nargs='+', default=[0.0])
+    parser.add_argument('--kind', choices=KINDS, nargs='+', default=['constant'])
+    args = parser.parse_args()
+
+    t = timer.time()
+    indexes = build_store(args.store, args.tol, args.kind)
+    for (name, kind, tol), index in sorted(indexes.items()):
+        print('{0:<24} {1:<9} tol={2:<8g} {3:7d} segments'.format(name, kind, tol, len(index)))
+    print('Built in {0:.2f} s'.format(timer.time() - t))
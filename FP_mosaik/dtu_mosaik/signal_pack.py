@@ -0,0 +1,324 @@
+"""
+    Compact packed signal files (.sigpack) for long series, e.g. a year of
+    PV and demand at 1 s resolution for many households, and a reader which
+    decodes only the chunks that are looked up.
+
+    Each series must be equally spaced in time (see util.time_grid). It is
+    split into chunks of chunk_len samples. A chunk stores the values
+    quantized to multiples of quantum as the differences of consecutive
+    values, zigzag encoded to the narrowest unsigned integer type, with the
+    bytes of the integers shuffled into planes and compressed with zlib.
+    With quantum None the float64 values are compressed losslessly instead.
+    NaN samples are stored as runs in the index.
+
+    File layout:
+        MAGIC, chunk data..., JSON index, index offset (uint64 little endian), MAGIC
+    The index holds per series t0, period, n, quantum, chunk_len, nan runs
+    and per chunk [offset, nbytes, width, first quantized value].
+
+    Pack all series of a signal store with
+        python -m dtu_mosaik.signal_pack signals.h5 signals.sigpack [--quantum 1e-4] [--chunk-len 3600]
+"""
+
+import os
+import json
+import zlib
+import struct
+from collections import OrderedDict
+import numpy as np
+from .util import time_grid, TSSim
+
+MAGIC = b'SIGPACK1'
+PACK_EXT = '.sigpack'
+_WIDTHS = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+# path -> [PackedStore, number of load_packed calls not yet closed],
+# shared by all simulators in this process
+_stores = {}
+
+
+def is_packed(path):
+    return path.endswith(PACK_EXT)
+
+def _encode_chunk(q, width):
+    # Zigzag encoded differences of q, bytes shuffled into width planes
+    d = np.diff(q)
+    z = ((d << 1) ^ (d >> 63)).astype(_WIDTHS[width])
+    return zlib.compress(z.view(np.uint8).reshape(-1, width).T.tobytes(), 6)
+
+def _decode_chunk(data, width, first, length):
+    z = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(width, -1).T.copy().view(_WIDTHS[width]).ravel()
+    z = z.astype(np.int64)
+    q = np.empty(length, dtype=np.int64)
+    q[0] = first
+    np.cumsum((z >> 1) ^ -(z & 1), out=q[1:])
+    q[1:] += first
+    return q
+
+def _nan_runs(values):
+    # [start, stop) of the runs of NaN
+    isnan = np.concatenate(([False], np.isnan(values), [False]))
+    edges = np.flatnonzero(isnan[1:] != isnan[:-1])
+    return edges.reshape(-1, 2).tolist()
+
+def _pack_series(f, series, quantum, chunk_len):
+    values = np.asarray(series.values, dtype=float)
+    grid = getattr(series, 'grid', None)
+    t0, period = grid if grid is not None else time_grid(np.asarray(series.index))
+    if t0 is None:
+        raise ValueError("Only equally spaced series can be packed.")
+    nan = _nan_runs(values)
+    if nan:
+        # Hold the last value over NaN runs, which stores them as no change
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        last = np.maximum.accumulate(np.where(valid, np.arange(len(values)), 0))
+        values = np.where(valid, values, filled[last])
+
+    chunks = []
+    for start in range(0, len(values), chunk_len):
+        chunk = values[start:start + chunk_len]
+        if quantum is None:
+            width, first = 8, None
+            data = zlib.compress(chunk.tobytes(), 6)
+        else:
+            q = np.rint(chunk / quantum).astype(np.int64)
+            d = np.diff(q)
+            zmax = int(max(d.max(), -d.min())) * 2 + 1 if len(d) else 0
+            width = next(w for w in (1, 2, 4, 8) if w == 8 or zmax < 1 << (8*w))
+            first = int(q[0])
+            data = _encode_chunk(q, width)
+        chunks.append([f.tell(), len(data), width, first])
+        f.write(data)
+    return {
+        't0': t0, 'period': period, 'n': len(values),
+        'quantum': quantum, 'chunk_len': chunk_len,
+        'nan': nan, 'chunks': chunks}
+
+def write_packed(path, series, quantum=1e-4, chunk_len=3600):
+    """
+        Write series to the packed signal file path.
+        @input:
+            series: dict name -> pandas Series or Signal
+            quantum: Resolution of the stored values, each value is stored
+                within quantum/2. None stores float64 values losslessly.
+            chunk_len: Number of samples per chunk, the unit of decoding
+    """
+    if quantum is not None and not quantum > 0:
+        raise ValueError("The quantum must be positive or None, got {0}.".format(quantum))
+    # Write to a private file and rename, so concurrent readers never see partial files
+    tmppath = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmppath, 'wb') as f:
+        f.write(MAGIC)
+        index = {'version': 1, 'series': {}}
+        for name, s in series.items():
+            index['series'][name] = _pack_series(f, s, quantum, chunk_len)
+        offset = f.tell()
+        f.write(json.dumps(index).encode('utf-8'))
+        f.write(struct.pack('<Q', offset))
+        f.write(MAGIC)
+    os.replace(tmppath, path)
+
+
+class PackedSignal:
+    def __init__(self, f, meta, cache_chunks=4):
+        """
+            Read-only equally spaced series of a packed signal file. Chunks
+            are decoded when a sample in them is looked up, the last
+            cache_chunks decoded chunks are kept (decodes counts the decoded
+            chunks). Entities reading at different positions should keep
+            their current chunk themselves, see PackedTSSim.
+            Indexing with a time behaves like label indexing of a pandas Series.
+        """
+        self._f = f
+        self.grid = (meta['t0'], meta['period'])
+        self.quantum = meta['quantum']
+        self.chunk_len = meta['chunk_len']
+        self._n = meta['n']
+        self._chunks = meta['chunks']
+        self._nan = meta['nan']
+        self._cache = OrderedDict()
+        self._cache_chunks = cache_chunks
+        self.decodes = 0
+
+    def __len__(self):
+        return self._n
+
+    def chunk(self, k):
+        '''
+            Decoded values of chunk k.
+        '''
+        values = self._cache.get(k)
+        if values is not None:
+            self._cache.move_to_end(k)
+            return values
+        offset, nbytes, width, first = self._chunks[k]
+        self._f.seek(offset)
+        data = self._f.read(nbytes)
+        self.decodes += 1
+        start = k * self.chunk_len
+        length = min(self.chunk_len, self._n - start)
+        if self.quantum is None:
+            values = np.frombuffer(zlib.decompress(data), dtype=np.float64).copy()
+        else:
+            values = _decode_chunk(data, width, first, length) * self.quantum
+        for a, b in self._nan:
+            if a < start + length and b > start:
+                values[max(a - start, 0):b - start] = np.nan
+        values.flags.writeable = False
+        self._cache[k] = values
+        if len(self._cache) > self._cache_chunks:
+            self._cache.popitem(last=False)
+        return values
+
+    def at(self, i):
+        '''
+            Value at sample position i.
+        '''
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        k, j = divmod(i, self.chunk_len)
+        return self.chunk(k).item(j)
+
+    def __getitem__(self, t):
+        t0, period = self.grid
+        i = (t - t0) / period
+        if not (0 <= i < self._n) or i != int(i):
+            raise KeyError(t)
+        return self.at(int(i))
+
+    def get_range(self, i0, i1):
+        '''
+            Values at sample positions i0 ... i1-1, decoding only the chunks covering them.
+        '''
+        if not 0 <= i0 <= i1 <= self._n:
+            raise IndexError((i0, i1))
+        parts = [self.chunk(k) for k in range(i0 // self.chunk_len, -(-i1 // self.chunk_len))]
+        offset = (i0 // self.chunk_len) * self.chunk_len
+        return np.concatenate(parts)[i0 - offset:i1 - offset] if parts else np.zeros(0)
+
+
+class PackedStore:
+    def __init__(self, path, cache_chunks=4):
+        """
+            Reader of a packed signal file, only the index is read on open.
+            store[name] is the PackedSignal of series name.
+        """
+        self.path = path
+        self._f = open(path, 'rb')
+        self._f.seek(-8 - len(MAGIC), os.SEEK_END)
+        offset, = struct.unpack('<Q', self._f.read(8))
+        if self._f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{0} is not a packed signal file.".format(path))
+        size = self._f.tell() - 8 - len(MAGIC) - offset
+        self._f.seek(offset)
+        self._meta = json.loads(self._f.read(size).decode('utf-8'))['series']
+        self._cache_chunks = cache_chunks
+        self._signals = {}
+
+    def keys(self):
+        return list(self._meta)
+
+    def __getitem__(self, name):
+        signal = self._signals.get(name)
+        if signal is None:
+            if name not in self._meta:
+                raise KeyError(name)
+            signal = self._signals[name] = PackedSignal(self._f, self._meta[name], self._cache_chunks)
+        return signal
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def load_packed(path, series_name):
+    """
+        Return the series series_name of the packed signal file path as a
+        PackedSignal, the file is opened once per process. Every call has
+        to be matched by a close_packed(path) when the series is not used
+        any more.
+    """
+    path = os.path.abspath(path)
+    entry = _stores.get(path)
+    if entry is None:
+        entry = _stores[path] = [PackedStore(path), 0]
+    signal = entry[0][series_name]
+    entry[1] += 1
+    return signal
+
+def close_packed(path):
+    """
+        Release a series loaded with load_packed(path, ...), the file is
+        closed when all of them are released.
+    """
+    path = os.path.abspath(path)
+    entry = _stores[path]
+    entry[1] -= 1
+    if entry[1] == 0:
+        del _stores[path]
+        entry[0].close()
+
+
+class PackedTSSim(TSSim):
+    def __init__(self, mult, signal, Pmax=None, sign=1, phase=0, interpolate=False):
+        """
+            TSSim over a PackedSignal: only the chunks covering the looked up
+            times are decoded. Each entity keeps its current chunk, so
+            entities with different phases do not evict each other's chunks
+            from the signal cache.
+            @input: see TSSim, without a tolerance (no adaptive stepping)
+        """
+        # Current chunk (number, values)
+        self._k = None
+        self._chunk = None
+        super().__init__(mult, signal, Pmax, sign, phase, interpolate)
+
+    def _load(self, signal):
+        self.signal = signal
+        self.values = self.index = self._pos = None
+        self._t0, self._period = signal.grid
+        self._n = len(signal)
+        self._unit = False
+
+    def _at(self, i):
+        j = (i - self.phase) % self._n
+        if isinstance(j, np.ndarray):
+            k, j = np.divmod(j, self.signal.chunk_len)
+            values = np.empty(len(j))
+            for chunk in np.unique(k).tolist():
+                inside = k == chunk
+                values[inside] = self.signal.chunk(chunk)[j[inside]]
+            return values
+        k, j = divmod(j, self.signal.chunk_len)
+        if k != self._k:
+            self._chunk = self.signal.chunk(k)
+            self._k = k
+        return self._chunk.item(j)
+
+
+if __name__ == '__main__':
+    import argparse
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Pack the series of a signal store.')
+    parser.add_argument('store', help='HDF5 signal store, e.g. signals.h5')
+    parser.add_argument('out', help='packed signal file (' + PACK_EXT + ')')
+    parser.add_argument('--quantum', type=float, default=1e-4, help='0 for lossless')
+    parser.add_argument('--chunk-len', type=int, default=3600)
+    args = parser.parse_args()
+
+    with pd.HDFStore(args.store, mode='r') as store:
+        series = dict((name, store[name]) for name in store.keys())
+    write_packed(args.out, series, args.quantum or None, args.chunk_len)
+    with PackedStore(args.out) as packed:
+        for name, s in series.items():
+            values = packed[name].get_range(0, len(s))
+            print('{0:<24} {1:8d} samples, max error {2:.3g}'.format(
+                name, len(s), np.nanmax(np.abs(values - s.values)) if len(s) else 0))
+    print('{0}: {1} bytes ({2:.2f} bytes per sample)'.format(
+        args.out, os.path.getsize(args.out), os.path.getsize(args.out) / max(1, sum(len(s) for s in series.values()))))
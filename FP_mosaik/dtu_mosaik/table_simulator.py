@@ -0,0 +1,118 @@
+"""
+    Base class for simulators whose get_data reads attributes of the entity
+    models, using getter tables instead of an if/elif chain per attribute.
+
+    A subclass sets
+        GETTERS: attr -> Python expression of the value of the attribute in
+            terms of the entity model esim (self.simulators[eid])
+        FLEET_GETTERS: attr -> Python expression of the array of the
+            attribute over a vectorized fleet, used when get_fleet() is not
+            None, self.simulators then maps eid -> index into the fleet arrays
+    The entities are grouped by their requested attributes and each group is
+    read by one function compiled from the expressions, e.g. for ['P', 'V']
+        lambda entities: {eid: {'P': esim.P, 'V': esim.V} for eid, esim in entities}
+    As the if/elif chains did, get_data returns an empty dict for the entities
+    without requested attributes.
+    get_data makes this plan once and reuses it as long as mosaik requests the
+    same outputs, which is the case at every step of a scenario.
+"""
+
+import mosaik_api
+
+# (simulator class, attributes) -> compiled getter function
+_functions = {}
+
+
+class TableSimulator(mosaik_api.Simulator):
+    GETTERS = {}
+    FLEET_GETTERS = {}
+    # Name of the entities in error messages
+    ENTITY_NAME = 'Simulator'
+
+    def get_fleet(self):
+        # Vectorized model backing all entities, or None
+        return getattr(self, 'fleet', None)
+
+    def unknown_attr(self, eid, attr):
+        # Exception raised when an unknown attribute is requested
+        return RuntimeError("{0} {1} has no attribute {2}.".format(self.ENTITY_NAME, eid, attr))
+
+    def _function(self, attrs, fleet):
+        # Compiled function reading attrs of a list of (eid, esim), or of
+        # a fleet (a single attribute)
+        key = (type(self), attrs, fleet)
+        func = _functions.get(key)
+        if func is None:
+            if fleet:
+                source = 'lambda fleet: ' + self.FLEET_GETTERS[attrs]
+            else:
+                source = 'lambda entities: {eid: {%s} for eid, esim in entities}' % ', '.join(
+                    '{0!r}: {1}'.format(attr, self.GETTERS[attr]) for attr in attrs)
+            func = _functions[key] = eval(source)
+        return func
+
+    def _compile(self, outputs, fleet):
+        # Plan of get_data for the request outputs
+        if fleet is None:
+            # Entities without requests are a group with no attributes
+            groups = {}
+            for eid, esim in self.simulators.items():
+                requests = tuple(outputs.get(eid) or ())
+                for attr in requests:
+                    if attr not in self.GETTERS:
+                        raise self.unknown_attr(eid, attr)
+                groups.setdefault(requests, []).append((eid, esim))
+            return [(self._function(attrs, False), entities) for attrs, entities in groups.items()]
+
+        # For a fleet: one fancy indexed read per attribute
+        eids = []
+        columns = {}
+        for eid, idx in self.simulators.items():
+            eids.append(eid)
+            for attr in outputs.get(eid) or ():
+                if attr not in self.FLEET_GETTERS:
+                    raise self.unknown_attr(eid, attr)
+                column = columns.setdefault(attr, ([], []))
+                column[0].append(eid)
+                column[1].append(idx)
+        return eids, [(attr, self._function(attr, True), colids, idxs)
+                      for attr, (colids, idxs) in columns.items()]
+
+    def get_data(self, outputs):
+        fleet = self.get_fleet()
+        # mosaik requests the same outputs at every step, only plan once
+        cached = getattr(self, '_plan', None)
+        if cached is None or cached[0] != outputs or cached[1] is not fleet:
+            cached = self._plan = (outputs, fleet, self._compile(outputs, fleet))
+        plan = cached[2]
+
+        if fleet is None:
+            data = {}
+            for func, entities in plan:
+                data.update(func(entities))
+            return data
+
+        eids, columns = plan
+        data = dict((eid, {}) for eid in eids)
+        for attr, func, colids, idxs in columns:
+            for eid, val in zip(colids, func(fleet)[idxs].tolist()):
+                data[eid][attr] = val
+        return data
+
+    def get_fleet_data(self, attrs):
+        """
+            Return whole-fleet arrays of a vectorized simulator.
+            @input:
+                attrs: list of attributes
+            @return: dict attr -> array over the fleet, the entry of entity
+                eid is at index self.simulators[eid]
+        """
+        fleet = self.get_fleet()
+        if fleet is None:
+            raise ValueError("{0} is not vectorized.".format(type(self).__name__))
+        data = {}
+        for attr in attrs:
+            if attr not in self.FLEET_GETTERS:
+                raise ValueError("{0} has no fleet attribute {1}.".format(type(self).__name__, attr))
+            data[attr] = self._function(attr, True)(fleet).copy()
+        return data
@@ -1,20 +1,206 @@
+import numpy as np
+from math import exp, floor
+
 class expando:
     pass
 
+def time_grid(index):
+    '''
+        Return (t0, period) if the time index is equally spaced, else (None, None).
+    '''
+    if len(index) == 0:
+        return None, None
+    if len(index) == 1:
+        return index[0].item(), 1
+    period = index[1] - index[0]
+    if period > 0 and index[-1] - index[0] == period * (len(index) - 1) \
+            and np.all(np.diff(index) == period):
+        return index[0].item(), period.item()
+    return None, None
+
+def change_points(values, tol=0.0):
+    '''
+        Start positions of consecutive segments of values within which
+        max - min <= tol, found greedily from the start. The first segment
+        starts at 0.
+    '''
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.zeros(0, dtype=int)
+    if tol == 0:
+        return np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    starts = [0]
+    lo = hi = values[0]
+    for i, val in enumerate(values.tolist()):
+        if lo <= val <= hi:
+            continue
+        if val != val or lo != lo:
+            # NaN only continues a segment of NaN
+            if val != val and lo != lo:
+                continue
+        elif max(hi, val) - min(lo, val) <= tol:
+            lo, hi = min(lo, val), max(hi, val)
+            continue
+        starts.append(i)
+        lo = hi = val
+    return np.array(starts, dtype=int)
+
+# (id(series), phase, tol) -> (series, times of the segment starts), shared by TSSims
+_shared_change_times = {}
+
+def _next_time(times, t):
+    # First of the sorted times after t, or None
+    i = np.searchsorted(times, t, side='right')
+    return times[i].item() if i < len(times) else None
+
+def adaptive_step(time, step_size, change_times, max_step):
+    '''
+        Next step of a simulator of TSSims with a tolerance: the first time
+        time + k*step_size at or after the next change of any of the series
+        (see TSSim.change_times), but at most max_step after time.
+        Up to then the outputs stay within the tolerance.
+        @input:
+            change_times: TSSim.change_times of the entities, entities
+                sharing the array only need to be given once
+    '''
+    k_max = max(1, max_step // step_size)
+    k = k_max
+    for times in change_times:
+        t = _next_time(times, time)
+        if t is not None:
+            k = min(k, int(-(-(t - time) // step_size)))
+    return time + max(k, 1)*step_size
+
 class TSSim:
-    def __init__(self, mult, series, Pmax=None, sign=1, phase=0):
+    def __init__(self, mult, series, Pmax=None, sign=1, phase=0, interpolate=False, tolerance=None):
+        """
+            Scaled lookup into a time series.
+            @input:
+                mult: Scaling of the series [e.g. rated power]
+                series: pandas Series or Signal, indexed by time
+                Pmax: Bound on the magnitude of the output (default: unbounded)
+                sign: Sign of the output
+                phase: Shift of the output in samples, as numpy.roll(values, phase).
+                    Applied at lookup time, so entities share the series values.
+                interpolate: Interpolate linearly between samples,
+                    otherwise the last sample at or before t is held.
+                tolerance: If given, precompute the times at which the output
+                    changes by more than tolerance (self.change_times) for
+                    next_change() and adaptive_step().
+        """
         self.mult = mult
-        self.series = series
         self.sign = sign
-        if Pmax == None:
-            self.Pmax = 1e100
+        self.Pmax = 1e100 if Pmax is None else Pmax
+        self.interpolate = interpolate
+        self._load(series)
+        self.phase = phase % self._n if self._n else 0
+        self.change_times = None
+        if tolerance is not None:
+            self.change_times = self._change_times(series, tolerance)
         self.calc_val(0)
 
+    def _load(self, series):
+        # Storage of the series: plain array view of the values and the
+        # time -> position mapping, see signal_pack.PackedTSSim for another
+        self.values = np.asarray(series.values, dtype=float)
+        self.index = np.asarray(series.index)
+        grid = getattr(series, 'grid', None)
+        self._t0, self._period = grid if grid is not None else time_grid(self.index)
+        self._n = len(self.values)
+        self._pos = np.arange(self._n) if self._period is None else None
+        # Integer times map directly to positions of self.values
+        self._unit = self._period == 1 and type(self._t0) is int
+
+    def _change_times(self, series, tolerance):
+        # Times of the starts of the segments of the phase shifted series
+        # within which the output varies by at most tolerance
+        tol = tolerance / abs(self.sign * self.mult) if self.mult else np.inf
+        key = (id(series), self.phase, tol)
+        cached = _shared_change_times.get(key)
+        if cached is None or cached[0] is not series:
+            if tol < np.inf and not self.phase and hasattr(series, 'segment_index'):
+                # Precomputed index of a Signal, see signal_index
+                times = series.segment_index(tol).times
+            else:
+                values = np.roll(self.values, self.phase) if self.phase else self.values
+                starts = change_points(values, tol) if tol < np.inf else np.zeros(1, dtype=int)
+                if self._period is not None:
+                    times = self._t0 + starts * self._period
+                else:
+                    times = self.index[starts]
+            cached = _shared_change_times[key] = (series, times)
+        return cached[1]
+
+    def next_change(self, t):
+        '''
+            Earliest time after t at which a new segment of the output
+            begins, i.e. up to then the output stays within tolerance of its
+            value at t. None if it does not change until the end of the series.
+        '''
+        if self.change_times is None:
+            raise ValueError("TSSim was created without a tolerance.")
+        return _next_time(self.change_times, t)
+
     def calc_val(self, t):
         self.cur_t = t
-        self.val_nomax = self.sign * self.mult * self.series[t]
+        if self._unit and type(t) is int and 0 <= t - self._t0 < self._n:
+            raw = self.values.item((t - self._t0 - self.phase) % self._n)
+        else:
+            raw = self._lookup(t)
+        self.val_nomax = self.sign * self.mult * raw
         self.val = max(min(self.val_nomax, self.Pmax), -self.Pmax)
 
+    def _positions(self, t):
+        # Fractional sample position(s) of time(s) t, -1 or n if outside the index
+        if self._period is not None:
+            return (t - self._t0) / self._period
+        return np.interp(t, self.index, self._pos, left=-1, right=self._n)
+
+    def _outside(self, x):
+        if self.interpolate:
+            return (x < 0) | (x > self._n - 1)
+        return (x < 0) | (x >= self._n)
+
+    def _at(self, i):
+        # Value(s) at sample position(s) i of the phase shifted series
+        if self.phase:
+            return np.take(self.values, (i - self.phase) % self._n)
+        return self.values[i]
+
+    def _lookup(self, t):
+        x = self._positions(t)
+        if self._outside(x):
+            raise KeyError(t)
+        i = floor(x)
+        if self.interpolate and x > i:
+            return self._at(i) + (x - i) * (self._at(i + 1) - self._at(i))
+        return self._at(i)
+
+    def get_range(self, t0, t1, step=1):
+        '''
+            Output values (as get_val) at times t0, t0+step, ... before t1.
+        '''
+        if self._unit and step == 1 and type(t0) is int and type(t1) is int:
+            i0, i1 = t0 - self._t0, t1 - self._t0
+            if i0 < i1 and (i0 < 0 or i1 > self._n):
+                raise KeyError((t0, t1))
+            if self.phase:
+                raw = self._at(np.arange(max(i0, 0), max(i1, 0)))
+            else:
+                raw = self.values[max(i0, 0):max(i1, 0)]
+        else:
+            x = self._positions(np.arange(t0, t1, step))
+            outside = self._outside(x)
+            if outside.any():
+                raise KeyError(np.arange(t0, t1, step)[outside][0])
+            i = np.floor(x).astype(int)
+            raw = self._at(i)
+            if self.interpolate:
+                inner = x > i
+                i = i[inner]
+                raw[inner] += (x[inner] - i) * (self._at(i + 1) - self._at(i))
+        return np.clip(self.sign * self.mult * raw, -self.Pmax, self.Pmax)
+
     def get_val(self):
         return self.val
 
@@ -51,10 +237,19 @@ class NoiseDistorter:
 
 
 class MyBuildingSim:
+    # Ways of advancing T_int over several time units in calc_val:
+    #   'euler': one explicit Euler update per time unit (reference, O(n))
+    #   'geometric': closed form of the same Euler recurrence (O(1), equal up to rounding)
+    #   'exponential': exact solution of the underlying linear ODE (O(1))
+    SOLVERS = ('euler', 'geometric', 'exponential')
+
     def __init__(self,
             heat_coeff=12.0, solar_heat_coeff=6.0,
             insulation_coeff=0.2, init_T_int=22.0,
-            init_T_amb=12.0, heater_power=5.0, dt=1.0/3600):
+            init_T_amb=12.0, heater_power=5.0, dt=1.0/3600,
+            solver='geometric'):
+        if solver not in self.SOLVERS:
+            raise ValueError("Unknown solver {0}, expected one of {1}.".format(solver, self.SOLVERS))
 
         # Parrameters
         self.heat_coeff = heat_coeff
@@ -64,6 +259,7 @@ class MyBuildingSim:
         self.init_T_amb = init_T_amb
         self.heater_power = heater_power
         self.dt = dt # 1 MosaikTime = 1s
+        self.solver = solver
         self.curtime=0
 
         # Variables
@@ -76,8 +272,15 @@ class MyBuildingSim:
     def calc_val(self, t):
         assert type(t) is int
         assert t >= self.curtime, "Must step to time of after or at current time: {0}. Was asked to step to {1}".format(t, self.curtime)
-        for _ in range(t - self.curtime):
-            self._do_state_update()
+        n = t - self.curtime
+        if n > 0:
+            if self.solver == 'euler':
+                for _ in range(n):
+                    self._do_state_update()
+            elif self.solver == 'geometric':
+                self._advance_geometric(n)
+            else:
+                self._advance_exponential(n)
         self.curtime = t
 
     def _do_state_update(self):
@@ -86,6 +289,30 @@ class MyBuildingSim:
                 + self.solar_heat_coeff * self.zs\
                 + self.heat_coeff * self._x)
 
+    def _forcing(self):
+        # Temperature change per hour which does not depend on T_int
+        return self.insulation_coeff * self.T_amb \
+                + self.solar_heat_coeff * self.zs \
+                + self.heat_coeff * self._x
+
+    def _advance_geometric(self, n):
+        # T_int(k+1) = r*T_int(k) + u with r = 1 - dt*insulation_coeff,
+        # so T_int(n) = T_eq + (T_int(0) - T_eq)*r**n with T_eq = u/(1 - r).
+        a = self.dt * self.insulation_coeff
+        if a == 0:
+            self.T_int = self.T_int + n * self.dt * self._forcing()
+            return
+        T_eq = self._forcing() / self.insulation_coeff
+        self.T_int = T_eq + (self.T_int - T_eq) * (1 - a)**n
+
+    def _advance_exponential(self, n):
+        # dT_int/dt = insulation_coeff*(T_eq - T_int) solved over n*dt hours
+        if self.insulation_coeff == 0:
+            self.T_int = self.T_int + n * self.dt * self._forcing()
+            return
+        T_eq = self._forcing() / self.insulation_coeff
+        self.T_int = T_eq + (self.T_int - T_eq) * exp(-self.insulation_coeff * self.dt * n)
+
     @property
     def P(self):
         return self._P
@@ -113,7 +340,8 @@ class MyBattSim:
             roundtrip_efficiency=0.96,
             initial_charge_rel=0.50,
             charge_change_rate=0.90,
-            dt=1.0/(60*60)):
+            dt=1.0/(60*60),
+            solver='closed'):
         """
             Battery simulator.
             Time is assumed to proceed in integer steps.
@@ -126,7 +354,14 @@ class MyBattSim:
                 charge_change_rate: Rate at which charge follows setpoint,
                     1.0= instant following. [0.0 - 1.0]
                 dt: number of hours per time step [h] (default: 1 sec per time step)
+                solver: 'closed' advances P and charge over all time steps of a
+                    calc_val call analytically, stepping one time step at a time
+                    only while a power or charge limit is active.
+                    'loop' always steps one time step at a time (reference).
         """
+        if solver not in ('closed', 'loop'):
+            raise ValueError("Unknown solver {0}, expected 'closed' or 'loop'.".format(solver))
+        self.solver = solver
         self.rated_capacity = rated_capacity
         self.rated_discharge_capacity = rated_discharge_capacity
         self.rated_charge_capacity = rated_charge_capacity
@@ -152,11 +387,93 @@ class MyBattSim:
         assert type(t) is int
         assert t >= self.curtime, "Must step to time of after or at current time: {0}. Was asked to step to {1}".format(t, self.curtime)
         self._ext_to_int() # Translate external state to internal state
-        for _ in range(t - self.curtime):
-            self._do_state_update()
+        if self.solver == 'closed':
+            self._advance_closed(t - self.curtime)
+        else:
+            for _ in range(t - self.curtime):
+                self._do_state_update()
         self._int_to_ext() # Translate internal state to external state
         self.curtime = t
 
+    def _advance_closed(self, k):
+        # Without active limits, P(n) = Pset + (P(0) - Pset)*(1 - alpha)**n and
+        # charge is the sum of a geometric series (split where P changes sign,
+        # since the efficiency is only applied when charging).
+        while k > 0:
+            m = self._sign_split(k)
+            j = self._free_steps(k, m)
+            if j > 0:
+                self._P, self._charge = self._closed_form(j, min(m, j))[:2]
+                k -= j
+            # A limit is active: step one time step at a time until it is released
+            while k > 0:
+                P, C = self._P, self._charge
+                self._do_state_update()
+                k -= 1
+                if self._P == P and self._charge == C:
+                    # Fixed point, the remaining updates change nothing
+                    k = 0
+                elif self._free_steps(1, 1) == 1:
+                    break
+
+    def _P_after(self, n):
+        return self._Pset + (self._P - self._Pset) * (1 - self.alpha)**n
+
+    def _P_sum(self, n):
+        # Sum of _P_after(i) for i in 1..n
+        q = 1 - self.alpha
+        geom = n if q == 1 else q * (1 - q**n) / (1 - q)
+        return n * self._Pset + (self._P - self._Pset) * geom
+
+    def _sign_split(self, k):
+        # Number of leading steps in 1..k where P has the same sign as in step 1
+        first = self._P_after(1) > 0
+        if (self._P_after(k) > 0) == first:
+            return k
+        lo, hi = 1, k
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if (self._P_after(mid) > 0) == first:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def _closed_form(self, j, m):
+        # P and charge after j free steps, plus the extreme charges on the way
+        eff = lambda P: self.eta if P > 0 else 1
+        P = self._P_after(j)
+        Cm = self._charge + self._P_sum(m) / eff(self._P_after(1)) * self.dt
+        C = Cm + (self._P_sum(j) - self._P_sum(m)) / eff(P) * self.dt
+        return P, C, min(self._charge, Cm, C), max(self._charge, Cm, C)
+
+    def _free_steps(self, k, m):
+        # Largest j <= k such that no limit in _limit_P or _update_charge is
+        # active during the first j steps (m is the sign split for k steps)
+        Pmin = min(self._P, self._Pset)
+        Pmax = max(self._P, self._Pset)
+        if not (0 <= self.alpha <= 1
+                and -self.rated_discharge_capacity <= Pmin
+                and Pmax <= self.rated_charge_capacity):
+            return 0
+
+        def free(j):
+            _, _, Cmin, Cmax = self._closed_form(j, min(m, j))
+            return (0 <= Cmin and Cmax <= self.rated_capacity
+                    and (Pmin >= 0 or Pmin >= -Cmin * self.eta / self.dt)
+                    and (Pmax <= 0 or Pmax <= (self.rated_capacity - Cmax) / self.dt))
+
+        if free(k):
+            return k
+        lo, hi = 0, k
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if free(mid):
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
     def _do_state_update(self):
         # Current power will slowly rise towards setpoint
         P = self.alpha * self._Pset + (1 - self.alpha) * self._P
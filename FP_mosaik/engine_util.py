@@ -0,0 +1,130 @@
+"""
+    Helpers shared by the pyknow controllers: run a KnowledgeEngine on one
+    input fact and count the rules it fires, and cache engine results for
+    inputs within a deadband so the engine is not run at all for them.
+"""
+
+from collections import OrderedDict
+from pyknow import KnowledgeEngine, Fact, Rule, NOT
+
+
+class CountingEngine(KnowledgeEngine):
+    '''KnowledgeEngine which counts the rules fired in self.fired'''
+
+    fired = 0
+
+    @property
+    def agenda(self):
+        return self._agenda
+
+    @agenda.setter
+    def agenda(self, agenda):
+        # The engine creates a new agenda on init and reset, count on each of them
+        engine = self
+        get_next = agenda.get_next
+        def counting_get_next():
+            activation = get_next()
+            if activation is not None:
+                engine.fired += 1
+            return activation
+        agenda.get_next = counting_get_next
+        self._agenda = agenda
+
+
+def run_engine(engine, fact):
+    """
+        Run the rules of engine on the input fact only: reset the engine,
+        declare fact and run it.
+        @return: dict of the outputs the rules collected in engine.returnv
+    """
+    engine.reset()
+    engine.declare(fact)
+    engine.returnv = {}
+    engine.run()
+    return engine.returnv
+
+def input_fields(engine_class, input_class):
+    """
+        Return the set of fields of input_class facts which the rules of
+        engine_class match on, or None if a rule binds the whole fact.
+    """
+    fields = set()
+    for name in dir(engine_class):
+        rule = getattr(engine_class, name)
+        if not isinstance(rule, Rule):
+            continue
+        patterns = [ce for ce in rule if isinstance(ce, Fact)]
+        patterns += [p for ce in rule if isinstance(ce, NOT) for p in ce if isinstance(p, Fact)]
+        for pattern in patterns:
+            if not isinstance(pattern, input_class):
+                continue
+            if getattr(pattern, '__bind__', None) is not None:
+                return None
+            fields.update(key for key in pattern if not (isinstance(key, str) and key.startswith('__')))
+    return fields
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+class DecisionCache:
+    def __init__(self, fields, deadband=None, size=10000):
+        """
+            Memo of the last engine result of each entity, which is reused
+            while every input stays within a deadband of the inputs that
+            produced it, so the engine is only run for inputs that changed
+            beyond the deadband.
+            @input:
+                fields: input fields the result depends on (None: all fields)
+                deadband: dict field -> quantum, numeric values of these fields
+                    may differ by up to the quantum, all other fields have
+                    to match exactly
+                size: maximal number of entities with a cached result, the
+                    least recently used one is dropped when it is full
+        """
+        self.fields = None if fields is None else sorted(fields)
+        self.deadband = dict(deadband or {})
+        for field, quantum in self.deadband.items():
+            if not quantum > 0:
+                raise ValueError("Deadband of {0} must be positive, got {1}.".format(field, quantum))
+        self.size = size
+        self.results = OrderedDict() # eid -> (inputs, result)
+        self.hits = 0
+        self.misses = 0
+
+    def _inputs(self, values):
+        if self.fields is None:
+            return dict(values)
+        return dict((field, values.get(field)) for field in self.fields)
+
+    def _within(self, inputs, values):
+        if self.fields is None and len(values) != len(inputs):
+            return False
+        for field, ref in inputs.items():
+            val = values.get(field)
+            if val == ref:
+                continue
+            quantum = self.deadband.get(field)
+            if quantum is None or not _is_number(val) or not _is_number(ref) or abs(val - ref) > quantum:
+                return False
+        return True
+
+    def get(self, eid, values):
+        '''
+            Cached result of entity eid for the inputs values, None if the
+            inputs left the deadband.
+        '''
+        entry = self.results.get(eid)
+        if entry is None or not self._within(entry[0], values):
+            self.misses += 1
+            return None
+        self.results.move_to_end(eid)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, eid, values, result):
+        self.results[eid] = (self._inputs(values), dict(result))
+        self.results.move_to_end(eid)
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
@@ -0,0 +1,237 @@
+"""
+    A household (demand, PV, house, battery, grid connection and controller)
+    simulated in one mosaik simulator.
+
+    This is the topology of scenario_hi2.py, but instead of one mosaik
+    simulator per model the models are stepped in-process and pass their
+    values directly, which removes the scheduling and data exchange between
+    the simulators at every step. Each step follows the order mosaik uses for
+    the scenario: demand and PV, house and battery (with the controller
+    setpoints of the previous step), grid, controller.
+
+    All outputs the scenario collects are attributes of the Household entity,
+    connect_collector() connects them under the usual collector names.
+
+    The household is closed: the Household entity has no inputs, anything
+    connected to it is ignored. PV and demand always start at the beginning
+    of their series (no phase as in PVModel) and are stepped at every step
+    (no adaptive stepping).
+"""
+
+import os
+import mosaik_api
+from itertools import count
+from dtu_mosaik.util import TSSim, MyBuildingSim, MyBattSim
+from dtu_mosaik.my_grid_sim import MyGridSim
+from dtu_mosaik.signal_cache import load_signal
+from dtu_mosaik.instrumentation import Instrumented
+from dtu_mosaik.table_simulator import TableSimulator
+from mosaik_pyknow_control_house import Control
+
+META = {
+    'models': {
+        'Household': {
+            'public': True,
+            'params': [
+                'demand_scale', 'demand_series', # DemandModel rated_capacity, seriesname
+                'pv_rated_capacity', 'pv_series', # PVModel rated_capacity, series_name
+                'heat_coeff', 'solar_heat_coeff', 'insulation_coeff', # BuildingSim
+                'init_T_int', 'init_T_amb', 'heater_power',
+                'batt_rated_capacity', 'batt_rated_discharge_capacity', # BatteryModel
+                'batt_rated_charge_capacity', 'batt_initial_charge_rel',
+                'batt_charge_change_rate',
+                'V0', 'droop', # SimpleGridModel
+                'setpoint_change_rate', 'T_min', 'T_max', # Control
+            ],
+            'attrs': [
+                'demand_P', # DemandModel P
+                'pv_P', 'pv_zs', # PVModel P, zs
+                'house_P', 'house_T_int', # BuildingSim P, T_int
+                'batt_P', 'batt_SoC', 'batt_relSoC', # BatteryModel P, SoC, relSoC
+                'grid_Pgrid', 'grid_V', # SimpleGridModel Pgrid, V
+                'Pset_heat', 'Pset_batt', # Control Pset_heat, Pset_batt
+            ]
+        },
+    },
+}
+
+# Household attribute -> collector attribute used by scenario_hi2.py
+COLLECTOR_ATTRS = [
+    ('demand_P', 'DemP[kW]'),
+    ('grid_Pgrid', 'GridP[kW]'),
+    ('pv_P', 'SolarP[kW]'),
+    ('house_P', 'Pheat[kW]'),
+    ('house_T_int', 'HouseTemp[C]'),
+    ('batt_P', 'BattP[kW]'),
+    ('batt_SoC', 'BattSoC[kWh]'),
+]
+
+MY_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'dtu_mosaik')
+
+
+def connect_collector(world, household, collector):
+    """
+        Connect the outputs of a Household entity to the collector like
+        scenario_hi2.py connects the separate simulators.
+    """
+    world.connect(household, collector, *COLLECTOR_ATTRS)
+
+
+class _House:
+    # Models and controller setpoints of one household
+    def __init__(self, demand, pv, house, batt, grid, control_eid):
+        self.demand = demand
+        self.pv = pv
+        self.house = house
+        self.batt = batt
+        self.grid = grid
+        self.control_eid = control_eid
+        # Controller outputs, used by house and battery in the next step
+        self.Pset_heat = 0.0
+        self.Pset_batt = 0.0
+
+
+class Household(Instrumented, TableSimulator):
+    ENTITY_NAME = 'Household'
+    GETTERS = {
+        'demand_P': '-esim.demand.get_val()',
+        'pv_P': 'esim.pv.get_val()',
+        'pv_zs': 'esim.pv.get_val_nomax()/esim.pv.mult',
+        'house_P': '-esim.house.P', # Note sign change to meet grid convention
+        'house_T_int': 'esim.house.T_int',
+        'batt_P': 'esim.batt.P',
+        'batt_SoC': 'esim.batt.SoC',
+        'batt_relSoC': 'esim.batt.relSoC',
+        'grid_Pgrid': 'esim.grid.Pgrid',
+        'grid_V': 'esim.grid.V',
+        'Pset_heat': 'esim.Pset_heat',
+        'Pset_batt': 'esim.Pset_batt',
+    }
+
+    def __init__(self, META=META):
+        super().__init__(META)
+
+        # Per-entity dicts
+        self.eid_counters = {}
+        self.simulators = {}
+        self.entityparams = {}
+
+    def init(self, sid, step_size=5, eid_prefix="Household", storefilename=None,
+             solver='geometric', batt_solver='closed', control_mode='compiled'):
+        self.step_size = step_size
+        self.eid_prefix = eid_prefix
+        self.solver = solver # See MyBuildingSim.SOLVERS
+        self.batt_solver = batt_solver # See MyBattSim
+        if storefilename is None:
+            # Load default signal store
+            self.storefilename = os.path.join(MY_DIR, 'signals.h5')
+        else:
+            self.storefilename = storefilename
+        # All controllers are entities of one in-process Control simulator
+        self.control = Control()
+        self.control.init(sid + '.control', step_size=step_size, mode=control_mode)
+        return self.meta
+
+    def create(
+            self, num, model,
+            demand_scale=1, demand_series='/flexhouse_20180219',
+            pv_rated_capacity=1.0, pv_series='/PV715_20180730',
+            heat_coeff=30, solar_heat_coeff=1.10, insulation_coeff=0.60,
+            init_T_int=20, init_T_amb=16, heater_power=5,
+            batt_rated_capacity=20, batt_rated_discharge_capacity=5,
+            batt_rated_charge_capacity=5, batt_initial_charge_rel=0.5,
+            batt_charge_change_rate=0.90,
+            V0=240, droop=0.1,
+            setpoint_change_rate=0.9, T_min=18, T_max=22):
+        counter = self.eid_counters.setdefault(model, count())
+        entities = []
+
+        demand_signal = load_signal(self.storefilename, demand_series)
+        pv_signal = load_signal(self.storefilename, pv_series)
+        controls = self.control.create(
+            num, 'Control',
+            setpoint_change_rate=setpoint_change_rate,
+            T_min=T_min,
+            T_max=T_max,
+            P_max=heater_power,
+            batt_storage_capacity=batt_rated_capacity,
+            rated_discharge_capacity=batt_rated_discharge_capacity,
+            rated_charge_capacity=batt_rated_charge_capacity)
+
+        for control in controls:
+            eid = '%s_%s' % (self.eid_prefix, next(counter))
+
+            esim = _House(
+                demand=TSSim(demand_scale, demand_signal),
+                pv=TSSim(pv_rated_capacity, pv_signal),
+                house=MyBuildingSim(
+                    heat_coeff=heat_coeff,
+                    solar_heat_coeff=solar_heat_coeff,
+                    insulation_coeff=insulation_coeff,
+                    init_T_int=init_T_int,
+                    init_T_amb=init_T_amb,
+                    heater_power=heater_power,
+                    dt=float(self.step_size)/3600,
+                    solver=self.solver),
+                batt=MyBattSim(
+                    rated_capacity=batt_rated_capacity,
+                    rated_discharge_capacity=batt_rated_discharge_capacity,
+                    rated_charge_capacity=batt_rated_charge_capacity,
+                    initial_charge_rel=batt_initial_charge_rel,
+                    charge_change_rate=batt_charge_change_rate,
+                    solver=self.batt_solver),
+                grid=MyGridSim(V0=V0, droop=droop),
+                control_eid=control['eid'])
+            self.simulators[eid] = esim
+
+            entities.append({'eid': eid, 'type': model})
+
+        return entities
+
+    ###
+    #  Functions used online
+    ###
+
+    def step(self, time, inputs):
+        control_inputs = {}
+        for eid, esim in self.simulators.items():
+            esim.demand.calc_val(time)
+            esim.pv.calc_val(time)
+            zs = esim.pv.get_val_nomax()/esim.pv.mult
+
+            # House and battery use the controller setpoints of the last step
+            house = esim.house
+            house.P = -esim.Pset_heat
+            house.zs = zs
+            house.calc_val(time)
+
+            batt = esim.batt
+            batt.Pset = esim.Pset_batt
+            batt.calc_val(time)
+
+            grid = esim.grid
+            grid.P = {
+                'demand': -esim.demand.get_val(),
+                'pv': esim.pv.get_val(),
+                'batt': batt.P,
+                'house': -house.P}
+            grid.calc_val(time)
+
+            control_inputs[esim.control_eid] = {
+                'zs': {eid: zs},
+                'Pgrid': {eid: grid.Pgrid},
+                'T': {eid: house.T_int},
+                'SOC': {eid: batt.relSoC}}
+
+        self.control.step(time, control_inputs)
+        setpoints = self.control.get_data(dict(
+            (control_eid, ['Pset_heat', 'Pset_batt']) for control_eid in control_inputs))
+        for esim in self.simulators.values():
+            data = setpoints[esim.control_eid]
+            esim.Pset_heat = data['Pset_heat']
+            esim.Pset_batt = data['Pset_batt']
+
+        return time + self.step_size
+
+if __name__ == '__main__':
+    mosaik_api.start_simulation(Household())
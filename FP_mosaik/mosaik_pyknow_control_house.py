@@ -3,11 +3,19 @@
 """
 
 import mosaik_api
+import logging
+import numpy as np
 from itertools import count
-from statistics import mean
 from pyknow import Fact, MATCH, AS, KnowledgeEngine, Rule, TEST, NOT, W
+from rule_compiler import compile_rules, RuleCompileError
+from engine_util import CountingEngine, run_engine, input_fields, DecisionCache
+from dtu_mosaik.instrumentation import Instrumented
+from dtu_mosaik.table_simulator import TableSimulator
+from dtu_mosaik.input_reduction import reduce_mean
 import json
 
+logger = logging.getLogger(__name__)
+
 META = {
     'models': {
         'Control': {
@@ -44,6 +52,30 @@ def print_engine(e):
     else : 
         print("    activations: " + "NO_ACTIVATIONS")
 
+def batch_rules(T, T_min, P_max, heating, Pset_heat, SOC, Pgrid, newPset_batt):
+    '''
+        Vectorized equivalent of running Control.ControlEngine once per entity.
+        All arguments are arrays over the entities, heating is boolean.
+        Returns the arrays newPset_heat, heating, newPset_batt.
+        Keep in sync with the rules of Control.ControlEngine.
+    '''
+    # _high_temp, _low_temp and _heating1..4
+    warm = T >= T_min + 0.1
+    cold = T < T_min + 0.1
+    newPset_heat = np.where(heating,
+            np.where(warm, 0.0, -0.7*P_max + (1-0.7)*Pset_heat),
+            np.where(cold, -0.1*P_max + (1-0.1)*Pset_heat, 0.0))
+    heating = np.where(heating, ~warm, cold)
+
+    # _SOCok, _SOCbad, _socokout, _socokout1 and _socbadout,
+    # the previous battery setpoint is kept if none of them fires
+    socok = (SOC < 0.9) & (SOC > 0.1)
+    socbad = (SOC >= 0.9) | (SOC <= 0.1)
+    newPset_batt = np.where(socok,
+            np.where(Pgrid <= 0, -0.5, np.where((Pgrid > 0) & (SOC > 0.2), 0.4, newPset_batt)),
+            np.where(socbad, 0.0, newPset_batt))
+    return newPset_heat, heating, newPset_batt
+
 class Input(Fact):
     '''accepts any dict of input variables'''
     def retrieve(self):
@@ -59,10 +91,15 @@ class State(Fact):
     def retrieve(self):
         return self.as_dict()
 
-class Control(mosaik_api.Simulator):
+class Control(Instrumented, TableSimulator):
+    ENTITY_NAME = 'Control'
+    GETTERS = dict((attr, 'esim[{0!r}]'.format(attr)) for attr in ('Pgrid', 'Pset_heat', 'Pset_batt', 'T', 'SOC'))
+    # zs is only in the state after the first input
+    GETTERS['zs'] = "esim.get('zs', 0)"
+    FLEET_GETTERS = dict((attr, 'fleet[{0!r}]'.format(attr)) for attr in ('Pgrid', 'Pset_heat', 'Pset_batt', 'T', 'SOC', 'zs'))
 
     
-    class ControlEngine(KnowledgeEngine):
+    class ControlEngine(CountingEngine):
         def __init__(self):
             super().__init__()
             self.returnv={}
@@ -176,11 +213,40 @@ class Control(mosaik_api.Simulator):
         self.entityparams = {}
         # for engine:
         self.engine = self.ControlEngine()
+        # Number of rules fired by the engines in the last step, always 0
+        # in the modes 'compiled' and 'batched' which run no engine
+        self.rule_firings = 0
 
-    def init(self, sid, step_size=5, eid_prefix="ControlE", verbose=False):
+    def init(self, sid, step_size=5, eid_prefix="ControlE", verbose=False, mode='compiled', deadband=None):
         self.step_size = step_size
         self.eid_prefix = eid_prefix
         self.verbose = verbose
+        # 'compiled': run the ControlEngine rules compiled to a Python
+        #   function per entity, falls back to 'pyknow' if the rules
+        #   cannot be compiled
+        # 'pyknow': run the ControlEngine per entity (reference)
+        # 'batched': evaluate batch_rules for all entities at once, the entity
+        #   state is then kept in the arrays of self.batch and
+        #   self.simulators maps eid -> index into these arrays
+        if mode not in ('compiled', 'pyknow', 'batched'):
+            raise ValueError("Unknown mode {0}.".format(mode))
+        if mode == 'compiled':
+            try:
+                self.decide = compile_rules(self.ControlEngine, Input)
+            except RuleCompileError as e:
+                logger.warning("Cannot compile the ControlEngine rules, using pyknow: %s", e)
+                mode = 'pyknow'
+        # deadband: dict input -> quantum (e.g. {'T': 0.05, 'SOC': 0.01, 'Pset_heat': 0.05}),
+        #   the rules are only run for inputs that changed beyond it and
+        #   otherwise the cached rule outputs are used. With an empty dict
+        #   the rules are only run if an input they match on changed.
+        self.cache = None
+        if deadband is not None:
+            if mode == 'batched':
+                raise ValueError("A deadband is not supported in mode 'batched'.")
+            self.cache = DecisionCache(input_fields(self.ControlEngine, Input), deadband)
+        self.mode = mode
+        self.batch = {}
         return self.meta
 
     def create(
@@ -214,6 +280,12 @@ class Control(mosaik_api.Simulator):
                     'P_disc_batt': rated_discharge_capacity,
                     'P_char_batt': rated_charge_capacity                
             }
+            if self.mode == 'batched':
+                esim['newPset_heat'] = 0
+                esim['zs'] = 0
+                for key, val in esim.items():
+                    self.batch[key] = np.append(self.batch.get(key, np.zeros(0, dtype=bool if type(val) is bool else float)), val)
+                esim = len(self.batch['T']) - 1
             self.simulators[eid] = esim
             #self.engine.set_return({})
             entities.append({'eid': eid, 'type': model})
@@ -225,6 +297,10 @@ class Control(mosaik_api.Simulator):
     ###
 
     def step(self, time, inputs):
+        if self.mode == 'batched':
+            return self._step_batched(time, inputs)
+
+        fired = self.engine.fired
         for eid, esim in self.simulators.items():
             # first collect updated inputs
             data = inputs.get(eid, {})
@@ -233,33 +309,29 @@ class Control(mosaik_api.Simulator):
                 if attr == 'Pgrid':
                     # If multiple sources send a measurement,
                     # use the mean
-                    esim['Pgrid'] = mean(incoming.values())
+                    esim['Pgrid'] = reduce_mean(incoming)
                 elif attr == 'T':
-                    esim['T'] = mean(incoming.values())
+                    esim['T'] = reduce_mean(incoming)
                 elif attr == 'SOC':
-                    esim['SOC'] = mean(incoming.values())
+                    esim['SOC'] = reduce_mean(incoming)
                 elif attr == 'zs':
-                    esim['zs'] = mean(incoming.values())
+                    esim['zs'] = reduce_mean(incoming)
                 else:
                     raise RuntimeError("Controller {0} has no input {1}.".format(eid, attr))
                     
 
             # Calculate new setpoint & heating 
             # --> pass input & state variables (esim) to ControlEngine
-            ce = self.engine
-            ce.reset()
-            ce.declare(Input(**esim))
-            ce.returnv={}
-            
-            ###############################################################
-            # Here the decision "if-statements" were moved to PyKnow Engine #         
-            ###############################################################
-            
-            # run the engine with new inputs
-            ce.run()
+            if self.cache is None:
+                returnv = self._run_rules(eid, esim)
+            else:
+                returnv = self.cache.get(eid, esim)
+                if returnv is None:
+                    returnv = self._run_rules(eid, esim)
+                    self.cache.put(eid, esim, returnv)
 
             # update (all results from engine delivered in returnvaluedict)
-            esim.update([(key, ce.returnv[key]) for key in ce.returnv.keys()])
+            esim.update(returnv)
             
             #low-pass filter on setpoint update: first on heat
             newPset = esim['newPset_heat'] 
@@ -274,26 +346,43 @@ class Control(mosaik_api.Simulator):
             Pset = r*newPset + (1-r)*Pset
             esim['Pset_batt'] = Pset
 
+        self.rule_firings = self.engine.fired - fired
+        if self.verbose: print("Rules fired: {0}".format(self.rule_firings))
         return time + self.step_size
 
-    def get_data(self, outputs):
-        data = {}
-        for eid, esim in self.simulators.items():
-            requests = outputs.get(eid, [])
-            mydata = {}
-            for attr in requests:
-                if attr == 'Pgrid':
-                    mydata[attr] = esim['Pgrid']
-                elif attr == 'Pset_heat':
-                    mydata[attr] = esim['Pset_heat']
-                elif attr == 'Pset_batt':
-                    mydata[attr] = esim['Pset_batt']
-                elif attr == 'T':
-                    mydata[attr] = esim['T']
+    def _run_rules(self, eid, esim):
+        # Run the ControlEngine rules on the inputs and state esim of entity
+        # eid, returns the dict of the outputs of the rules
+        if self.mode == 'compiled':
+            return self.decide(esim, returnv={}).returnv
+        return run_engine(self.engine, Input(**esim))
+
+    def _step_batched(self, time, inputs):
+        b = self.batch
+        for eid, data in inputs.items():
+            i = self.simulators[eid]
+            for attr, incoming in data.items():
+                if self.verbose: print("Incoming data:{0}".format(incoming))
+                if attr in ('Pgrid', 'T', 'SOC', 'zs'):
+                    b[attr][i] = reduce_mean(incoming)
                 else:
-                    raise RuntimeError("Control {0} has no attribute {1}.".format(eid, attr))
-            data[eid] = mydata
-        return data
+                    raise RuntimeError("Controller {0} has no input {1}.".format(eid, attr))
+
+        b['newPset_heat'], b['heating'], b['newPset_batt'] = batch_rules(
+                b['T'], b['T_min'], b['P_max'], b['heating'],
+                b['Pset_heat'], b['SOC'], b['Pgrid'], b['newPset_batt'])
+
+        # low-pass filter on the heat and battery setpoints
+        r = b['rate']
+        b['Pset_heat'] = r*b['newPset_heat'] + (1-r)*b['Pset_heat']
+        b['Pset_batt'] = r*b['newPset_batt'] + (1-r)*b['Pset_batt']
+
+        self.rule_firings = 0
+        return time + self.step_size
+
+    def get_fleet(self):
+        # In mode 'batched' the arrays of self.batch back all entities
+        return self.batch if self.mode == 'batched' else None
 
 if __name__ == '__main__':
     # mosaik_api.start_simulation(ControlSim())
@@ -323,4 +412,3 @@ if __name__ == '__main__':
     print(json.dumps(testengine.returnv, indent=4, sort_keys=False))
     #testengine.get_return('PSet_batt')
     print_engine(testengine)
-
@@ -0,0 +1,349 @@
+"""
+    Compiles the rules of a pyknow KnowledgeEngine class into a plain Python
+    decision function, so that a controller does not need to reset and run a
+    RETE engine for every entity and time step.
+
+    The compiled function evaluates the rules level by level in decreasing
+    salience. This is equivalent to running the engine as long as the rule set
+    is stratified: a rule may only match (or NOT match) derived facts which are
+    declared by rules of strictly higher salience. Within one salience level
+    the rules fire with the newest facts first, like pyknow's default strategy.
+
+    Supported rule constructs: patterns on Fact classes with literal, W() and
+    MATCH.* fields, AS.x << Fact(...), NOT(pattern), TEST(function) and actions
+    which only call self.declare(FactClass(...)). Anything else raises a
+    RuleCompileError, the caller should then use the engine itself.
+"""
+
+import ast
+import inspect
+import textwrap
+from operator import itemgetter
+from pyknow import Fact, Rule, NOT, TEST, W, L
+
+
+class RuleCompileError(Exception):
+    pass
+
+
+def _is_special(key):
+    return isinstance(key, str) and key.startswith('__') and key.endswith('__')
+
+def _fact_key(fact):
+    return (fact.__class__, frozenset((k, v) for k, v in fact.items() if not _is_special(k)))
+
+
+class RuleRecorder:
+    def __init__(self, attrs):
+        """
+            Stands in for the engine (self) in the rule actions of a compiled
+            rule set: keeps the declared facts and the engine attributes
+            passed to the decision function (e.g. returnv).
+        """
+        self.__dict__.update(attrs)
+        self.facts = {} # fact class -> [(factid, fact)]
+        self._keys = set()
+        self._last_id = 1 # 0 is the initial fact, 1 the input fact
+
+    def declare(self, fact):
+        key = _fact_key(fact)
+        if key in self._keys:
+            return # duplicate facts are ignored, as in the engine
+        self._keys.add(key)
+        self._last_id += 1
+        self.facts.setdefault(fact.__class__, []).append((self._last_id, fact))
+
+
+def _get_rules(engine_class):
+    # Rules in order of definition, subclasses may override rules of their bases
+    rules = {}
+    for cls in reversed(engine_class.__mro__):
+        for name, member in vars(cls).items():
+            if isinstance(member, Rule):
+                rules.pop(name, None)
+                rules[name] = member
+    return rules
+
+def _declared_classes(name, function):
+    """
+        Return the Fact classes declared by the action of a rule.
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(function)))
+    except (OSError, TypeError, SyntaxError) as e:
+        raise RuleCompileError("Cannot read the action of rule {0}: {1}".format(name, e))
+
+    classes = set()
+    for node in ast.walk(tree.body[0]):
+        if isinstance(node, ast.Attribute) and node.attr in ('retract', 'modify', 'duplicate', 'halt', 'run', 'reset'):
+            raise RuleCompileError("Rule {0} calls self.{1}(), only self.declare() is supported.".format(name, node.attr))
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'declare'):
+            continue
+        args = node.args
+        if not (len(args) == 1 and isinstance(args[0], ast.Call) and isinstance(args[0].func, ast.Name)):
+            raise RuleCompileError("Rule {0} must declare facts as self.declare(FactClass(...)).".format(name))
+        cls = function.__globals__.get(args[0].func.id)
+        if not (isinstance(cls, type) and issubclass(cls, Fact)):
+            raise RuleCompileError("Rule {0} declares {1}, which is not a Fact class.".format(name, args[0].func.id))
+        classes.add(cls)
+    return classes
+
+
+class _Emitter:
+    def __init__(self):
+        self.lines = []
+        self.consts = {} # name in generated code -> object
+        self.indent = 1
+
+    def emit(self, line):
+        self.lines.append('    '*self.indent + line)
+
+    def const(self, obj, prefix):
+        for name, val in self.consts.items():
+            if val is obj:
+                return name
+        name = '{0}{1}'.format(prefix, len(self.consts))
+        self.consts[name] = obj
+        return name
+
+
+class _RuleCompiler:
+    def __init__(self, engine_class, input_class):
+        self.engine_class = engine_class
+        self.input_class = input_class
+        self.rules = []
+        for name, rule in _get_rules(engine_class).items():
+            self.rules.append(self._parse_rule(name, rule))
+        self.derived = set()
+        for r in self.rules:
+            self.derived |= r['declares']
+        if input_class in self.derived:
+            raise RuleCompileError("Rules must not declare {0} facts.".format(input_class.__name__))
+        self._check_strata()
+
+    def _parse_rule(self, name, rule):
+        function = rule._wrapped
+        if function is None:
+            raise RuleCompileError("Rule {0} has no action.".format(name))
+        positive, negative, tests = [], [], []
+        for ce in rule:
+            if isinstance(ce, NOT):
+                if len(ce) != 1 or not isinstance(ce[0], Fact):
+                    raise RuleCompileError("Rule {0}: only NOT(single pattern) is supported.".format(name))
+                negative.append(self._parse_pattern(name, ce[0]))
+            elif isinstance(ce, TEST):
+                tests.append(ce[0])
+            elif isinstance(ce, Fact):
+                positive.append(self._parse_pattern(name, ce))
+            else:
+                raise RuleCompileError("Rule {0}: {1} is not supported.".format(name, ce.__class__.__name__))
+        if not positive:
+            raise RuleCompileError("Rule {0} must match at least one fact.".format(name))
+        return {
+            'name': name,
+            'salience': rule.salience,
+            'function': function,
+            'params': list(inspect.signature(function).parameters)[1:],
+            'positive': positive,
+            'negative': negative,
+            'tests': tests,
+            'declares': _declared_classes(name, function),
+        }
+
+    def _parse_pattern(self, name, pattern):
+        fields = []
+        for key, value in pattern.items():
+            if _is_special(key):
+                continue
+            if not isinstance(key, str):
+                raise RuleCompileError("Rule {0}: positional fields are not supported.".format(name))
+            if isinstance(value, W):
+                fields.append((key, 'bind', value.__bind__))
+            elif isinstance(value, L):
+                if value.__bind__ is not None:
+                    raise RuleCompileError("Rule {0}: bound literals are not supported.".format(name))
+                fields.append((key, 'literal', value.value))
+            elif hasattr(value, '__bind__') or isinstance(value, (list, dict, set)):
+                raise RuleCompileError("Rule {0}: field constraint {1} is not supported.".format(name, value))
+            else:
+                fields.append((key, 'literal', value))
+        return {'cls': pattern.__class__, 'fields': fields, 'bind': getattr(pattern, '__bind__', None)}
+
+    def _check_strata(self):
+        for r in self.rules:
+            for p in r['positive'] + r['negative']:
+                cls = p['cls']
+                if cls is self.input_class:
+                    continue
+                if cls not in self.derived:
+                    raise RuleCompileError("Rule {0} matches {1} facts, which are neither the input nor declared by a rule.".format(r['name'], cls.__name__))
+                for producer in self.rules:
+                    if cls in producer['declares'] and producer['salience'] <= r['salience']:
+                        raise RuleCompileError(
+                            "Rule {0} (salience {1}) matches {2} facts declared by rule {3} (salience {4}), "
+                            "producers need a strictly higher salience.".format(
+                                r['name'], r['salience'], cls.__name__, producer['name'], producer['salience']))
+
+    def _emit_fields(self, em, fields, var, bound, local=None):
+        """
+            Emit the conditions of pattern fields on the fact in var.
+            New bindings are added to bound (or only to local, for NOT).
+            Returns the list of conditions.
+        """
+        conds = []
+        for key, kind, val in fields:
+            conds.append('{0!r} in {1}'.format(key, var))
+            if kind == 'literal':
+                conds.append('{0}[{1!r}] == {2}'.format(var, key, em.const(val, '_lit')))
+            elif val is None:
+                pass
+            elif val in bound:
+                conds.append('{0}[{1!r}] == {2}'.format(var, key, bound[val]))
+            elif local is not None:
+                if val in local:
+                    conds.append('{0}[{1!r}] == {2}'.format(var, key, local[val]))
+                else:
+                    local[val] = '{0}[{1!r}]'.format(var, key)
+            else:
+                bound[val] = '{0}[{1!r}]'.format(var, key)
+        return conds
+
+    def _emit_rule(self, em, r, nr, use_acts):
+        start = em.indent
+        bound = {}
+        ids = []
+        for np_, p in enumerate(r['positive']):
+            if p['cls'] is self.input_class:
+                var = 'inp'
+                if p['bind'] is not None:
+                    bound[p['bind']] = 'inpf'
+                ids.append('1')
+            else:
+                var = '_f{0}'.format(np_)
+                idvar = '_id{0}'.format(np_)
+                em.emit('for {0}, {1} in reversed(facts.get({2}, ())):'.format(
+                    idvar, var, em.const(p['cls'], '_cls')))
+                em.indent += 1
+                if p['bind'] is not None:
+                    bound[p['bind']] = var
+                ids.append(idvar)
+            # Conditions use the values of the matched fact
+            conds = self._emit_fields(em, p['fields'], var, bound)
+            if conds:
+                em.emit('if {0}:'.format(' and '.join(conds)))
+                em.indent += 1
+        for p in r['negative']:
+            if p['cls'] is self.input_class:
+                conds = self._emit_fields(em, p['fields'], 'inp', bound, local={})
+                em.emit('if not ({0}):'.format(' and '.join(conds) or 'True'))
+                em.indent += 1
+            else:
+                conds = self._emit_fields(em, p['fields'], '_n', bound, local={})
+                em.emit('if not any({0} for _i, _n in facts.get({1}, ())):'.format(
+                    ' and '.join(conds) or 'True', em.const(p['cls'], '_cls')))
+                em.indent += 1
+        for test in r['tests']:
+            params = inspect.signature(test).parameters
+            for param in params:
+                if param not in bound:
+                    raise RuleCompileError("Rule {0}: TEST uses {1}, which is not bound.".format(r['name'], param))
+            em.emit('if {0}({1}):'.format(em.const(test, '_test'),
+                ', '.join('{0}={1}'.format(param, bound[param]) for param in params)))
+            em.indent += 1
+
+        for param in r['params']:
+            if param not in bound:
+                raise RuleCompileError("Rule {0}: action argument {1} is not bound.".format(r['name'], param))
+        args = ', '.join(['rec'] + ['{0}={1}'.format(param, bound[param]) for param in r['params']])
+        action = em.const(r['function'], '_action')
+        if use_acts:
+            key = '({0},)'.format(', '.join(ids)) if len(ids) == 1 else \
+                'tuple(sorted(({0}), reverse=True))'.format(', '.join(ids))
+            em.emit('acts.append(({0}, {1}, {2}, dict({3})))'.format(
+                key, nr, action, ', '.join('{0}={1}'.format(param, bound[param]) for param in r['params'])))
+        else:
+            em.emit('{0}({1})'.format(action, args))
+        em.indent = start
+
+    def compile(self):
+        em = _Emitter()
+        em.emit('rec = _Recorder(attrs)')
+        em.emit('facts = rec.facts')
+        if any(p['bind'] is not None and p['cls'] is self.input_class
+               for r in self.rules for p in r['positive']):
+            em.emit('inpf = {0}(**inp)'.format(em.const(self.input_class, '_cls')))
+
+        for salience in sorted(set(r['salience'] for r in self.rules), reverse=True):
+            level = [(nr, r) for nr, r in enumerate(self.rules) if r['salience'] == salience]
+            em.emit('# salience {0}: {1}'.format(salience, ', '.join(r['name'] for _, r in level)))
+            # Rules on the input fact only all have the same activation key,
+            # they fire in order of definition and need no agenda
+            use_acts = len(level) > 1 and any(p['cls'] is not self.input_class
+                                              for _, r in level for p in r['positive'])
+            if use_acts:
+                em.emit('acts = []')
+            for nr, r in level:
+                self._emit_rule(em, r, nr, use_acts)
+            if use_acts:
+                # Newest facts first, ties in order of definition
+                em.emit('acts.sort(key=_key, reverse=True)')
+                em.emit('for _k, _nr, action, kwargs in acts:')
+                em.emit('    action(rec, **kwargs)')
+        em.emit('return rec')
+
+        source = 'def decide(inp, **attrs):\n' + '\n'.join(em.lines) + '\n'
+        namespace = dict(em.consts, _Recorder=RuleRecorder, _key=itemgetter(0))
+        exec(compile(source, '<rules of {0}>'.format(self.engine_class.__qualname__), 'exec'), namespace)
+        decide = namespace['decide']
+        decide.source = source
+        return decide
+
+
+def compile_rules(engine_class, input_class):
+    """
+        Compile the rules of engine_class into a function decide(inp, **attrs).
+        @input:
+            engine_class: KnowledgeEngine subclass with the rules
+            input_class: Fact class of the input fact, the only fact which is
+                not declared by the rules
+        @return: decide(inp, **attrs) runs the rules on a dict inp of input
+            values. attrs are set as attributes of the returned RuleRecorder,
+            which the rule actions use instead of the engine (e.g. returnv={}).
+            The generated source is available as decide.source.
+    """
+    return _RuleCompiler(engine_class, input_class).compile()
+
+
+def differential_test(engine_class, input_class, decide, inputs, attrs=dict):
+    """
+        Run engine_class and the compiled decide on each dict of inputs and
+        compare the declared facts and the engine attributes.
+        @input:
+            attrs: function returning a fresh dict of engine attributes,
+                e.g. lambda: {'returnv': {}}
+        @return: list of (input, engine result, compiled result) which differ
+    """
+    derived = set()
+    for name, rule in _get_rules(engine_class).items():
+        derived |= _declared_classes(name, rule._wrapped)
+
+    mismatches = []
+    for inp in inputs:
+        engine = engine_class()
+        engine.reset()
+        engine.declare(input_class(**inp))
+        engine_attrs = attrs()
+        for key, val in engine_attrs.items():
+            setattr(engine, key, val)
+        engine.run()
+        expected = (
+            set(_fact_key(f) for f in engine.facts.values() if f.__class__ in derived),
+            dict((key, getattr(engine, key)) for key in engine_attrs))
+
+        rec = decide(inp, **attrs())
+        got = (
+            set(_fact_key(f) for facts in rec.facts.values() for _, f in facts),
+            dict((key, getattr(rec, key)) for key in engine_attrs))
+        if expected != got:
+            mismatches.append((inp, expected, got))
+    return mismatches
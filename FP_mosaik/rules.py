@@ -11,11 +11,19 @@ Created on Thu Nov 22 14:57:53 2018
 """
 
 import mosaik_api
+import logging
+from math import ceil
 from itertools import count
-from statistics import mean
 from pyknow import Fact, MATCH, AS, KnowledgeEngine, Rule, TEST, NOT, W
+from engine_util import CountingEngine, run_engine, input_fields, DecisionCache
+from dtu_mosaik.instrumentation import Instrumented
+from dtu_mosaik.input_reduction import reduce_mean
 import json
 
+# Tracing of the rules and the simulator, configured by the application,
+# e.g. logging.basicConfig(level=logging.DEBUG) for all messages
+logger = logging.getLogger(__name__)
+
 META = {
     'models': {
         'ManageApp': {
@@ -76,10 +84,10 @@ class State(Fact):
     def retrieve(self):
         return self.as_dict()
 
-class ManageApp(mosaik_api.Simulator):
+class ManageApp(Instrumented, mosaik_api.Simulator):
 
     
-    class ControlEngine(KnowledgeEngine):
+    class ControlEngine(CountingEngine):
         def __init__(self):
             super().__init__()
             self.returnv={}
@@ -97,11 +105,7 @@ class ManageApp(mosaik_api.Simulator):
         def _time_for_coffee(self, time):
             
             self.declare(Output(coffee_on = True))
-            print('something happened at %d' %time)
-
-        @Rule(Input(time = MATCH.time))
-        def _print_time(self, time):
-            print(time)
+            logger.info('something happened at %d', time)
 
         #### RULES FOR COFFEE MACHINE ####
         
@@ -132,11 +136,28 @@ class ManageApp(mosaik_api.Simulator):
         self.entityparams = {}
         # for engine:
         self.engine = self.ControlEngine()
+        # Number of rules fired by the engine in the last step
+        self.rule_firings = 0
 
-    def init(self, sid, step_size=5, eid_prefix="Rules", verbose=False):
+    def init(self, sid, step_size=5, eid_prefix="Rules", verbose=False, deadband=None,
+             event_driven=False, time_unit=60, max_step=3600):
         self.step_size = step_size
         self.eid_prefix = eid_prefix
-        self.verbose = verbose
+        self.verbose = verbose # Unused, the messages go to logger
+        # event_driven: instead of every step_size, step again at the next
+        #   coffee_time, at the latest after max_step to pick up new inputs.
+        #   time_unit is the simulation time [s] per unit of the time input
+        #   (the ClockModel counts minutes)
+        self.event_driven = event_driven
+        self.time_unit = time_unit
+        self.max_step = max_step
+        # deadband: dict input -> quantum, the rules are only run for inputs
+        #   that changed beyond it and otherwise the cached rule outputs are
+        #   used (rule actions like logging are then skipped as well). With
+        #   an empty dict the rules are only run if an input they match on changed.
+        self.cache = None
+        if deadband is not None:
+            self.cache = DecisionCache(input_fields(self.ControlEngine, Input), deadband)
         return self.meta
 
     def create(
@@ -184,41 +205,39 @@ class ManageApp(mosaik_api.Simulator):
     ###
 
     def step(self, time, inputs):
+        debug = logger.isEnabledFor(logging.DEBUG)
+        fired = self.engine.fired
         for eid, esim in self.simulators.items():
             # first collect updated inputs
             data = inputs.get(eid, {})
             for attr, incoming in data.items():
-                if self.verbose: print("Incoming data:{0}".format(incoming))
+                if debug: logger.debug("Incoming data:%s", incoming)
                 if attr == 'coffee_time':
                     # If multiple sources send a measurement,
                     # use the mean
-                    esim['coffee_time'] = mean(incoming.values())
+                    esim['coffee_time'] = reduce_mean(incoming)
                 elif attr == 'coffee_on':
-                    esim['coffee_on'] = mean(incoming.values())
+                    esim['coffee_on'] = reduce_mean(incoming)
                 elif attr == 'time':
-                    esim['time'] = mean(incoming.values())
+                    esim['time'] = reduce_mean(incoming)
                 #elif attr == 'zs':
-                #    esim['zs'] = mean(incoming.values())
+                #    esim['zs'] = reduce_mean(incoming)
                 else:
                     raise RuntimeError("Controller {0} has no input {1}.".format(eid, attr))
                     
 
             # Calculate new setpoint & heating 
             # --> pass input & state variables (esim) to ControlEngine
-            ce = self.engine
-            ce.reset()
-            ce.declare(Input(**esim))
-            ce.returnv={}
-            
-            ###############################################################
-            # Here the decision "if-statements" were moved to PyKnow Engine #         
-            ###############################################################
-            
-            # run the engine with new inputs
-            ce.run()
+            if self.cache is None:
+                returnv = run_engine(self.engine, Input(**esim))
+            else:
+                returnv = self.cache.get(eid, esim)
+                if returnv is None:
+                    returnv = run_engine(self.engine, Input(**esim))
+                    self.cache.put(eid, esim, returnv)
 
             # update (all results from engine delivered in returnvaluedict)
-            esim.update([(key, ce.returnv[key]) for key in ce.returnv.keys()])
+            esim.update(returnv)
             
             #low-pass filter on setpoint update: first on heat
             #newPset = esim['newPset_heat'] 
@@ -233,8 +252,25 @@ class ManageApp(mosaik_api.Simulator):
             #Pset = r*newPset + (1-r)*Pset
             #esim['Pset_batt'] = Pset
 
+            if debug: logger.debug("%s: time %s, coffee_on %s", eid, esim['time'], esim['coffee_on'])
+
+        self.rule_firings = self.engine.fired - fired
+        if debug: logger.debug("Rules fired: %d", self.rule_firings)
+        if self.event_driven:
+            return self._next_event(time)
         return time + self.step_size
 
+    def _next_event(self, time):
+        # Next time at which the rules can give a different output
+        next_time = time + self.max_step
+        for esim in self.simulators.values():
+            if esim['coffee_on']:
+                # Off again at the next tick of the time input
+                next_time = min(next_time, time + self.time_unit)
+            elif esim['time'] < esim['coffee_time']:
+                next_time = min(next_time, time + int(ceil((esim['coffee_time'] - esim['time'])*self.time_unit)))
+        return max(next_time, time + 1)
+
     def get_data(self, outputs):
         data = {}
         for eid, esim in self.simulators.items():
@@ -12,8 +12,6 @@ import mosaik.util
 import pandas as pd
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-plt.rcParams['figure.figsize'] = [10,5]
 data_path = 'temp_files/'
 
 # Dictionary with basic configuration of the simulation
@@ -58,11 +56,6 @@ SIM_CONFIG = {
     },
 }
 
-# quick check if filepath exists
-directory = os.path.dirname(data_path+scenario_name)
-if not os.path.exists(directory):
-    os.makedirs(directory)
-
 change_rate = basic_conf['controller_change_rate']
 
 seasonscale = {'summer': 1, 'winter': 3, 'autumn': 2, 'spring':2}
@@ -202,45 +195,55 @@ def init_entities(
     return sim_dict, entity_dict
 
 
-world = mosaik.World(SIM_CONFIG)
-sim_dict, entity_dict = init_entities(world)
-
-# Connect units to grid busbar
-world.connect(entity_dict['demand1'], entity_dict['grid1'], ('P', 'P'))
-world.connect(entity_dict['pv1'], entity_dict['grid1'], ('P', 'P'))
-world.connect(entity_dict['batt1'], entity_dict['grid1'], ('P', 'P'))
-world.connect(entity_dict['house1'], entity_dict['grid1'], ('P', 'P'))
-
-# Connect PV "sun" to BuildingSim
-world.connect(entity_dict['pv1'], entity_dict['house1'], ('zs', 'zs'))
-
-# Connect units to controlller
-world.connect(entity_dict['pv1'], entity_dict['control1'], ('zs', 'zs'))
-world.connect(entity_dict['grid1'], entity_dict['control1'], ('Pgrid', 'Pgrid'))
-world.connect(entity_dict['house1'], entity_dict['control1'], ('T_int', 'T'))
-world.connect(entity_dict['control1'], entity_dict['house1'], ('Pset_heat', 'Pset'), time_shifted=True,
-                  initial={'Pset_heat': 0.0})
-world.connect(entity_dict['control1'], entity_dict['batt1'], ('Pset_batt', 'Pset'), time_shifted=True,
-                  initial={'Pset_batt': 0.0})
-world.connect(entity_dict['batt1'], entity_dict['control1'], ('relSoC', 'SOC'))
-
-
-# Connect to Collector
-world.connect(entity_dict['demand1'], entity_dict['collector'], ('P', 'DemP[kW]'))
-world.connect(entity_dict['grid1'], entity_dict['collector'], ('Pgrid', 'GridP[kW]'))
-world.connect(entity_dict['pv1'], entity_dict['collector'], ('P', 'SolarP[kW]'))
-world.connect(entity_dict['house1'], entity_dict['collector'], ('P', 'Pheat[kW]'))
-world.connect(entity_dict['house1'], entity_dict['collector'], ('T_int', 'HouseTemp[C]'))
-world.connect(entity_dict['batt1'], entity_dict['collector'], ('P', 'BattP[kW]'))
-world.connect(entity_dict['batt1'], entity_dict['collector'], ('SoC', 'BattSoC[kWh]'))
-
-
-END = 24*60*60-1 # 24 hours, 1 MosaikTime = 1 second
-world.run(END)
-## End of simulation
-
-#%% DISPLAY
-df = pd.HDFStore('temp_files/summer_MINE_data.h5')['timeseries/simulation']
-plt.rcParams['figure.figsize'] = [20,10]
-df.plot(legend=False)
-df.describe()
\ No newline at end of file
+# The scenario runs when this file is executed, its configuration can be
+# imported (see scenario_sweep.py)
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    # quick check if filepath exists
+    directory = os.path.dirname(data_path+scenario_name)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    world = mosaik.World(SIM_CONFIG)
+    sim_dict, entity_dict = init_entities(world)
+
+    # Connect units to grid busbar
+    world.connect(entity_dict['demand1'], entity_dict['grid1'], ('P', 'P'))
+    world.connect(entity_dict['pv1'], entity_dict['grid1'], ('P', 'P'))
+    world.connect(entity_dict['batt1'], entity_dict['grid1'], ('P', 'P'))
+    world.connect(entity_dict['house1'], entity_dict['grid1'], ('P', 'P'))
+
+    # Connect PV "sun" to BuildingSim
+    world.connect(entity_dict['pv1'], entity_dict['house1'], ('zs', 'zs'))
+
+    # Connect units to controlller
+    world.connect(entity_dict['pv1'], entity_dict['control1'], ('zs', 'zs'))
+    world.connect(entity_dict['grid1'], entity_dict['control1'], ('Pgrid', 'Pgrid'))
+    world.connect(entity_dict['house1'], entity_dict['control1'], ('T_int', 'T'))
+    world.connect(entity_dict['control1'], entity_dict['house1'], ('Pset_heat', 'Pset'), time_shifted=True,
+                      initial={'Pset_heat': 0.0})
+    world.connect(entity_dict['control1'], entity_dict['batt1'], ('Pset_batt', 'Pset'), time_shifted=True,
+                      initial={'Pset_batt': 0.0})
+    world.connect(entity_dict['batt1'], entity_dict['control1'], ('relSoC', 'SOC'))
+
+
+    # Connect to Collector
+    world.connect(entity_dict['demand1'], entity_dict['collector'], ('P', 'DemP[kW]'))
+    world.connect(entity_dict['grid1'], entity_dict['collector'], ('Pgrid', 'GridP[kW]'))
+    world.connect(entity_dict['pv1'], entity_dict['collector'], ('P', 'SolarP[kW]'))
+    world.connect(entity_dict['house1'], entity_dict['collector'], ('P', 'Pheat[kW]'))
+    world.connect(entity_dict['house1'], entity_dict['collector'], ('T_int', 'HouseTemp[C]'))
+    world.connect(entity_dict['batt1'], entity_dict['collector'], ('P', 'BattP[kW]'))
+    world.connect(entity_dict['batt1'], entity_dict['collector'], ('SoC', 'BattSoC[kWh]'))
+
+
+    END = 24*60*60-1 # 24 hours, 1 MosaikTime = 1 second
+    world.run(END)
+    ## End of simulation
+
+    #%% DISPLAY
+    df = pd.HDFStore('temp_files/summer_MINE_data.h5')['timeseries/simulation']
+    plt.rcParams['figure.figsize'] = [20,10]
+    df.plot(legend=False)
+    df.describe()
\ No newline at end of file
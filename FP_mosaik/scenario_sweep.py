@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Monte-Carlo / parameter sweep over the household scenario of scenario_hi2.py
+
+    Every combination of a parameter grid is simulated in its own mosaik world.
+    The worlds are independent, so they run in a process pool on all cores.
+    Each run writes its collector data to its own store
+    (<data_path>run_<n>_data.h5) and the sweep writes a summary table with one
+    row per run (<data_path>summary.csv).
+"""
+
+import os
+import sys
+import time as timer
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+import mosaik
+from mosaik_household import connect_collector
+import scenario_hi2
+
+# Simulators of scenario_hi2.py, plus the Household simulator of the fused topology
+SIM_CONFIG = dict(scenario_hi2.SIM_CONFIG, Household={'python': 'mosaik_household:Household'})
+
+# basic_conf of scenario_hi2.py, plus the random seed of the run, the PV
+# series (day) which overrides the choice from weather_base if not None
+# (most of weather_base is not in signals.h5, sweeps have to set either the
+# day or the climate_conditions of days in the store),
+# fused to simulate the household in one simulator (see mosaik_household.py)
+# and adaptive to step PV and demand only when their series change
+basic_conf = dict(scenario_hi2.basic_conf, seed=0, day=None, fused=False, adaptive=False)
+
+DEMAND_SERIES = '/flexhouse_20180219'
+SIGNAL_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dtu_mosaik', 'signals.h5')
+
+seasonscale = scenario_hi2.seasonscale
+ambient_temperatures = scenario_hi2.ambient_temperatures
+weather_base = scenario_hi2.weather_base
+
+
+def pick_day(conf):
+    """
+        PV series of a run: conf['day'] if given, otherwise a day of
+        weather_base[climate_conditions], drawn with conf['seed'] if
+        random_weather is set.
+    """
+    if conf['day'] is not None:
+        return conf['day']
+    days = weather_base[conf['climate_conditions']]
+    if conf['random_weather']:
+        return days[np.random.RandomState(conf['seed']).randint(0, len(days))]
+    return days[0]
+
+def check_series(confs, storefilename=SIGNAL_STORE):
+    """
+        Raise a ValueError if a series used by one of the configurations
+        is not in the signal store.
+    """
+    with pd.HDFStore(storefilename, mode='r') as store:
+        available = set(store.keys())
+    missing = {}
+    for run, conf in enumerate(confs):
+        for series in (pick_day(conf), DEMAND_SERIES):
+            if series not in available:
+                missing.setdefault(series, []).append(run)
+    if missing:
+        raise ValueError("Series not in {0}: {1}. Available: {2}.".format(
+            storefilename,
+            ', '.join('{0} (runs {1})'.format(series, runs) for series, runs in sorted(missing.items())),
+            ', '.join(sorted(available))))
+
+def init_household(world, conf, filename, P_maxH=5):
+    """
+        Start the simulators and entities of the scenario_hi2.py household
+        for the configuration conf and connect them.
+        @return: dict of the entities
+    """
+    if conf['fused']:
+        return init_fused_household(world, conf, filename, P_maxH)
+    entity_dict = {}
+
+    demand_sim = world.start('DemandModel', eid_prefix='demand_', step_size=5, adaptive=conf['adaptive'])
+    entity_dict['demand1'] = demand_sim.DemandModel(
+        rated_capacity=seasonscale[conf['season']], seriesname=DEMAND_SERIES)
+
+    grid_sim = world.start('SimpleGridModel', eid_prefix='grid_', step_size=5)
+    entity_dict['grid1'] = grid_sim.SimpleGridModel(V0=240, droop=0.1)
+
+    pv_sim = world.start('PVModel', eid_prefix='pv_', step_size=5, adaptive=conf['adaptive'])
+    entity_dict['pv1'] = pv_sim.PVModel(rated_capacity=conf['pv1_scaling'], series_name=pick_day(conf))
+
+    house_sim = world.start('HouseModel', eid_prefix='house_', step_size=5)
+    entity_dict['house1'] = house_sim.BuildingSim(
+        init_T_amb=ambient_temperatures[conf['season']],
+        init_T_int=20,
+        heater_power=P_maxH,
+        heat_coeff=30,
+        solar_heat_coeff=1.10,
+        insulation_coeff=0.60)
+
+    batt_sim = world.start('BatteryModel', eid_prefix='batt_', step_size=5)
+    entity_dict['batt1'] = batt_sim.BatteryModel(
+        rated_capacity=conf['batt_storage_capacity'],
+        rated_discharge_capacity=conf['batt_charge_capacity'],
+        rated_charge_capacity=conf['batt_charge_capacity'],
+        initial_charge_rel=0.5,
+        charge_change_rate=0.90)
+
+    control_sim = world.start('HeatControl', eid_prefix='heatcontrol_', step_size=5)
+    entity_dict['control1'] = control_sim.Control(
+        setpoint_change_rate=conf['controller_change_rate'],
+        T_min=conf['lower_temp_limit'],
+        T_max=conf['upper_temp_limit'],
+        P_max=P_maxH,
+        batt_storage_capacity=conf['batt_storage_capacity'],
+        rated_discharge_capacity=conf['batt_charge_capacity'],
+        rated_charge_capacity=conf['batt_charge_capacity'])
+
+    collector_sim = world.start(
+        'CollectorSim',
+        step_size=60,
+        save_h5=True,
+        h5_storename='{}_data.h5'.format(filename),
+        h5_framename='timeseries/simulation',
+        print_results=False)
+    entity_dict['collector'] = collector_sim.Collector()
+
+    # Connect units to grid busbar
+    for unit in ('demand1', 'pv1', 'batt1', 'house1'):
+        world.connect(entity_dict[unit], entity_dict['grid1'], ('P', 'P'))
+    # Connect PV "sun" to BuildingSim
+    world.connect(entity_dict['pv1'], entity_dict['house1'], ('zs', 'zs'))
+    # Connect units to controller
+    world.connect(entity_dict['pv1'], entity_dict['control1'], ('zs', 'zs'))
+    world.connect(entity_dict['grid1'], entity_dict['control1'], ('Pgrid', 'Pgrid'))
+    world.connect(entity_dict['house1'], entity_dict['control1'], ('T_int', 'T'))
+    world.connect(entity_dict['control1'], entity_dict['house1'], ('Pset_heat', 'Pset'), time_shifted=True,
+                  initial={'Pset_heat': 0.0})
+    world.connect(entity_dict['control1'], entity_dict['batt1'], ('Pset_batt', 'Pset'), time_shifted=True,
+                  initial={'Pset_batt': 0.0})
+    world.connect(entity_dict['batt1'], entity_dict['control1'], ('relSoC', 'SOC'))
+    # Connect to Collector
+    world.connect(entity_dict['demand1'], entity_dict['collector'], ('P', 'DemP[kW]'))
+    world.connect(entity_dict['grid1'], entity_dict['collector'], ('Pgrid', 'GridP[kW]'))
+    world.connect(entity_dict['pv1'], entity_dict['collector'], ('P', 'SolarP[kW]'))
+    world.connect(entity_dict['house1'], entity_dict['collector'], ('P', 'Pheat[kW]'))
+    world.connect(entity_dict['house1'], entity_dict['collector'], ('T_int', 'HouseTemp[C]'))
+    world.connect(entity_dict['batt1'], entity_dict['collector'], ('P', 'BattP[kW]'))
+    world.connect(entity_dict['batt1'], entity_dict['collector'], ('SoC', 'BattSoC[kWh]'))
+
+    return entity_dict
+
+def init_fused_household(world, conf, filename, P_maxH=5):
+    """
+        Same as init_household, but with the household in one Household
+        simulator.
+    """
+    entity_dict = {}
+
+    household_sim = world.start('Household', eid_prefix='household_', step_size=5)
+    entity_dict['household1'] = household_sim.Household(
+        demand_scale=seasonscale[conf['season']],
+        demand_series=DEMAND_SERIES,
+        pv_rated_capacity=conf['pv1_scaling'],
+        pv_series=pick_day(conf),
+        heat_coeff=30,
+        solar_heat_coeff=1.10,
+        insulation_coeff=0.60,
+        init_T_int=20,
+        init_T_amb=ambient_temperatures[conf['season']],
+        heater_power=P_maxH,
+        batt_rated_capacity=conf['batt_storage_capacity'],
+        batt_rated_discharge_capacity=conf['batt_charge_capacity'],
+        batt_rated_charge_capacity=conf['batt_charge_capacity'],
+        batt_initial_charge_rel=0.5,
+        batt_charge_change_rate=0.90,
+        V0=240,
+        droop=0.1,
+        setpoint_change_rate=conf['controller_change_rate'],
+        T_min=conf['lower_temp_limit'],
+        T_max=conf['upper_temp_limit'])
+
+    collector_sim = world.start(
+        'CollectorSim',
+        step_size=60,
+        save_h5=True,
+        h5_storename='{}_data.h5'.format(filename),
+        h5_framename='timeseries/simulation',
+        print_results=False)
+    entity_dict['collector'] = collector_sim.Collector()
+
+    connect_collector(world, entity_dict['household1'], entity_dict['collector'])
+
+    return entity_dict
+
+def summarize(df, step_size=60):
+    """
+        Key figures of the collector data df of one run.
+    """
+    data = df.T.groupby(level=1).sum().T # one column per attribute
+    hours = step_size/3600.0
+    grid = data['GridP[kW]']
+    return {
+        'grid_import_kWh': grid.clip(lower=0).sum()*hours,
+        'grid_export_kWh': (-grid).clip(lower=0).sum()*hours,
+        'heat_kWh': data['Pheat[kW]'].abs().sum()*hours,
+        'T_min': data['HouseTemp[C]'].min(),
+        'T_max': data['HouseTemp[C]'].max(),
+        'T_mean': data['HouseTemp[C]'].mean(),
+        'SoC_end_kWh': data['BattSoC[kWh]'].iloc[-1],
+    }
+
+def run_scenario(conf, filename, end=24*60*60-1):
+    """
+        Simulate one household world for conf until end and return the
+        summary of its results (see summarize) with the wall time.
+    """
+    np.random.seed(conf['seed'])
+    t0 = timer.time()
+    # Let the OS pick the port of mosaik's server socket, so that several
+    # worlds can run at the same time
+    world = mosaik.World(SIM_CONFIG, mosaik_config={'addr': ('127.0.0.1', 0)})
+    init_household(world, conf, filename)
+    world.run(end)
+    wall_time = timer.time() - t0
+    with pd.HDFStore('{}_data.h5'.format(filename), mode='r') as store:
+        df = store['timeseries/simulation']
+    result = summarize(df)
+    result['wall_time_s'] = wall_time
+    return result
+
+def parameter_grid(grid):
+    """
+        List of the configurations for all combinations of the values in grid
+        (dict parameter -> list of values), other parameters from basic_conf.
+    """
+    unknown = set(grid) - set(basic_conf)
+    if unknown:
+        raise ValueError("Unknown parameters {0}.".format(sorted(unknown)))
+    ignored = [key for key in ('climate_conditions', 'random_weather') if key in grid]
+    if ignored and any(day is not None for day in grid.get('day', [])):
+        raise ValueError("The day overrides {0}, set only one of them.".format(' and '.join(ignored)))
+    keys = sorted(grid)
+    confs = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        conf = dict(basic_conf)
+        conf.update(zip(keys, values))
+        confs.append(conf)
+    return confs
+
+def _run(task):
+    # Worker function: a failed run is recorded in the summary instead of
+    # stopping the sweep
+    run, conf, filename, end = task
+    row = dict(conf, run=run, filename='{}_data.h5'.format(filename))
+    try:
+        row.update(run_scenario(conf, filename, end))
+        row['error'] = ''
+    except Exception as e:
+        row['error'] = '{0}: {1}'.format(type(e).__name__, e)
+    return row
+
+def sweep(grid, data_path='temp_files/sweep/', end=24*60*60-1, processes=None):
+    """
+        Simulate all configurations of the parameter grid in parallel.
+        @input:
+            grid: dict parameter -> list of values (see basic_conf)
+            data_path: directory of the result stores and the summary
+            end: simulation end time [s]
+            processes: number of worker processes (default: number of cores)
+        @return: summary DataFrame with one row per run, the column error
+            holds the exception of the failed runs ('' if the run succeeded)
+    """
+    confs = parameter_grid(grid)
+    # Fail before starting any run if their series are not available
+    check_series(confs)
+    if not os.path.exists(data_path):
+        os.makedirs(data_path)
+    tasks = [(run, conf, os.path.join(data_path, 'run_{0:04d}'.format(run)), end)
+             for run, conf in enumerate(confs)]
+
+    # One simulation per task, so chunks of one keep all cores busy
+    with multiprocessing.Pool(processes) as pool:
+        rows = []
+        for row in pool.imap_unordered(_run, tasks, chunksize=1):
+            print('Run {0} of {1} done{2}'.format(row['run'] + 1, len(tasks),
+                  ', failed: ' + row['error'] if row['error'] else ''))
+            rows.append(row)
+
+    summary = pd.DataFrame(rows).sort_values('run').set_index('run')
+    summary.to_csv(os.path.join(data_path, 'summary.csv'))
+    return summary
+
+
+if __name__ == '__main__':
+    # Battery sizing over seasons and controllers, on the PV day of the store
+    summary = sweep({
+        'day': ['/PV715_20180730'],
+        'season': ['summer', 'winter'],
+        'batt_storage_capacity': [5, 10, 20],
+        'controller_change_rate': [0.5, 0.9],
+        })
+    print(summary)
+    failed = (summary['error'] != '').sum()
+    if failed:
+        sys.exit('{0} of {1} runs failed, see the column error'.format(failed, len(summary)))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the scenario modules and dtu_mosaik from FP_mosaik
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
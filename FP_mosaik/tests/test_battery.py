@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from dtu_mosaik.util import MyBattSim
+from dtu_mosaik.my_batt_fleet import MyBattFleet
+
+# Small batteries, so that the setpoints run into the charge limits
+PARAMS = [
+    dict(rated_capacity=0.5, rated_discharge_capacity=3, rated_charge_capacity=2, initial_charge_rel=0.5),
+    dict(rated_capacity=1.0, rated_discharge_capacity=5, rated_charge_capacity=5, initial_charge_rel=0.1,
+         roundtrip_efficiency=0.9, charge_change_rate=0.5),
+    dict(rated_capacity=2.0, rated_discharge_capacity=1, rated_charge_capacity=4, initial_charge_rel=0.9,
+         charge_change_rate=1.0),
+]
+
+def setpoints(steps=720, seed=0):
+    # Setpoint of each battery per step, held for several steps
+    rng = np.random.RandomState(seed)
+    return np.repeat(rng.uniform(-6, 6, size=(steps // 12, len(PARAMS))), 12, axis=0)
+
+def run_batteries(solver, step_size=5):
+    batteries = [MyBattSim(solver=solver, **params) for params in PARAMS]
+    results = []
+    for n, Psets in enumerate(setpoints()):
+        for batt, Pset in zip(batteries, Psets):
+            batt.Pset = Pset
+            batt.calc_val((n + 1) * step_size)
+        results.append([(batt.P, batt.SoC) for batt in batteries])
+    return np.array(results)
+
+def run_fleet(solver, step_size=5):
+    fleet = MyBattFleet(solver)
+    for params in PARAMS:
+        fleet.add(1, **params)
+    results = []
+    for n, Psets in enumerate(setpoints()):
+        fleet.set_Pset(np.arange(len(PARAMS)), Psets)
+        fleet.calc_val((n + 1) * step_size)
+        results.append(np.stack((fleet.P, fleet.SoC), axis=1))
+    return np.array(results)
+
+def test_closed_form_follows_loop():
+    loop = run_batteries('loop')
+    assert np.allclose(run_batteries('closed'), loop, rtol=0, atol=1e-9)
+    # The setpoints reach both charge limits
+    assert loop[:, :, 1].min() < 1e-9 and (loop[:, :, 1] == [p['rated_capacity'] for p in PARAMS]).any()
+
+def test_fleet_equals_batteries_with_loop_solver():
+    assert np.array_equal(run_fleet('loop'), run_batteries('loop'))
+
+def test_fleet_follows_batteries_with_closed_solver():
+    assert np.allclose(run_fleet('closed'), run_batteries('closed'), rtol=0, atol=1e-9)
+
+def test_fleet_rejects_unknown_solver():
+    with pytest.raises(ValueError):
+        MyBattFleet('euler')
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from dtu_mosaik.util import MyBuildingSim
+from dtu_mosaik.my_building_fleet import MyBuildingFleet
+
+# The last building has no heat loss
+PARAMS = [
+    dict(),
+    dict(heat_coeff=8.0, solar_heat_coeff=3.0, insulation_coeff=0.5, init_T_int=18.0, heater_power=3.0),
+    dict(heat_coeff=15.0, insulation_coeff=2.0, init_T_int=25.0, init_T_amb=-5.0, dt=1.0/60),
+    dict(insulation_coeff=0.0, init_T_int=20.0),
+]
+
+def inputs(steps=200, seed=0):
+    # Step size, and T_amb, zs and x of each building per step
+    rng = np.random.RandomState(seed)
+    step_sizes = rng.choice([1, 5, 60, 900], size=steps)
+    T_amb = rng.uniform(-10, 30, size=(steps, len(PARAMS)))
+    zs = rng.uniform(0, 1, size=(steps, len(PARAMS)))
+    x = rng.uniform(0, 1, size=(steps, len(PARAMS)))
+    return zip(step_sizes.tolist(), T_amb, zs, x)
+
+def run_reference(substeps=1, steps=200):
+    # Explicit Euler update per time unit (in substeps), written out, with
+    # the parameters of MyBuildingSim so that it provides the defaults
+    models = [MyBuildingSim(**params) for params in PARAMS]
+    T_int = [m.init_T_int for m in models]
+    results = []
+    for step_size, T_amb, zs, x in inputs(steps):
+        for i, m in enumerate(models):
+            dt = m.dt / substeps
+            for _ in range(step_size * substeps):
+                T_int[i] += dt*(m.insulation_coeff*(T_amb[i] - T_int[i])
+                                + m.solar_heat_coeff*zs[i] + m.heat_coeff*x[i])
+        results.append(list(T_int))
+    return np.array(results)
+
+def run_buildings(solver, steps=200):
+    buildings = [MyBuildingSim(solver=solver, **params) for params in PARAMS]
+    results = []
+    t = 0
+    for step_size, T_amb, zs, x in inputs(steps):
+        t += step_size
+        for i, b in enumerate(buildings):
+            b.T_amb, b.zs, b.x = T_amb[i], zs[i], x[i]
+            b.calc_val(t)
+        results.append([b.T_int for b in buildings])
+    return np.array(results)
+
+def run_fleet(solver, steps=200):
+    fleet = MyBuildingFleet(solver)
+    for params in PARAMS:
+        fleet.add(1, **params)
+    idx = np.arange(len(PARAMS))
+    results = []
+    t = 0
+    for step_size, T_amb, zs, x in inputs(steps):
+        t += step_size
+        fleet.T_amb[:], fleet.zs[:] = T_amb, zs
+        fleet.set_x(idx, x)
+        fleet.calc_val(t)
+        results.append(fleet.T_int.copy())
+    return np.array(results)
+
+def test_euler_solver_follows_reference():
+    # Equal up to rounding, the x setter derives x again from P
+    assert np.allclose(run_buildings('euler'), run_reference(), rtol=0, atol=1e-9)
+
+def test_geometric_solver_follows_reference():
+    assert np.allclose(run_buildings('geometric'), run_reference(), rtol=0, atol=1e-9)
+
+def test_exponential_solver_is_limit_of_reference():
+    # The exact solution of the ODE: the Euler error shrinks with the substep
+    exact = run_buildings('exponential', steps=40)
+    coarse = np.abs(run_reference(1, steps=40) - exact).max()
+    fine = np.abs(run_reference(10, steps=40) - exact).max()
+    assert coarse > 1e-3 and fine < coarse / 5
+
+@pytest.mark.parametrize('solver', MyBuildingSim.SOLVERS)
+def test_fleet_follows_buildings(solver):
+    assert np.allclose(run_fleet(solver), run_buildings(solver), rtol=0, atol=1e-9)
+
+def test_fleet_add_broadcasts_parameters():
+    fleet = MyBuildingFleet()
+    assert list(fleet.add(2, heat_coeff=[1.0, 2.0])) == [0, 1]
+    assert list(fleet.add(1, init_T_int=18.0)) == [2]
+    assert fleet.heat_coeff.tolist() == [1.0, 2.0, 12.0]
+    assert fleet.T_int.tolist() == [22.0, 22.0, 18.0]
+
+def test_unknown_solver_is_rejected():
+    with pytest.raises(ValueError):
+        MyBuildingSim(solver='rk4')
+    with pytest.raises(ValueError):
+        MyBuildingFleet('rk4')
@@ -0,0 +1,103 @@
+import pytest
+import pandas as pd
+from dtu_mosaik.collector import Collector
+
+
+def collect(steps, **params):
+    collector = Collector()
+    collector.init('Collector-0', step_size=60, print_results=False, save_h5=False, **params)
+    collector.create(1, 'Collector')
+    for time, data in steps:
+        collector.step(time, {'Collector': data})
+    return collector
+
+def test_numbers_are_stored_as_float_and_other_values_unchanged():
+    steps = [(60*i, {
+        'P': {'pv': 0.5*i},
+        'state': {'lamp': 'on' if i % 2 else 'off'},
+        'count': {'coffee': i},
+        'heating': {'house': i > 1},
+    }) for i in range(3)]
+    # More rows than the initial buffer, so the object columns grow
+    frame = collect(steps, chunk_size=2).buffer.frame()
+
+    assert list(frame[('lamp', 'state')]) == ['off', 'on', 'off']
+    assert list(frame[('coffee', 'count')]) == [0.0, 1.0, 2.0]
+    assert frame[('coffee', 'count')].dtype == float
+    assert list(frame[('house', 'heating')]) == [0.0, 0.0, 1.0]
+    assert frame[('house', 'heating')].dtype == float
+    assert list(frame[('pv', 'P')]) == [0.0, 0.5, 1.0]
+    assert frame[('pv', 'P')].dtype == float
+    assert list(frame.index) == [0, 60, 120]
+
+def test_attribute_switching_to_non_float():
+    steps = [(0, {'x': {'a': 1.5}}), (60, {'x': {'a': 'error'}}), (120, {'y': {'a': 2.0}})]
+    frame = collect(steps).buffer.frame()
+    assert list(frame[('a', 'x')])[:2] == [1.5, 'error']
+    assert pd.isna(frame[('a', 'x')].iloc[2])
+
+def test_stream_chunks_with_mixed_numbers_and_growing_strings(tmp_path):
+    store = str(tmp_path / 'stream.h5')
+    steps = [(60*i, {
+        'P': {'pv': 0.5*i if i % 2 else i},
+        'count': {'coffee': i},
+        'heating': {'house': i > 2},
+        'state': {'lamp': 'x'*(i+1) if i != 3 else None},
+    }) for i in range(7)]
+    collector = collect(steps, stream=True, chunk_size=2, h5_storename=store, h5_framename='run')
+    collector.finalize()
+    frame = pd.read_hdf(store, 'run')
+
+    assert list(frame.index) == [60*i for i in range(7)]
+    assert list(frame[('pv', 'P')]) == [0.0, 0.5, 2.0, 1.5, 4.0, 2.5, 6.0]
+    assert list(frame[('coffee', 'count')]) == [float(i) for i in range(7)]
+    assert list(frame[('house', 'heating')]) == [0.0]*3 + [1.0]*4
+    states = list(frame[('lamp', 'state')])
+    assert states[:3] == ['x', 'xx', 'xxx'] and pd.isna(states[3]) and states[4:] == ['xxxxx', 'xxxxxx', 'xxxxxxx']
+
+def steps_of_day(n):
+    return [(60*i, {'P': {'pv': 0.1*i, 'load': -0.2*i}, 'SOC': {'batt': 0.5}}) for i in range(n)]
+
+def test_stream_equals_in_memory_result(tmp_path):
+    store = str(tmp_path / 'stream.h5')
+    steps = steps_of_day(10)
+    collector = collect(steps, stream=True, chunk_size=3, h5_storename=store, h5_framename='run')
+    collector.finalize()
+
+    expected = collect(steps).buffer.frame()
+    pd.testing.assert_frame_equal(pd.read_hdf(store, 'run'), expected)
+
+def test_stream_replaces_frame_of_earlier_run(tmp_path):
+    store = str(tmp_path / 'stream.h5')
+    for n in (10, 4):
+        collector = collect(steps_of_day(n), stream=True, chunk_size=3, h5_storename=store, h5_framename='run')
+        collector.finalize()
+
+    pd.testing.assert_frame_equal(pd.read_hdf(store, 'run'), collect(steps_of_day(4)).buffer.frame())
+
+def test_stream_partial_run_can_be_read(tmp_path):
+    # Without finalize, e.g. after a crash, the complete chunks are in the store
+    store = str(tmp_path / 'stream.h5')
+    collect(steps_of_day(8), stream=True, chunk_size=3, h5_storename=store, h5_framename='run')
+
+    expected = collect(steps_of_day(6)).buffer.frame()
+    pd.testing.assert_frame_equal(pd.read_hdf(store, 'run'), expected)
+
+def test_stream_rejects_strings_in_float_columns(tmp_path):
+    steps = [(0, {'x': {'a': 1.5}}), (60, {'x': {'a': 'error'}})]
+    with pytest.raises(ValueError):
+        collect(steps, stream=True, chunk_size=2, h5_storename=str(tmp_path / 'stream.h5'))
+
+def test_aggregation_integrates_last_window_to_end():
+    # 1 kW from t=0 to the end of the last step at t=1500 + 60: windows
+    # [0, 900) and [900, 1800), the last one is not finished
+    steps = [(t, {'P': {'pv': 1.0}}) for t in range(0, 1560, 60)]
+    collector = collect(steps, aggregate=['mean', 'energy'], window=900)
+    collector.finalize()
+    frame = collector.buffer.frame()
+
+    assert list(frame.index) == [0, 900]
+    assert list(frame[('pv', 'P_mean')]) == [1.0, 1.0]
+    energy = list(frame[('pv', 'P_energy')])
+    assert abs(energy[0] - 900/3600) < 1e-12
+    assert abs(energy[1] - 660/3600) < 1e-12
@@ -0,0 +1,50 @@
+import random
+import pytest
+
+pytest.importorskip('pyknow')
+
+import mosaik_pyknow_control_house
+from mosaik_pyknow_control_house import Control
+from rule_compiler import RuleCompileError
+
+ATTRS = ['Pset_heat', 'Pset_batt']
+
+
+def random_inputs(eids, rng):
+    # Inputs around the thresholds of the rules, each one missing at times
+    inputs = {}
+    for eid in eids:
+        data = {}
+        if rng.random() < 0.9:
+            data['T'] = {'house': rng.choice([18.0, 18.1, 18.1 + 1e-12, rng.uniform(16, 22)])}
+        if rng.random() < 0.9:
+            data['SOC'] = {'batt': rng.choice([0.1, 0.2, 0.9, rng.random()])}
+        if rng.random() < 0.9:
+            data['Pgrid'] = {'grid': rng.choice([0.0, rng.uniform(-3, 3)])}
+        inputs[eid] = data
+    return inputs
+
+@pytest.mark.parametrize('mode', ['compiled', 'batched'])
+def test_mode_makes_the_decisions_of_pyknow(mode):
+    ref, sim = Control(), Control()
+    ref.init('Control-0', mode='pyknow')
+    sim.init('Control-1', mode=mode)
+    assert sim.mode == mode
+    eids = [entity['eid'] for entity in ref.create(5, 'Control', T_min=18)]
+    sim.create(5, 'Control', T_min=18)
+    rng = random.Random(0)
+    for step in range(100):
+        inputs = random_inputs(eids, rng)
+        ref.step(5*step, inputs)
+        sim.step(5*step, inputs)
+        request = dict((eid, ATTRS) for eid in eids)
+        assert sim.get_data(request) == ref.get_data(request)
+
+def test_rules_which_do_not_compile_fall_back_to_pyknow(monkeypatch, caplog):
+    def compile_rules(engine_class, input_class):
+        raise RuleCompileError('test')
+    monkeypatch.setattr(mosaik_pyknow_control_house, 'compile_rules', compile_rules)
+    sim = Control()
+    sim.init('Control-0', mode='compiled')
+    assert sim.mode == 'pyknow'
+    assert 'using pyknow' in caplog.text
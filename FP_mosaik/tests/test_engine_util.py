@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip('pyknow')
+
+from engine_util import DecisionCache
+from mosaik_pyknow_control_house import Control
+
+
+def test_decision_is_reused_within_deadband_of_its_inputs():
+    cache = DecisionCache(['T', 'heating'], {'T': 0.1})
+    cache.put('a', {'T': 20.0, 'heating': False}, {'out': 1})
+
+    assert cache.get('a', {'T': 20.08, 'heating': False}) == {'out': 1}
+    # Within the deadband of the last input, but not of the one that gave the result
+    assert cache.get('a', {'T': 20.16, 'heating': False}) is None
+    assert cache.get('a', {'T': 20.0, 'heating': True}) is None
+    assert cache.get('b', {'T': 20.0, 'heating': False}) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_least_recently_used_entity_is_dropped():
+    cache = DecisionCache(['T'], size=2)
+    for eid in 'abc':
+        if eid == 'c':
+            assert cache.get('a', {'T': 1}) is not None
+        cache.put(eid, {'T': 1}, {'eid': eid})
+
+    assert cache.get('b', {'T': 1}) is None
+    assert cache.get('a', {'T': 1}) == {'eid': 'a'}
+    assert cache.get('c', {'T': 1}) == {'eid': 'c'}
+
+def test_exact_cache_gives_the_engine_decisions():
+    ref, cached = Control(), Control()
+    ref.init('Control-0', mode='pyknow')
+    cached.init('Control-1', mode='pyknow', deadband={})
+    for sim in (ref, cached):
+        sim.create(2, 'Control')
+    attrs = dict((eid, ['Pset_heat', 'Pset_batt']) for eid in ref.simulators)
+    for step, (T, SOC) in enumerate([(22, 0.5), (22, 0.5), (19.05, 0.5), (19.05, 0.95), (19.05, 0.95), (22, 0.5)]):
+        inputs = dict((eid, {'T': {'house': T}, 'SOC': {'batt': SOC}}) for eid in ref.simulators)
+        ref.step(5*step, inputs)
+        cached.step(5*step, inputs)
+        assert cached.get_data(attrs) == ref.get_data(attrs)
+    assert cached.cache.hits > 0
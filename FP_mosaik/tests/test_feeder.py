@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from dtu_mosaik.my_feeder import MyFeeder
+from dtu_mosaik.my_grid_sim import MyGridSim
+
+# Feeders as (V0, droop, parents): a line, a branched tree and a single bus
+FEEDERS = [
+    (230, 10.0, None),
+    (240, [2.0, 4.0, 1.0, 3.0, 5.0, 2.5], [-1, 0, 0, 1, 1, 3]),
+    (225, 7.0, [-1]),
+]
+
+def reference(P, V0, droop, parents):
+    # Walk the tree: the line of a bus carries the injections of its
+    # subtree, the voltage rises over the lines from the substation
+    n = len(P)
+    parents = np.arange(n) - 1 if parents is None else np.asarray(parents)
+    droop = np.broadcast_to(np.asarray(droop, dtype=float), (n,))
+    Pline = np.array(P, dtype=float)
+    for b in reversed(range(n)):
+        if parents[b] >= 0:
+            Pline[parents[b]] += Pline[b]
+    V = np.zeros(n)
+    for b in range(n):
+        V[b] = (V0 if parents[b] < 0 else V[parents[b]]) + droop[b] * Pline[b]
+    return Pline, V
+
+def test_feeders_follow_reference():
+    rng = np.random.RandomState(0)
+    feeder = MyFeeder()
+    buses = []
+    for V0, droop, parents in FEEDERS:
+        num = len(parents) if parents is not None else 5
+        buses.append(feeder.add(num, V0, droop, parents))
+    # Two values per bus, e.g. the PV and the load of a house
+    feeder.set_sources(np.repeat(np.arange(feeder.n), 2))
+
+    for t in range(1, 20):
+        values = rng.uniform(-5, 5, size=2 * feeder.n)
+        feeder.set_P(values)
+        feeder.calc_val(t)
+        P = values[0::2] + values[1::2]
+        assert np.allclose(feeder.P, P)
+        for (V0, droop, parents), idx in zip(FEEDERS, buses):
+            Pline, V = reference(P[idx.start:idx.stop], V0, droop, parents)
+            assert np.allclose(feeder.Pline[idx.start:idx.stop], Pline, rtol=0, atol=1e-9)
+            assert np.allclose(feeder.V[idx.start:idx.stop], V, rtol=0, atol=1e-9)
+
+def test_single_bus_equals_grid_sim():
+    feeder = MyFeeder()
+    feeder.add(1, V0=230, droop=10.0)
+    feeder.set_sources(np.zeros(3, dtype=int))
+    grid = MyGridSim(V0=230, droop=10.0)
+    for t, values in enumerate([[1.0, -2.0, 0.5], [-3.0, -1.0, 0.0], [0.0, 0.0, 0.0]], 1):
+        feeder.set_P(np.array(values))
+        feeder.calc_val(t)
+        grid.P = dict(enumerate(values))
+        grid.calc_val(t)
+        assert feeder.V[0] == pytest.approx(grid.V)
+        assert feeder.Pgrid[0] == pytest.approx(grid.Pgrid)
+
+def test_parent_must_be_an_earlier_bus():
+    with pytest.raises(ValueError):
+        MyFeeder().add(3, parents=[-1, 2, 0])
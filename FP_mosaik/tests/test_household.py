@@ -0,0 +1,26 @@
+import inspect
+import pytest
+import pandas as pd
+
+pytest.importorskip('pyknow')
+mosaik = pytest.importorskip('mosaik')
+
+import scenario_sweep
+
+pytestmark = pytest.mark.skipif(
+    'initial' not in inspect.signature(mosaik.World.connect).parameters,
+    reason="the scenario needs a mosaik version with the initial argument of World.connect")
+
+
+def collected(tmp_path, fused):
+    filename = str(tmp_path / ('fused' if fused else 'separate'))
+    conf = dict(scenario_sweep.basic_conf, day='/PV715_20180730', season='winter', fused=fused)
+    scenario_sweep.run_scenario(conf, filename, end=2*60*60)
+    df = pd.read_hdf('{}_data.h5'.format(filename), 'timeseries/simulation')
+    return df.T.groupby(level=1).sum().T # one column per collector attribute
+
+def test_fused_household_collects_the_same_data(tmp_path):
+    separate = collected(tmp_path, False)
+    fused = collected(tmp_path, True)
+    assert sorted(fused.columns) == sorted(separate.columns)
+    pd.testing.assert_frame_equal(fused[separate.columns], separate, check_exact=False, rtol=0, atol=1e-9)
@@ -0,0 +1,31 @@
+import gc
+
+import mosaik_api
+
+from dtu_mosaik import instrumentation
+
+
+class Sim(instrumentation.Instrumented, mosaik_api.Simulator):
+    def __init__(self):
+        super().__init__({'models': {}})
+
+    def step(self, time, inputs):
+        return time + 1
+
+
+def test_reports_in_creation_order_and_finished_simulators_are_released(monkeypatch):
+    # Restore the settings of enable() afterwards
+    monkeypatch.setattr(instrumentation, '_settings', instrumentation._settings)
+    instrumentation.enable(print_report=False)
+    sims = [Sim() for _ in range(3)]
+    for i, sim in enumerate(sims):
+        sim.init('Sim-{0}'.format(i))
+    sims[0].step(0, {'a': {'x': {'src': 1}}})
+
+    reports = instrumentation.reports()
+    assert [r['sid'] for r in reports] == ['Sim-0', 'Sim-1', 'Sim-2']
+    assert reports[0]['steps'] == 1 and reports[0]['fanin_max'] == 1
+
+    del sims[1:], sim
+    gc.collect()
+    assert [r['sid'] for r in instrumentation.reports()] == ['Sim-0']
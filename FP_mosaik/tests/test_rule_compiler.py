@@ -0,0 +1,31 @@
+import random
+import pytest
+
+pytest.importorskip('pyknow')
+
+from rule_compiler import compile_rules, differential_test
+from mosaik_pyknow_control_house import Control, Input
+
+BASE_INPUT = {
+    'Pset_heat': 3.3, 'Pset_batt': 3.3, 'newPset_batt': 0, 'Pgrid': -10, 'rate': 0.5,
+    'T': 22, 'T_min': 18, 'T_max': 24, 'P_max': 5, 'heating': False, 'SOC': 0.5,
+    'P_disc_batt': 5, 'P_char_batt': 5,
+}
+
+
+def test_compiled_rules_declare_what_the_engine_declares():
+    # Inputs around the thresholds of the rules
+    rng = random.Random(0)
+    inputs = []
+    for _ in range(300):
+        inp = dict(BASE_INPUT)
+        inp.update(
+            T=rng.choice([17.9, 18, 18.1, 18.2, 22, 24.5]),
+            heating=rng.choice([True, False]),
+            SOC=rng.choice([0.05, 0.1, 0.15, 0.2, 0.5, 0.9, 0.95]),
+            Pgrid=rng.choice([-1, 0, 1]),
+            Pset_heat=rng.uniform(0, 5))
+        inputs.append(inp)
+    decide = compile_rules(Control.ControlEngine, Input)
+    mismatches = differential_test(Control.ControlEngine, Input, decide, inputs, lambda: {'returnv': {}})
+    assert mismatches == []
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import pandas as pd
+import os
+from dtu_mosaik import signal_pack
+from dtu_mosaik.signal_pack import write_packed, PackedStore, PackedTSSim
+from dtu_mosaik.util import TSSim
+from dtu_mosaik.mosaik_pv import PVModel
+
+
+def test_phased_entities_decode_each_chunk_once(tmp_path):
+    # 8 entities with different phases read different chunks at every step,
+    # more than the 4 chunks kept by the signal
+    values = np.arange(1000) * 0.5
+    path = str(tmp_path / 'x.sigpack')
+    write_packed(path, {'x': pd.Series(values, index=np.arange(1000))}, quantum=0.5, chunk_len=100)
+    with PackedStore(path) as store:
+        signal = store['x']
+        phases = [0, 130, 260, 390, 520, 650, 780, 910]
+        esims = [PackedTSSim(1.0, signal, phase=phase) for phase in phases]
+        for t in range(1000):
+            for phase, esim in zip(phases, esims):
+                esim.calc_val(t)
+                assert esim.get_val() == values[(t - phase) % 1000]
+        # Every entity passes through the 10 chunks once, plus one more for
+        # the chunk it starts in when its phase is not on a chunk boundary
+        assert signal.decodes <= len(esims) * 11
+
+@pytest.mark.parametrize('interpolate', [False, True])
+def test_packed_entities_equal_tssim(tmp_path, interpolate):
+    values = np.sin(np.arange(500) / 7.0)
+    series = pd.Series(values, index=np.arange(500))
+    path = str(tmp_path / 'x.sigpack')
+    write_packed(path, {'x': series}, quantum=None, chunk_len=64)
+    with PackedStore(path) as store:
+        for phase in (0, 100):
+            packed = PackedTSSim(2.0, store['x'], Pmax=1.5, phase=phase, interpolate=interpolate)
+            plain = TSSim(2.0, series, Pmax=1.5, phase=phase, interpolate=interpolate)
+            for t in (0, 63, 64, 200.5, 498):
+                packed.calc_val(t)
+                plain.calc_val(t)
+                assert packed.get_val() == plain.get_val()
+            assert np.array_equal(packed.get_range(10, 300, 7), plain.get_range(10, 300, 7))
+
+def test_simulator_closes_packed_file_at_finalize(tmp_path):
+    path = str(tmp_path / 'pv.sigpack')
+    write_packed(path, {'/pv': pd.Series(np.ones(100), index=np.arange(100))})
+    sims = [PVModel(), PVModel()]
+    for n, sim in enumerate(sims):
+        sim.init('PVModel-{0}'.format(n), storefilename=path)
+        sim.create(2, 'PVModel', series_name='/pv')
+        sim.step(0, {})
+    store = signal_pack._stores[os.path.abspath(path)][0]
+    sims[0].finalize()
+    assert not store._f.closed
+    sims[1].finalize()
+    assert store._f.closed
+    assert os.path.abspath(path) not in signal_pack._stores
@@ -0,0 +1,58 @@
+import importlib
+import pytest
+from dtu_mosaik.table_simulator import TableSimulator
+
+MODULES = [
+    'dtu_mosaik.clockSim', 'dtu_mosaik.coffeeSim', 'dtu_mosaik.LampSim',
+    'dtu_mosaik.mosaik_battery', 'dtu_mosaik.mosaik_building', 'dtu_mosaik.mosaik_feeder',
+    'dtu_mosaik.mosaik_grid', 'dtu_mosaik.mosaik_pv', 'mosaik_pyknow_control_house', 'mosaik_household',
+]
+
+# Parameters of create() without a default in the signal store
+CREATE_PARAMS = {
+    'PVModel': {'series_name': '/PV715_20180730'},
+}
+
+def table_simulators():
+    for name in MODULES:
+        try:
+            module = importlib.import_module(name)
+        except ImportError as e:
+            # The controller needs the rule engine (pyknow)
+            yield pytest.param(None, marks=pytest.mark.skip(reason=str(e)), id=name)
+            continue
+        for cls in vars(module).values():
+            if isinstance(cls, type) and issubclass(cls, TableSimulator) and cls.__module__ == name:
+                yield pytest.param(cls, id=cls.__name__)
+
+@pytest.mark.parametrize('cls', list(table_simulators()))
+def test_get_data_serves_every_meta_attr(cls):
+    sim = cls()
+    meta = sim.init('{0}-0'.format(cls.__name__))
+    for model, model_meta in meta['models'].items():
+        eid = sim.create(1, model, **CREATE_PARAMS.get(cls.__name__, {}))[0]['eid']
+        sim.step(0, {})
+        attrs = model_meta['attrs']
+        data = sim.get_data({eid: attrs})
+        assert sorted(data[eid]) == sorted(attrs)
+
+@pytest.mark.parametrize('cls', list(table_simulators()))
+def test_get_data_serves_every_getter(cls):
+    # Also the attributes which are not in META, e.g. Prated of PVModel
+    sim = cls()
+    meta = sim.init('{0}-0'.format(cls.__name__))
+    model = next(iter(meta['models']))
+    eid = sim.create(1, model, **CREATE_PARAMS.get(cls.__name__, {}))[0]['eid']
+    sim.step(0, {})
+    data = sim.get_data({eid: list(cls.GETTERS)})
+    assert sorted(data[eid]) == sorted(cls.GETTERS)
+
+@pytest.mark.parametrize('fleet', [False, True])
+def test_entities_without_requests_get_empty_data(fleet):
+    from dtu_mosaik.mosaik_battery import BatteryModel
+    sim = BatteryModel()
+    sim.init('BatteryModel-0', fleet=fleet)
+    eids = [entity['eid'] for entity in sim.create(3, 'BatteryModel')]
+    sim.step(0, {})
+    data = sim.get_data({eids[0]: ['P'], eids[1]: []})
+    assert data == {eids[0]: {'P': 0.0}, eids[1]: {}, eids[2]: {}}